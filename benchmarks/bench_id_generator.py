@@ -0,0 +1,46 @@
+"""Micro-benchmark of span creation rate per ID generator mode.
+
+Measures raw ID generation and full span start/end (dropped by a no-op processor)
+for each mode in `iudex.config.ID_GENERATORS`.
+
+    python -m benchmarks.bench_id_generator [--spans N]
+"""
+import argparse
+import timeit
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.id_generator import RandomIdGenerator
+
+from benchmarks.common import DropProcessor
+from iudex.config import ID_GENERATORS
+
+
+def _rate(fn, spans: int) -> float:
+    seconds = min(timeit.repeat(fn, number=spans, repeat=5))
+    return spans / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spans", type=int, default=100_000)
+    spans = parser.parse_args().spans
+
+    generators = {**ID_GENERATORS, "otel-random": RandomIdGenerator}
+    print(f"{'mode':<12} {'span ids/s':>14} {'trace ids/s':>14} {'spans/s':>12}")
+    for mode, generator_class in generators.items():
+        generator = generator_class()
+        provider = TracerProvider(id_generator=generator)
+        provider.add_span_processor(DropProcessor())
+        tracer = provider.get_tracer(__name__)
+
+        def create_span():
+            tracer.start_span("bench").end()
+
+        span_ids = _rate(generator.generate_span_id, spans)
+        trace_ids = _rate(generator.generate_trace_id, spans)
+        span_rate = _rate(create_span, spans)
+        print(f"{mode:<12} {span_ids:>14,.0f} {trace_ids:>14,.0f} {span_rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Micro-benchmark of the OpenAI wrappers' per-call and per-chunk overhead.
+
+Runs a local fake OpenAI server, then times chat completions, plain and streamed,
+before and after instrumenting the client. Spans are recorded then dropped by a
+no-op processor, so export cost is not measured.
+
+    python -m benchmarks.bench_openai [--calls N] [--chunks N]
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import TracerProvider
+
+from benchmarks.common import DropProcessor
+from iudex.openai import OpenAIInstrumentor
+
+
+def _completion() -> dict:
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "Hello!"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7},
+    }
+
+
+def _chunk(delta: dict, finish_reason=None) -> bytes:
+    chunk = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return b"data: " + json.dumps(chunk).encode() + b"\n\n"
+
+
+def _make_handler(chunks: int):
+    # the stream body is prebuilt so the server costs the same before and after instrumenting
+    stream_body = b"".join(
+        [_chunk({"role": "assistant"})]
+        + [_chunk({"content": f"token{i} "}) for i in range(chunks)]
+        + [_chunk({}, "stop"), b"data: [DONE]\n\n"]
+    )
+    completion_body = json.dumps(_completion()).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            stream = request.get("stream")
+            body = stream_body if stream else completion_body
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream" if stream else "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _bench(calls: int, fn) -> float:
+    fn()  # warm up connections and lazy imports
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(args.chunks))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = openai.OpenAI(base_url=f"http://127.0.0.1:{server.server_port}/v1", api_key="bench")
+    messages = [{"role": "user", "content": "Say hello"}]
+
+    def call():
+        client.chat.completions.create(model="gpt-4o", messages=messages)
+
+    def stream():
+        for _ in client.chat.completions.create(model="gpt-4o", messages=messages, stream=True):
+            pass
+
+    results = {}
+    for label in ("plain", "instrumented"):
+        if label == "instrumented":
+            provider = TracerProvider()
+            provider.add_span_processor(DropProcessor())
+            otel_trace.set_tracer_provider(provider)
+            OpenAIInstrumentor().instrument()
+        results[label] = (_bench(args.calls, call), _bench(max(args.calls // 10, 1), stream))
+
+    server.shutdown()
+
+    (plain_call, plain_stream), (traced_call, traced_stream) = results["plain"], results["instrumented"]
+    stream_chunks = args.chunks + 2
+    print(f"{'':<14} {'plain':>12} {'instrumented':>14} {'overhead':>12}")
+    print(
+        f"{'per call':<14} {plain_call * 1e6:>10.0f}us {traced_call * 1e6:>12.0f}us"
+        f" {(traced_call - plain_call) * 1e6:>10.0f}us"
+    )
+    print(
+        f"{'per chunk':<14} {plain_stream / stream_chunks * 1e6:>10.2f}us"
+        f" {traced_stream / stream_chunks * 1e6:>12.2f}us"
+        f" {(traced_stream - plain_stream) / stream_chunks * 1e6:>10.2f}us"
+    )
+
+
+if __name__ == "__main__":
+    main()
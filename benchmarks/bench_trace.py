@@ -0,0 +1,74 @@
+"""Micro-benchmark of per-call `@trace` overhead.
+
+Compares an undecorated call against traced calls when spans are sampled
+(recorded, then dropped by a no-op processor) and when they are sampled out.
+
+    python -m benchmarks.bench_trace [--calls N]
+"""
+import argparse
+import timeit
+
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.sampling import Decision, Sampler, SamplingResult
+
+from benchmarks.common import DropProcessor
+from iudex.trace import trace
+
+
+class _ToggleSampler(Sampler):
+    def __init__(self):
+        self.sampled = True
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        decision = Decision.RECORD_AND_SAMPLE if self.sampled else Decision.DROP
+        return SamplingResult(decision, attributes)
+
+    def get_description(self):
+        return "ToggleSampler"
+
+
+def _target(a, b, payload=None):
+    return a
+
+
+traced = trace(_target)
+
+
+def _bench(label: str, fn, calls: int, baseline: float = None) -> float:
+    seconds = min(timeit.repeat(fn, number=calls, repeat=5))
+    per_call_ns = seconds / calls * 1e9
+    overhead = f" (+{per_call_ns - baseline:.0f} ns)" if baseline is not None else ""
+    print(f"{label:<12} {per_call_ns:>10.0f} ns/call{overhead}")
+    return per_call_ns
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100_000)
+    calls = parser.parse_args().calls
+
+    sampler = _ToggleSampler()
+    provider = TracerProvider(sampler=sampler)
+    provider.add_span_processor(DropProcessor())
+    otel_trace.set_tracer_provider(provider)
+
+    payload = {"rows": list(range(1000))}
+
+    def call_plain():
+        _target(1, "x", payload=payload)
+
+    def call_traced():
+        traced(1, "x", payload=payload)
+
+    baseline = _bench("plain", call_plain, calls)
+
+    sampler.sampled = False
+    _bench("unsampled", call_traced, calls, baseline)
+
+    sampler.sampled = True
+    _bench("sampled", call_traced, calls, baseline)
+
+
+if __name__ == "__main__":
+    main()
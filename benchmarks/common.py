@@ -0,0 +1,6 @@
+"""Helpers shared by the benchmarks."""
+from opentelemetry.sdk.trace import SpanProcessor
+
+
+class DropProcessor(SpanProcessor):
+    """Keeps export cost out of the measurement."""
@@ -9,7 +9,26 @@ monkeypatch_clean_attribute()
 from .config import IudexConfig, configure_logger
 from .instrumentation import instrument
 from .fastapi import instrument_fastapi
-from .trace import trace, trace_lambda, start_trace, end_trace
+from .trace import (
+  SpanHandle,
+  enable_span_leak_detector,
+  end_trace,
+  start_trace,
+  trace,
+  trace_iter,
+  trace_lambda,
+)
+from .summarizers import register_summarizer
+from .loop_monitor import monitor_event_loop
+from .concurrency import (
+  TimedSemaphore,
+  TracedProcessPoolExecutor,
+  TracedThreadPoolExecutor,
+  inject_context,
+  attached_context,
+  traced_pool,
+  with_context,
+)
 
 __all__ = [
   "IudexConfig",
@@ -17,7 +36,19 @@ __all__ = [
   "instrument",
   "instrument_fastapi",
   "trace",
+  "trace_iter",
   "trace_lambda",
   "start_trace",
   "end_trace",
+  "SpanHandle",
+  "enable_span_leak_detector",
+  "register_summarizer",
+  "inject_context",
+  "attached_context",
+  "with_context",
+  "TracedThreadPoolExecutor",
+  "TracedProcessPoolExecutor",
+  "traced_pool",
+  "TimedSemaphore",
+  "monitor_event_loop",
 ]
@@ -1,110 +1,346 @@
-import json
-import re
-from typing import Any, Dict, Union
 import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
 
-from opentelemetry.trace import Span
+from opentelemetry.metrics import get_meter
+from opentelemetry.trace import Span, get_current_span
+from wrapt import wrap_function_wrapper
 
-logger = logging.getLogger(__name__)
+from .body import set_request_body_attributes, set_response_body_attributes
+from .histogram import LATENCY_BOUNDS, SIZE_BOUNDS, FixedBucketHistogram
+from .loop_monitor import monitor_event_loop
 
-def process_body(
-    message: Dict[str, Any],
-    # TODO: configurable
-    max_keys: int = 32,
-    max_depth: int = 4,
-    max_value_bytes: int = 1024,
-) -> Dict[str, Any]:
-    def process_value(value: Any, current_depth: int) -> Union[str, Dict, list]:
-        if isinstance(value, (str, int, float, bool)) or value is None:
-            return truncate_value(str(value), max_value_bytes)
-        elif isinstance(value, dict):
-            return process_dict(value, current_depth + 1)
-        elif isinstance(value, list):
-            return [process_value(item, current_depth + 1) for item in value[:max_keys]]
-        else:
-            return truncate_value(str(value), max_value_bytes)
-
-    def process_dict(d: Dict[str, Any], current_depth: int) -> Dict[str, Any]:
-        result = {}
-        for i, (key, value) in enumerate(d.items()):
-            if i >= max_keys:
-                result["..."] = f"exceeded max_keys of {max_keys}"
-                break
-            if current_depth >= max_depth:
-                result[key] = truncate_value(str(value), max_value_bytes)
-            else:
-                result[key] = process_value(value, current_depth)
-        return result
-
-    def truncate_value(value: str, max_bytes: int) -> str:
-        encoded = value.encode("utf-8")
-        if len(encoded) > max_bytes:
-            truncated = encoded[:max_bytes].decode("utf-8", errors="ignore")
-            return f"{truncated}... (max_value_bytes of {max_bytes} exceeded)"
-        return value
-
-    body = message.get("body", b"")
+logger = logging.getLogger(__name__)
 
-    try:
-        body_content = json.loads(body.decode("utf-8"))
-        return process_dict(body_content, 0)
-    except json.JSONDecodeError:
-        return {"body": truncate_value(body.decode("utf-8", errors="replace"), max_value_bytes)}
-    except Exception as e:
-        logger.warning(f"[IUDEX] could not process request body: {e}")
-        return {}
-
-def extract_file_info(scope: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, Any]:
-    file_info = {}
-
-    headers = dict(scope.get('headers', []))
-    content_length = headers.get(b'content-length')
-    if content_length:
-        file_info['size'] = int(content_length.decode('utf-8'))
-
-    body = message.get('body', b'')
-    content_disp_match = re.search(b'filename="([^"]+)"', body[:1024])
-    if content_disp_match:
-        file_info['name'] = content_disp_match.group(1).decode('utf-8')
-
-    return file_info
-
-def flatten_dict(d: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
-    items = []
-    for k, v in d.items():
-        new_key = f"{prefix}.{k}" if prefix else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key).items())
-        elif isinstance(v, (str, int, float, bool)) or v is None:
-            items.append((new_key, v))
-        else:
-            items.append((new_key, json.dumps(v)))
-    return dict(items)
 
 def client_request_hook(span: Span, scope: Dict[str, Any], message: Dict[str, Any]):
     if span and span.is_recording():
         headers = dict(scope.get('headers', []))
         content_type = headers.get(b'content-type', b'').decode('utf-8')
+        content_length = headers.get(b'content-length')
+        if content_length:
+            content_length = int(content_length.decode('utf-8'))
 
-        if 'multipart/form-data' in content_type:
-            file_info = extract_file_info(scope, message)
-            if 'name' in file_info:
-                span.set_attribute("http.request.file.name", file_info['name'])
-            if 'size' in file_info:
-                span.set_attribute("http.request.file.size", file_info['size'])
-            # NOTE: semconv https://opentelemetry.io/docs/specs/semconv/attributes-registry/http/#:~:text=3495-,http.request.header.%3Ckey%3E,-string%5B%5D
-            # don't directly use content_type since it includes boundary
-            span.set_attribute("http.request.header.content-type", ['multipart/form-data'])
-        else:
-            processed_body = process_body(message)
-            flattened_attrs = flatten_dict(processed_body, "http.request.body")
-            for key, value in flattened_attrs.items():
-                span.set_attribute(key, value)
-            span.set_attribute("http.request.header.content-type", [content_type])
+        set_request_body_attributes(
+            span, message.get("body", b""), content_type, content_length or None
+        )
 
 def client_response_hook(span: Span, scope: Dict[str, Any], message: Dict[str, Any]):
     if span and span.is_recording():
-        processed_body = process_body(message)
-        flattened_attrs = flatten_dict(processed_body, "http.response.body")
-        for key, value in flattened_attrs.items():
-            span.set_attribute(key, value)
+        set_response_body_attributes(span, message.get("body", b""))
+
+
+_phase_timer: ContextVar[Optional["PhaseTimer"]] = ContextVar("iudex_phase_timer", default=None)
+
+class PhaseTimer:
+    """Timestamps (perf_counter seconds) of the phases of a single ASGI http request."""
+
+    __slots__ = (
+        "start",
+        "receive_end",
+        "handler_start",
+        "handler_end",
+        "response_start",
+        "response_end",
+        "span",
+    )
+
+    def __init__(self, start: float, span: Optional[Span] = None):
+        self.start = start
+        self.receive_end: Optional[float] = None
+        self.handler_start: Optional[float] = None
+        self.handler_end: Optional[float] = None
+        self.response_start: Optional[float] = None
+        self.response_end: Optional[float] = None
+        self.span = span
+
+    def durations(self) -> Dict[str, float]:
+        """Phase durations in seconds, skipping phases that were never observed."""
+        durations = {}
+        handler_start = self.handler_start or self.receive_end or self.start
+        if self.receive_end is not None:
+            durations["receive"] = self.receive_end - self.start
+        if self.handler_end is not None:
+            durations["handler"] = self.handler_end - handler_start
+            if self.response_start is not None:
+                durations["serialize"] = self.response_start - self.handler_end
+        elif self.response_start is not None:
+            # no endpoint hook (e.g. plain starlette route), so handler includes serialization
+            durations["handler"] = self.response_start - handler_start
+        if self.response_start is not None and self.response_end is not None:
+            durations["send"] = self.response_end - self.response_start
+        if self.response_end is not None:
+            durations["total"] = self.response_end - self.start
+        return durations
+
+
+def server_timing_header(durations: Dict[str, float]) -> bytes:
+    return ", ".join(
+        f"{phase};dur={duration * 1000:.3f}" for phase, duration in durations.items()
+    ).encode("latin-1")
+
+
+class PhaseTimingMiddleware:
+    """ASGI middleware that breaks http request latency into receive/handler/serialize/send.
+
+    Phases are recorded as span attributes and a `http.server.phase.duration` histogram.
+    Handler boundaries come from `instrument_endpoint_timing`, which wraps FastAPI's endpoint runner.
+
+    Args:
+        app: ASGI app to wrap.
+        server_timing: Whether to add a `Server-Timing` header with the phases known at response start.
+        meter_provider: Optional meter provider, defaults to the global one.
+    """
+
+    def __init__(self, app, server_timing: bool = False, meter_provider=None):
+        self.app = app
+        self.server_timing = server_timing
+        meter = get_meter(__name__, meter_provider=meter_provider)
+        self._phase_histogram = meter.create_histogram(
+            name="http.server.phase.duration",
+            unit="s",
+            description="Duration of each phase of an http server request",
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timer = PhaseTimer(time.perf_counter(), get_current_span())
+        token = _phase_timer.set(timer)
+
+        async def timed_receive():
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                timer.receive_end = time.perf_counter()
+            return message
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start" and timer.response_start is None:
+                timer.response_start = time.perf_counter()
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(timer.durations())))
+                    message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                timer.response_end = time.perf_counter()
+                self._record(scope, timer)
+
+        try:
+            await self.app(scope, timed_receive, timed_send)
+        finally:
+            _phase_timer.reset(token)
+
+    def _record(self, scope, timer: PhaseTimer):
+        durations = timer.durations()
+        attributes = {"http.request.method": scope.get("method", "")}
+        route = scope.get("route")
+        if route is not None and getattr(route, "path", None):
+            attributes["http.route"] = route.path
+        for phase, duration in durations.items():
+            self._phase_histogram.record(
+                duration, attributes={**attributes, "http.server.phase": phase}
+            )
+
+        span = timer.span
+        if span and span.is_recording():
+            for phase, duration in durations.items():
+                span.set_attribute(f"http.server.phase.{phase}.duration_ms", duration * 1000)
+
+
+async def _timed_run_endpoint_function(wrapped, instance, args, kwargs):
+    timer = _phase_timer.get()
+    if timer is None:
+        return await wrapped(*args, **kwargs)
+
+    timer.handler_start = time.perf_counter()
+    # the server span is current here, unlike in an outer middleware
+    span = get_current_span()
+    if span.is_recording():
+        timer.span = span
+    try:
+        return await wrapped(*args, **kwargs)
+    finally:
+        timer.handler_end = time.perf_counter()
+
+
+_endpoint_timing_instrumented = False
+
+
+def instrument_endpoint_timing():
+    """Wraps FastAPI's endpoint runner so handler start/end are visible to `PhaseTimingMiddleware`."""
+    global _endpoint_timing_instrumented
+    if _endpoint_timing_instrumented:
+        return
+    try:
+        wrap_function_wrapper(
+            "fastapi.routing", "run_endpoint_function", _timed_run_endpoint_function
+        )
+        _endpoint_timing_instrumented = True
+    except (ImportError, AttributeError) as e:
+        logger.debug(f"Skipping FastAPI endpoint timing: {e}")
+
+
+def _websocket_message_size(message: Dict[str, Any]) -> int:
+    data = message.get("bytes")
+    if data is not None:
+        return len(data)
+    text = message.get("text")
+    if text is not None:
+        return len(text.encode("utf-8"))
+    return 0
+
+
+class WebSocketSession:
+    """In-process aggregate of one websocket session, flushed to a single span."""
+
+    __slots__ = (
+        "span",
+        "start",
+        "last_message",
+        "last_snapshot",
+        "messages_received",
+        "messages_sent",
+        "bytes_received",
+        "bytes_sent",
+        "received_size",
+        "sent_size",
+        "inter_message_latency",
+    )
+
+    def __init__(self, start: float):
+        self.span: Optional[Span] = None
+        self.start = start
+        self.last_message: Optional[float] = None
+        self.last_snapshot = start
+        self.messages_received = 0
+        self.messages_sent = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.received_size = FixedBucketHistogram(SIZE_BOUNDS)
+        self.sent_size = FixedBucketHistogram(SIZE_BOUNDS)
+        self.inter_message_latency = FixedBucketHistogram(LATENCY_BOUNDS)
+
+    def record(self, message: Dict[str, Any], sent: bool, now: float):
+        size = _websocket_message_size(message)
+        if sent:
+            self.messages_sent += 1
+            self.bytes_sent += size
+            self.sent_size.record(size)
+        else:
+            self.messages_received += 1
+            self.bytes_received += size
+            self.received_size.record(size)
+        if self.last_message is not None:
+            self.inter_message_latency.record(now - self.last_message)
+        self.last_message = now
+
+    def attributes(self, now: float) -> Dict[str, Any]:
+        return {
+            "websocket.session.duration_ms": (now - self.start) * 1000,
+            "websocket.messages.received": self.messages_received,
+            "websocket.messages.sent": self.messages_sent,
+            "websocket.bytes.received": self.bytes_received,
+            "websocket.bytes.sent": self.bytes_sent,
+            **self.received_size.to_attributes("websocket.message.received.size"),
+            **self.sent_size.to_attributes("websocket.message.sent.size"),
+            **self.inter_message_latency.to_attributes("websocket.message.interval"),
+        }
+
+
+class WebSocketSessionMiddleware:
+    """ASGI middleware that aggregates websocket traffic onto the session's server span.
+
+    Instead of a span per message, it counts messages and bytes in each direction and keeps
+    message size and inter-message latency histograms in-process. Long-lived sessions also
+    get a `websocket.snapshot` span event every `snapshot_interval` seconds, checked as
+    messages flow so idle sessions cost nothing.
+
+    It must run inside the OTel ASGI middleware, so the server span is current when the
+    session starts; `instrument_fastapi(websocket_sessions=True)` adds it that way, and
+    passes `exclude_spans=["receive", "send"]` to the ASGI instrumentor so per-message
+    spans aren't created as well.
+
+    Args:
+        app: ASGI app to wrap.
+        snapshot_interval: Seconds between snapshot events, 0 to disable.
+    """
+
+    def __init__(self, app, snapshot_interval: float = 60):
+        self.app = app
+        self.snapshot_interval = snapshot_interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            return await self.app(scope, receive, send)
+
+        session = WebSocketSession(time.monotonic())
+        # the server span, captured once, per-message spans are only ever current inside receive/send
+        session.span = get_current_span()
+        flushed = False
+
+        def flush():
+            nonlocal flushed
+            span = session.span
+            if not flushed and span.is_recording():
+                span.set_attributes(session.attributes(time.monotonic()))
+                flushed = True
+
+        def on_message(message: Dict[str, Any], sent: bool):
+            message_type = message["type"]
+            if message_type in ("websocket.disconnect", "websocket.close"):
+                # flush while the app is still running, an outer instrumentor ends the span on return
+                flush()
+                return
+            if message_type not in ("websocket.receive", "websocket.send"):
+                return
+            now = time.monotonic()
+            session.record(message, sent, now)
+            if (
+                self.snapshot_interval
+                and now - session.last_snapshot >= self.snapshot_interval
+                and session.span.is_recording()
+            ):
+                session.last_snapshot = now
+                session.span.add_event("websocket.snapshot", attributes=session.attributes(now))
+
+        async def counted_receive():
+            message = await receive()
+            on_message(message, False)
+            return message
+
+        async def counted_send(message):
+            on_message(message, True)
+            await send(message)
+
+        try:
+            await self.app(scope, counted_receive, counted_send)
+        finally:
+            flush()
+
+
+class LoopLagMiddleware:
+    """ASGI middleware that starts a `LoopLagMonitor` on the server's event loop.
+
+    Started on the first lifespan or request event, since that's the first time
+    the server's loop is guaranteed to be running.
+
+    Args:
+        app: ASGI app to wrap.
+        threshold: Lag in seconds that counts as the loop being blocked.
+        interval: Seconds between heartbeats.
+    """
+
+    def __init__(self, app, threshold: float = 0.1, interval: float = 0.25):
+        self.app = app
+        self.threshold = threshold
+        self.interval = interval
+        self._started = False
+
+    async def __call__(self, scope, receive, send):
+        if not self._started:
+            self._started = True
+            monitor_event_loop(interval=self.interval, threshold=self.threshold)
+        return await self.app(scope, receive, send)
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Optional, Union
+
+from opentelemetry.trace import Span
+
+logger = logging.getLogger(__name__)
+
+# TODO: configurable through IudexConfig
+DEFAULT_MAX_KEYS = 32
+DEFAULT_MAX_DEPTH = 4
+DEFAULT_MAX_VALUE_BYTES = 1024
+# upper bound on body bytes buffered per request/response for summarization
+DEFAULT_MAX_BODY_BYTES = int(os.getenv("IUDEX_MAX_BODY_BYTES", 64 * 1024))
+
+
+def truncate_value(value: str, max_bytes: int = DEFAULT_MAX_VALUE_BYTES) -> str:
+    encoded = value.encode("utf-8")
+    if len(encoded) > max_bytes:
+        truncated = encoded[:max_bytes].decode("utf-8", errors="ignore")
+        return f"{truncated}... (max_value_bytes of {max_bytes} exceeded)"
+    return value
+
+
+def process_value(
+    value: Any,
+    current_depth: int = 0,
+    max_keys: int = DEFAULT_MAX_KEYS,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_value_bytes: int = DEFAULT_MAX_VALUE_BYTES,
+) -> Union[str, Dict, list]:
+    """Bounds an already-parsed payload (e.g. JSON) by keys, depth and value size."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return truncate_value(str(value), max_value_bytes)
+    elif isinstance(value, dict):
+        return process_dict(value, current_depth + 1, max_keys, max_depth, max_value_bytes)
+    elif isinstance(value, list):
+        return [
+            process_value(item, current_depth + 1, max_keys, max_depth, max_value_bytes)
+            for item in value[:max_keys]
+        ]
+    else:
+        return truncate_value(str(value), max_value_bytes)
+
+
+def process_dict(
+    d: Dict[str, Any],
+    current_depth: int = 0,
+    max_keys: int = DEFAULT_MAX_KEYS,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_value_bytes: int = DEFAULT_MAX_VALUE_BYTES,
+) -> Dict[str, Any]:
+    result = {}
+    for i, (key, value) in enumerate(d.items()):
+        if i >= max_keys:
+            result["..."] = f"exceeded max_keys of {max_keys}"
+            break
+        if current_depth >= max_depth:
+            result[key] = truncate_value(str(value), max_value_bytes)
+        else:
+            result[key] = process_value(value, current_depth, max_keys, max_depth, max_value_bytes)
+    return result
+
+
+def process_body(
+    body: bytes,
+    max_keys: int = DEFAULT_MAX_KEYS,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_value_bytes: int = DEFAULT_MAX_VALUE_BYTES,
+) -> Dict[str, Any]:
+    """Summarizes a raw request/response body into bounded, flattenable values.
+
+    JSON objects are bounded by `process_dict`, anything else is kept as a truncated string.
+    """
+    try:
+        body_content = json.loads(body.decode("utf-8"))
+        if isinstance(body_content, dict):
+            return process_dict(body_content, 0, max_keys, max_depth, max_value_bytes)
+        return {"body": process_value(body_content, 0, max_keys, max_depth, max_value_bytes)}
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return {"body": truncate_value(body.decode("utf-8", errors="replace"), max_value_bytes)}
+    except Exception as e:
+        logger.warning(f"[IUDEX] could not process body: {e}")
+        return {}
+
+
+def extract_file_name(body: bytes) -> Optional[str]:
+    content_disp_match = re.search(b'filename="([^"]+)"', body[:1024])
+    if content_disp_match:
+        return content_disp_match.group(1).decode("utf-8")
+    return None
+
+
+def flatten_dict(d: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    items = []
+    for k, v in d.items():
+        new_key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            items.extend(flatten_dict(v, new_key).items())
+        elif isinstance(v, (str, int, float, bool)) or v is None:
+            items.append((new_key, v))
+        else:
+            items.append((new_key, json.dumps(v)))
+    return dict(items)
+
+
+def set_body_attributes(span: Span, prefix: str, processed_body: Dict[str, Any]):
+    for key, value in flatten_dict(processed_body, prefix).items():
+        span.set_attribute(key, value)
+
+
+def set_request_body_attributes(
+    span: Span,
+    body: bytes,
+    content_type: str,
+    content_length: Optional[int] = None,
+):
+    """Records a (possibly capped) request body on the span.
+
+    Shared by the ASGI and WSGI hooks so both summarize payloads the same way.
+    """
+    if "multipart/form-data" in content_type:
+        file_name = extract_file_name(body)
+        if file_name:
+            span.set_attribute("http.request.file.name", file_name)
+        if content_length is not None:
+            span.set_attribute("http.request.file.size", content_length)
+        # NOTE: semconv https://opentelemetry.io/docs/specs/semconv/attributes-registry/http/#:~:text=3495-,http.request.header.%3Ckey%3E,-string%5B%5D
+        # don't directly use content_type since it includes boundary
+        span.set_attribute("http.request.header.content-type", ["multipart/form-data"])
+    else:
+        set_body_attributes(span, "http.request.body", process_body(body))
+        span.set_attribute("http.request.header.content-type", [content_type])
+
+
+def set_response_body_attributes(span: Span, body: bytes):
+    set_body_attributes(span, "http.response.body", process_body(body))
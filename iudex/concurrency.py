@@ -0,0 +1,325 @@
+import functools
+import inspect
+import logging
+import multiprocessing
+import multiprocessing.pool
+import multiprocessing.util
+import os
+import pickle
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from opentelemetry import context, propagate
+from opentelemetry import trace as otel_trace
+from opentelemetry._logs import get_logger_provider
+from opentelemetry.metrics import get_meter
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+SEMAPHORE_NAME_ATTRIBUTE = "iudex.semaphore.name"
+SEMAPHORE_WAIT_ATTRIBUTE = "iudex.semaphore.wait_ms"
+POOL_NAME_ATTRIBUTE = "iudex.pool.name"
+
+# proxy instruments, bound to the meter provider once one is set
+_meter = get_meter(__name__)
+_semaphore_wait_histogram = _meter.create_histogram(
+    name="iudex.semaphore.wait_time",
+    unit="s",
+    description="Time spent waiting to acquire a TimedSemaphore permit",
+)
+_pool_queue_wait_histogram = _meter.create_histogram(
+    name="iudex.pool.queue_wait",
+    unit="s",
+    description="Time TracedThreadPoolExecutor tasks spent queued before a worker ran them",
+)
+
+
+def inject_context() -> Dict[str, str]:
+    """Serializes the current trace context into a picklable carrier."""
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+@contextmanager
+def attached_context(carrier: Dict[str, str]) -> Iterator[None]:
+    """Makes the trace context from `inject_context` current, e.g. in a worker process."""
+    token = context.attach(propagate.extract(carrier))
+    try:
+        yield
+    finally:
+        context.detach(token)
+
+
+def _flush():
+    for provider in (otel_trace.get_tracer_provider(), get_logger_provider()):
+        force_flush = getattr(provider, "force_flush", None)
+        if force_flush:
+            force_flush()
+
+
+# pid of the worker process whose exit flush is registered, forked workers inherit it
+_exit_flush_pid: Optional[int] = None
+
+
+def _flush_and_terminate(signum, frame):
+    try:
+        _flush()
+    finally:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+def _register_exit_flush():
+    """Exports a pool worker's spans and logs once, when the worker exits.
+
+    Workers exit via os._exit, which skips the providers' atexit shutdown, but runs
+    multiprocessing's finalizers. Pool.terminate sends SIGTERM instead, which is caught
+    to flush first, unless the worker already handles it.
+    """
+    global _exit_flush_pid
+    if _exit_flush_pid == os.getpid() or multiprocessing.parent_process() is None:
+        return
+    _exit_flush_pid = os.getpid()
+    multiprocessing.util.Finalize(None, _flush, exitpriority=0)
+    if (
+        threading.current_thread() is threading.main_thread()
+        and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+    ):
+        signal.signal(signal.SIGTERM, _flush_and_terminate)
+
+
+def _run_with_context(carrier: Dict[str, str], fn: Callable, *args, **kwargs) -> Any:
+    # for pools that don't run init_worker
+    _register_exit_flush()
+    with attached_context(carrier):
+        return fn(*args, **kwargs)
+
+
+def with_context(fn: Callable) -> Callable:
+    """Binds the current trace context to fn, so spans it starts join the caller's trace.
+
+    The result is picklable whenever fn is, so it works with any pool:
+
+        pool.map(with_context(process_item), items)
+    """
+    return functools.partial(_run_with_context, inject_context(), fn)
+
+
+def _worker_config_kwargs() -> Optional[dict]:
+    """The iudex config for pool workers, without values that can't be pickled to them."""
+    if config.IUDEX_CONFIG_KWARGS is None:
+        return None
+    config_kwargs = {}
+    for key, value in config.IUDEX_CONFIG_KWARGS.items():
+        try:
+            pickle.dumps(value)
+        except Exception as e:
+            logger.warning(f"Spawned pool workers are configured without iudex config {key!r}: {e}")
+            continue
+        config_kwargs[key] = value
+    return config_kwargs
+
+
+def init_worker(
+    config_kwargs: Optional[dict] = None,
+    initializer: Optional[Callable] = None,
+    initargs: tuple = (),
+):
+    """Configures iudex in a worker process, then runs the pool's own initializer.
+
+    Forked workers inherit the parent's configuration and are left as is.
+    Spawned workers start from scratch and call `instrument` with the parent's config.
+    """
+    _register_exit_flush()
+    if not config.IUDEX_CONFIGURED and config_kwargs is not None:
+        from .instrumentation import instrument
+
+        try:
+            instrument(**config_kwargs)
+        except Exception as e:
+            logger.warning(f"Failed to configure iudex in worker process: {e}")
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_in_otel_context(
+    ctx: context.Context, queued_at: float, pool_name: str, fn: Callable, *args, **kwargs
+) -> Any:
+    _pool_queue_wait_histogram.record(
+        time.perf_counter() - queued_at, attributes={POOL_NAME_ATTRIBUTE: pool_name}
+    )
+    token = context.attach(ctx)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        context.detach(token)
+
+
+class TracedThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks run in the trace context they were submitted from.
+
+    The time tasks wait for a free worker is recorded in the `iudex.pool.queue_wait`
+    histogram, by pool_name. Pools share the "default" name unless given one, since the
+    thread_name_prefix of unnamed pools is numbered per pool.
+
+    Args:
+        pool_name: Recorded as `iudex.pool.name`, to tell pools apart.
+        All other arguments are passed to ThreadPoolExecutor.
+    """
+
+    def __init__(self, *args, pool_name: str = "default", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_name = pool_name
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return super().submit(
+            _run_in_otel_context,
+            context.get_current(),
+            time.perf_counter(),
+            self.pool_name,
+            fn,
+            *args,
+            **kwargs,
+        )
+
+
+class TimedSemaphore:
+    """Wraps an asyncio.Semaphore or threading.Semaphore, recording how long permits take.
+
+    Use it in place of the semaphore that caps concurrent LLM calls, so client side
+    queueing shows up next to the calls' own latency:
+
+        llm_slots = TimedSemaphore(asyncio.Semaphore(8), name="llm")
+        async with llm_slots:
+            await client.chat.completions.create(...)
+
+    The wait is recorded in the `iudex.semaphore.wait_time` histogram, and as
+    `iudex.semaphore.wait_ms` on the current span.
+
+    Args:
+        semaphore: The semaphore to wrap, asyncio's for `async with` and `acquire_async`,
+            threading's for `with` and `acquire`.
+        name: Recorded as `iudex.semaphore.name`, to tell semaphores apart.
+    """
+
+    def __init__(self, semaphore, name: str = "default"):
+        self.semaphore = semaphore
+        self.name = name
+        self._attributes = {SEMAPHORE_NAME_ATTRIBUTE: name}
+        self._is_async = inspect.iscoroutinefunction(semaphore.acquire)
+
+    def _record_wait(self, started_at: float):
+        wait = time.perf_counter() - started_at
+        _semaphore_wait_histogram.record(wait, attributes=self._attributes)
+        span = otel_trace.get_current_span()
+        if span.is_recording():
+            span.set_attribute(SEMAPHORE_WAIT_ATTRIBUTE, wait * 1000)
+
+    def acquire(self, *args, **kwargs) -> bool:
+        if self._is_async:
+            # the coroutine would be truthy without ever acquiring a permit
+            raise TypeError(
+                "TimedSemaphore wraps an asyncio semaphore, use `async with` or `await acquire_async()`"
+            )
+        started_at = time.perf_counter()
+        acquired = self.semaphore.acquire(*args, **kwargs)
+        if acquired:
+            self._record_wait(started_at)
+        return acquired
+
+    async def acquire_async(self) -> bool:
+        if not self._is_async:
+            raise TypeError(
+                "TimedSemaphore wraps a threading semaphore, use `with` or `acquire()`"
+            )
+        started_at = time.perf_counter()
+        acquired = await self.semaphore.acquire()
+        self._record_wait(started_at)
+        return acquired
+
+    def release(self):
+        self.semaphore.release()
+
+    def locked(self) -> bool:
+        if hasattr(self.semaphore, "locked"):
+            return self.semaphore.locked()
+        # threading.Semaphore has no locked()
+        return self.semaphore._value == 0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class TracedProcessPoolExecutor(ProcessPoolExecutor):
+    """ProcessPoolExecutor that configures iudex in its workers and propagates trace context.
+
+    Tasks, including the chunks of `map`, run in the trace context they were submitted from.
+    Spawned workers get the iudex config passed to `instrument`, minus any values that
+    can't be pickled (e.g. a lambda `redact`), which are logged and left out.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        mp_context=None,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+        **kwargs,
+    ):
+        super().__init__(
+            max_workers=max_workers,
+            mp_context=mp_context,
+            initializer=init_worker,
+            initargs=(_worker_config_kwargs(), initializer, initargs),
+            **kwargs,
+        )
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return super().submit(_run_with_context, inject_context(), fn, *args, **kwargs)
+
+
+def traced_pool(
+    processes: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: tuple = (),
+    mp_context=None,
+    **kwargs,
+) -> multiprocessing.pool.Pool:
+    """Creates a multiprocessing Pool whose workers configure iudex on start.
+
+    Pool methods don't share a single submit path, so wrap tasks with `with_context`
+    to propagate the trace context:
+
+        with traced_pool() as pool:
+            pool.map(with_context(process_item), items)
+
+    Args:
+        processes: Number of worker processes, defaults to os.cpu_count().
+        initializer: Called in each worker after iudex is configured.
+        initargs: Arguments for initializer.
+        mp_context: multiprocessing context to create the pool from.
+    """
+    return (mp_context or multiprocessing.get_context()).Pool(
+        processes,
+        initializer=init_worker,
+        initargs=(_worker_config_kwargs(), initializer, initargs),
+        **kwargs,
+    )
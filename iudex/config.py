@@ -4,14 +4,20 @@ from .monkeypatches.get_attributes import patched_get_attributes
 from .monkeypatches.logging import monkeypatch_LogRecord_getMessage
 from .monkeypatches.print import monkeypatch_print
 
+import atexit
+import functools
 import importlib.util
 import logging
 import os
 import re
 import subprocess
-from typing import Callable, Optional, TypedDict, Union
+import threading
+import weakref
+from typing import Callable, List, Optional, TypedDict, Union
 import secrets
+from array import array
 
+import requests
 from opentelemetry.sdk.trace.id_generator import IdGenerator
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
@@ -31,6 +37,13 @@ from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.trace import set_tracer_provider
 
+from .profiling import (
+    ActiveSpanTracker,
+    CpuTimeSpanProcessor,
+    SlowSpanWatchdog,
+    StackSampler,
+    set_active_span_tracker,
+)
 from .utils import get_version
 
 _logger = logging.getLogger(__name__)
@@ -51,6 +64,8 @@ LOG_LEVEL_ATOI = {
 }
 
 IUDEX_CONFIGURED = False
+# kwargs of the configuration in effect, so worker processes can configure themselves the same way
+IUDEX_CONFIG_KWARGS: Optional[dict] = None
 
 
 class IudexConfig(TypedDict, total=False):
@@ -67,6 +82,10 @@ class IudexConfig(TypedDict, total=False):
     timeout: Optional[int]
     disable_print: Optional[bool]
     redact: Optional[Union[str, re.Pattern, Callable[[LogRecord], None]]]
+    id_generator: Optional[str]
+    profiler_hz: Optional[float]
+    slow_span_threshold: Optional[float]
+    span_cpu_time: Optional[bool]
 
 
 class _IudexConfig:
@@ -74,6 +93,7 @@ class _IudexConfig:
         self,
         **kwargs: IudexConfig,
     ):
+        self._kwargs = kwargs
         self.iudex_api_key = kwargs.get("iudex_api_key") or os.getenv("IUDEX_API_KEY")
         if not self.iudex_api_key:
             _logger.warning(
@@ -127,6 +147,27 @@ class _IudexConfig:
 
         self.redact = kwargs.get("redact") or None
 
+        self.id_generator = (
+            kwargs.get("id_generator") or os.getenv("IUDEX_ID_GENERATOR") or DEFAULT_ID_GENERATOR
+        )
+        if self.id_generator not in ID_GENERATORS:
+            _logger.warning(
+                f"Unknown id_generator {self.id_generator!r}, expected one of {list(ID_GENERATORS)}. "
+                + f"Falling back to {DEFAULT_ID_GENERATOR!r}."
+            )
+            self.id_generator = DEFAULT_ID_GENERATOR
+
+        self.profiler_hz = kwargs.get("profiler_hz") or float(os.getenv("IUDEX_PROFILER_HZ", 0))
+
+        self.slow_span_threshold = kwargs.get("slow_span_threshold") or float(
+            os.getenv("IUDEX_SLOW_SPAN_THRESHOLD", 0)
+        )
+
+        self.span_cpu_time = (
+            kwargs.get("span_cpu_time")
+            or os.getenv("IUDEX_SPAN_CPU_TIME", "false").lower() == "true"
+        )
+
     def configure(self):
         if not self.iudex_api_key:
             _logger.warning(
@@ -135,7 +176,7 @@ class _IudexConfig:
             )
             return
 
-        global IUDEX_CONFIGURED
+        global IUDEX_CONFIGURED, IUDEX_CONFIG_KWARGS
         if IUDEX_CONFIGURED:
             return
 
@@ -164,7 +205,10 @@ class _IudexConfig:
 
         # configure logger
         logger_provider = LoggerProvider(resource=resource)
-        log_exporter = OTLPLogExporter(endpoint=self.logs_endpoint, headers=headers, timeout=self._timeout)
+        log_exporter_session = requests.Session()
+        log_exporter = OTLPLogExporter(
+            endpoint=self.logs_endpoint, headers=headers, timeout=self._timeout, session=log_exporter_session
+        )
         if self.redact:
             logger_provider.add_log_record_processor(RedactLogProcessor(self.redact))
         logger_provider.add_log_record_processor(BatchLogRecordProcessor(log_exporter))
@@ -177,12 +221,50 @@ class _IudexConfig:
             monkeypatch_print(LoggingHandler(level=logging.INFO))
 
         # configure tracer
-        trace_provider = TracerProvider(resource=resource, id_generator=IudexIdGenerator())
-        span_exporter = OTLPSpanExporter(endpoint=self.traces_endpoint, headers=headers, timeout=self._timeout)
+        trace_provider = TracerProvider(
+            resource=resource, id_generator=ID_GENERATORS[self.id_generator]()
+        )
+        span_exporter_session = requests.Session()
+        span_exporter = OTLPSpanExporter(
+            endpoint=self.traces_endpoint, headers=headers, timeout=self._timeout, session=span_exporter_session
+        )
+        # tracking processors run before export so their work lands on the exported span
+        span_tracker = None
+        if self.profiler_hz or self.slow_span_threshold:
+            span_tracker = ActiveSpanTracker()
+        if span_tracker:
+            trace_provider.add_span_processor(span_tracker)
+            set_active_span_tracker(span_tracker)
+        if self.span_cpu_time:
+            trace_provider.add_span_processor(CpuTimeSpanProcessor())
         trace_provider.add_span_processor(BatchSpanProcessor(span_exporter))
         set_tracer_provider(trace_provider)
 
+        if self.profiler_hz:
+            stack_sampler = StackSampler(span_tracker, hz=self.profiler_hz)
+            stack_sampler.start()
+            # registered after the providers' own atexit shutdown, so it runs before it
+            atexit.register(stack_sampler.stop)
+        if self.slow_span_threshold:
+            SlowSpanWatchdog(span_tracker, threshold=self.slow_span_threshold).start()
+
+        # batch processors restart their threads after a fork, but the exporters' sessions
+        # would still share pooled sockets with the parent, so forked children get new pools
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(
+                after_in_child=functools.partial(
+                    _reset_session_connections, span_exporter_session, log_exporter_session
+                )
+            )
+
         IUDEX_CONFIGURED = True
+        IUDEX_CONFIG_KWARGS = self._kwargs
+
+
+def _reset_session_connections(*sessions: requests.Session):
+    for session in sessions:
+        session.mount("https://", requests.adapters.HTTPAdapter())
+        session.mount("http://", requests.adapters.HTTPAdapter())
 
 
 def configure_logging(
@@ -275,7 +357,66 @@ class RedactLogProcessor(LogRecordProcessor):
         return True
 
 class IudexIdGenerator(IdGenerator):
+    """Draws every ID from the OS CSPRNG through `secrets`."""
+
     def generate_span_id(self) -> int:
         return secrets.randbits(64)
     def generate_trace_id(self) -> int:
         return secrets.randbits(128)
+
+
+class BufferedIdGenerator(IdGenerator):
+    """Pops IDs from per-thread buffers of `os.urandom` words, refilled in bulk.
+
+    Same entropy source as `IudexIdGenerator`, with one syscall per `buffer_size` IDs
+    instead of one per ID. Buffers are dropped in forked children, so they never reuse
+    their parent's IDs.
+    """
+
+    def __init__(self, buffer_size: int = 512):
+        self._buffer_size = buffer_size
+        self._local = threading.local()
+        _buffered_id_generators.add(self)
+
+    def _refill_span_ids(self) -> List[int]:
+        span_ids = self._local.span_ids = array("Q", os.urandom(8 * self._buffer_size)).tolist()
+        return span_ids
+
+    def _refill_trace_ids(self) -> List[int]:
+        words = iter(array("Q", os.urandom(16 * self._buffer_size)))
+        trace_ids = self._local.trace_ids = [high << 64 | low for high, low in zip(words, words)]
+        return trace_ids
+
+    def generate_span_id(self) -> int:
+        try:
+            span_id = self._local.span_ids.pop()
+        except (AttributeError, IndexError):
+            span_id = self._refill_span_ids().pop()
+        # 0 is the invalid span id
+        return span_id or self.generate_span_id()
+
+    def generate_trace_id(self) -> int:
+        try:
+            trace_id = self._local.trace_ids.pop()
+        except (AttributeError, IndexError):
+            trace_id = self._refill_trace_ids().pop()
+        return trace_id or self.generate_trace_id()
+
+
+_buffered_id_generators: "weakref.WeakSet[BufferedIdGenerator]" = weakref.WeakSet()
+
+
+def _reset_buffered_id_generators():
+    for generator in _buffered_id_generators:
+        generator._local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_buffered_id_generators)
+
+
+ID_GENERATORS = {
+    "secure": IudexIdGenerator,
+    "buffered": BufferedIdGenerator,
+}
+DEFAULT_ID_GENERATOR = "secure"
@@ -6,6 +6,13 @@ try:
 except ImportError:
     FastAPI = "FastAPI"
 
+from .asgi import (
+    LoopLagMiddleware,
+    PhaseTimingMiddleware,
+    WebSocketSessionMiddleware,
+    instrument_endpoint_timing,
+)
+from . import config as config_module
 from .instrumentation import IudexConfig, instrument
 from .utils import maybe_instrument_lib
 
@@ -22,6 +29,11 @@ def instrument_fastapi(
     github_url: Optional[str] = None,
     env: Optional[str] = None,
     config: Optional[IudexConfig] = None,
+    phase_timing: bool = False,
+    server_timing: bool = False,
+    websocket_sessions: bool = False,
+    websocket_snapshot_interval: float = 60,
+    loop_lag_threshold: Optional[float] = None,
 ):
     """Auto-instruments FastAPI app to send OTel signals to Iudex.
 
@@ -52,7 +64,31 @@ def instrument_fastapi(
         env: Environment of the service, e.g. "production", "staging".
         config: IudexConfig object with more granular options.
             Will override all other args, so provide them to the object instead.
+        phase_timing: Whether to break request latency into receive/handler/serialize/send phases.
+            Requires app.
+        server_timing: Whether to also send the phases as a `Server-Timing` response header.
+        websocket_sessions: Whether to aggregate each websocket session onto one span, instead of
+            a span per message. Requires app, and must be the first call to instrument Iudex.
+        websocket_snapshot_interval: Seconds between snapshot events on long-lived websocket sessions.
+        loop_lag_threshold: Seconds of event loop lag to report as a blocked loop, with the task,
+            span and stack that blocked it. Enables the `asyncio.loop.lag` metrics. Requires app.
     """
+    has_app = app is not None and not isinstance(app, str)
+    if websocket_sessions and has_app:
+        if config_module.IUDEX_CONFIGURED:
+            logger.warning(
+                "websocket_sessions: instrument was already called, so per-message websocket "
+                "spans are still created alongside the session span."
+            )
+        # before `instrument` sets up FastAPI without it
+        maybe_instrument_lib(
+            "opentelemetry.instrumentation.fastapi",
+            "FastAPIInstrumentor",
+            {},
+            {},
+            websocket_sessions=True,
+        )
+
     iudex_config = instrument(
         service_name=service_name,
         instance_id=instance_id,
@@ -64,6 +100,36 @@ def instrument_fastapi(
         config=config,
     )
 
-    maybe_instrument_lib("opentelemetry.instrumentation.fastapi", "FastAPIInstrumentor")
+    maybe_instrument_lib("opentelemetry.instrumentation.fastapi", "FastAPIInstrumentor", {}, {})
+
+    if (phase_timing or server_timing or websocket_sessions or loop_lag_threshold) and not has_app:
+        logger.warning(
+            "phase_timing, websocket_sessions and loop_lag_threshold require a FastAPI app to add middleware to."
+        )
+        return iudex_config
+
+    if phase_timing or server_timing:
+        instrument_endpoint_timing()
+        app.add_middleware(PhaseTimingMiddleware, server_timing=server_timing)
+
+    if websocket_sessions:
+        _add_innermost_middleware(
+            app, WebSocketSessionMiddleware, snapshot_interval=websocket_snapshot_interval
+        )
+
+    if loop_lag_threshold:
+        app.add_middleware(LoopLagMiddleware, threshold=loop_lag_threshold)
 
     return iudex_config
+
+
+def _add_innermost_middleware(app: FastAPI, middleware_class: type, **options: Any):
+    """Adds middleware below all others, inside the OTel ASGI middleware and its server span.
+
+    `add_middleware` adds it outermost instead, where the server span isn't current yet.
+    """
+    from starlette.middleware import Middleware
+
+    if getattr(app, "middleware_stack", None) is not None:
+        raise RuntimeError("Cannot add middleware after an application has started")
+    app.user_middleware.append(Middleware(middleware_class, **options))
@@ -0,0 +1,78 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Sequence
+
+
+def exponential_bounds(start: float, factor: float, count: int) -> List[float]:
+    """Bucket upper bounds start, start*factor, ..., start*factor^(count-1)."""
+    return [start * factor**i for i in range(count)]
+
+
+# 1us .. ~67s, doubling, good enough for per-call/per-item latencies in seconds
+LATENCY_BOUNDS = exponential_bounds(1e-6, 2, 27)
+# 16B .. 64MiB, doubling, for message/payload sizes in bytes
+SIZE_BOUNDS = exponential_bounds(16, 2, 23)
+
+
+class FixedBucketHistogram:
+    """Compact in-process histogram with fixed bucket bounds.
+
+    Counts live in a single `array`, so recording is a bisect and an increment
+    and memory stays constant no matter how many values are recorded.
+    Percentiles are estimated by linear interpolation within a bucket.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BOUNDS):
+        self.bounds = tuple(bounds)
+        # last bucket catches everything above the highest bound
+        self.counts = array("Q", bytes(8 * (len(self.bounds) + 1)))
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def record(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Estimated value at quantile q in [0, 1]."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if not bucket_count:
+                continue
+            if seen + bucket_count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else self.min
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * ((rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def to_attributes(self, prefix: str) -> Dict[str, float]:
+        if not self.count:
+            return {f"{prefix}.count": 0}
+        return {
+            f"{prefix}.count": self.count,
+            f"{prefix}.sum": self.sum,
+            f"{prefix}.min": self.min,
+            f"{prefix}.max": self.max,
+            f"{prefix}.mean": self.mean,
+            f"{prefix}.p50": self.percentile(0.5),
+            f"{prefix}.p90": self.percentile(0.9),
+            f"{prefix}.p99": self.percentile(0.99),
+        }
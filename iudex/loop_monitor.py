@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from typing import Dict, Optional
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace as otel_trace
+from opentelemetry.metrics import get_meter
+
+from .profiling import get_active_span_tracker
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 64
+
+# one monitor per loop
+_monitors: Dict[int, "LoopLagMonitor"] = {}
+
+
+class LoopLagMonitor:
+    """Measures event loop scheduling lag with a heartbeat callback.
+
+    Every heartbeat records how late it ran in the `asyncio.loop.lag` histogram.
+    A watchdog thread notices when a heartbeat is overdue by more than `threshold` seconds
+    while the loop is still blocked, and records the running task, its active span and
+    the loop thread's stack, as an `asyncio.loop.blocked` event on that span.
+
+    The span is read from the running task's context. Before Python 3.12 tasks don't expose
+    it, so on 3.11 the monitor installs a task factory that keeps the context of each task
+    created after it starts. Otherwise (older Pythons, tasks created earlier, or a loop that
+    already has a task factory) the span is the running task's innermost one from span
+    tracking, when it's enabled (`profiler_hz` or `slow_span_threshold`). The stall is
+    logged with its stack either way.
+
+    The monitor stops itself once its loop is closed, e.g. when `asyncio.run` returns.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float = 0.25,
+        threshold: float = 0.1,
+        meter_provider=None,
+    ):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        meter = get_meter(__name__, meter_provider=meter_provider)
+        self._lag_histogram = meter.create_histogram(
+            name="asyncio.loop.lag",
+            unit="s",
+            description="Delay between when an event loop heartbeat was scheduled and when it ran",
+        )
+        self._blocked_counter = meter.create_counter(
+            name="asyncio.loop.blocked",
+            unit="{stall}",
+            description="Number of times the event loop lag exceeded the threshold",
+        )
+        self._expected: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        # what was running during the current stall, captured by the watchdog
+        self._stall_expected: Optional[float] = None
+        self._stall_task: Optional[str] = None
+        self._stall_stack: Optional[str] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        # contexts of tasks, for Pythons where tasks don't expose their own
+        self._task_contexts: "weakref.WeakKeyDictionary[asyncio.Task, contextvars.Context]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._watchdog is not None:
+            return
+        if not hasattr(asyncio.Task, "get_context") and sys.version_info >= (3, 11):
+            self.loop.call_soon_threadsafe(self._capture_task_contexts)
+        self.loop.call_soon_threadsafe(self._beat)
+        self._watchdog = threading.Thread(target=self._watch, name="iudex-loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._handle is not None:
+            try:
+                # handles aren't thread-safe, cancel it on the loop's own thread
+                self.loop.call_soon_threadsafe(self._handle.cancel)
+            except RuntimeError:
+                # the loop is closed, its callbacks won't run anyway
+                pass
+        if _monitors.get(id(self.loop)) is self:
+            del _monitors[id(self.loop)]
+
+    def _capture_task_contexts(self):
+        if self.loop.get_task_factory() is not None:
+            # can't tell whether another factory accepts a context, so leave it be
+            return
+        task_contexts = self._task_contexts
+
+        def task_factory(loop, coro, context=None):
+            if context is None:
+                context = contextvars.copy_context()
+            task = asyncio.Task(coro, loop=loop, context=context)
+            task_contexts[task] = context
+            return task
+
+        self.loop.set_task_factory(task_factory)
+
+    def _task_context(self, task: asyncio.Task) -> Optional[contextvars.Context]:
+        get_context = getattr(task, "get_context", None)
+        if get_context is not None:
+            return get_context()
+        return self._task_contexts.get(task)
+
+    def _beat(self):
+        now = time.monotonic()
+        if self._expected is not None:
+            lag = max(0.0, now - self._expected)
+            self._lag_histogram.record(lag)
+            if lag >= self.threshold:
+                self._blocked_counter.add(1)
+                extra = {"asyncio.loop.lag_ms": lag * 1000}
+                task = None
+                if self._stall_expected == self._expected:
+                    task = self._stall_task
+                    if task:
+                        extra["asyncio.task.name"] = task
+                    if self._stall_stack:
+                        extra["code.stacktrace"] = self._stall_stack
+                logger.warning(
+                    f"[IUDEX] event loop blocked for {lag * 1000:.0f}ms"
+                    + (f" by task {task}" if task else ""),
+                    extra=extra,
+                )
+        self._loop_thread_id = threading.get_ident()
+        self._expected = now + self.interval
+        if not self._stopped.is_set():
+            self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            if self.loop.is_closed():
+                self.stop()
+                return
+            try:
+                self._check()
+            except Exception as e:
+                logger.debug(f"Loop lag watchdog failed: {e}")
+
+    def _check(self):
+        expected = self._expected
+        if expected is None or self._stall_expected == expected:
+            return
+        blocked_for = time.monotonic() - expected
+        if blocked_for < self.threshold:
+            return
+        # capture once per stall, while the blocking code is still on the loop thread
+        self._stall_expected = expected
+        frame = sys._current_frames().get(self._loop_thread_id)
+        task = asyncio.current_task(self.loop)
+        self._stall_task = task.get_name() if task else None
+        self._stall_stack = (
+            "".join(traceback.format_stack(frame, MAX_STACK_DEPTH)) if frame is not None else None
+        )
+
+        span = None
+        # tasks run in their own context, which holds the span they are in
+        task_context = self._task_context(task) if task is not None else None
+        if task_context is not None:
+            span = _context_span(task_context)
+        else:
+            tracker = get_active_span_tracker()
+            if tracker is not None:
+                span = tracker.current_span(self._loop_thread_id)
+        if span is None or not span.is_recording():
+            return
+        attributes = {
+            "asyncio.loop.blocked_ms": blocked_for * 1000,
+            "thread.id": self._loop_thread_id,
+        }
+        if self._stall_task:
+            attributes["asyncio.task.name"] = self._stall_task
+        if self._stall_stack:
+            attributes["code.stacktrace"] = self._stall_stack
+        span.add_event("asyncio.loop.blocked", attributes)
+
+
+def _context_span(task_context: contextvars.Context) -> Optional[otel_trace.Span]:
+    # the task's context is entered on the loop thread, so it can't be `run` from here,
+    # but it's a mapping, and the OTel context the task is in is one of its values
+    for value in list(task_context.values()):
+        if isinstance(value, otel_context.Context):
+            return otel_trace.get_current_span(value)
+    return None
+
+
+def monitor_event_loop(
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+    interval: float = 0.25,
+    threshold: float = 0.1,
+    meter_provider=None,
+) -> LoopLagMonitor:
+    """Starts an event loop lag monitor, call from within the loop or pass it.
+
+    Args:
+        loop: Event loop to monitor, defaults to the running loop.
+        interval: Seconds between heartbeats.
+        threshold: Lag in seconds that counts as the loop being blocked.
+        meter_provider: Meter provider for the lag metrics, defaults to the global one.
+    """
+    loop = loop or asyncio.get_running_loop()
+    monitor = _monitors.get(id(loop))
+    # ids of closed loops are reused
+    if monitor is not None and monitor.loop is not loop:
+        monitor.stop()
+        monitor = None
+    if monitor is None:
+        monitor = _monitors[id(loop)] = LoopLagMonitor(
+            loop, interval=interval, threshold=threshold, meter_provider=meter_provider
+        )
+        monitor.start()
+    return monitor
@@ -5,10 +5,13 @@ import opentelemetry.attributes
 from opentelemetry.attributes import _clean_attribute_value
 from opentelemetry.util import types
 
+from ..summarizers import to_attribute_value
+
 logger = logging.getLogger(__name__)
 
 
 _VALID_ATTR_VALUE_TYPES = (bool, str, bytes, int, float)
+_PRIMITIVE_TYPES = (bool, str, int, float)
 
 
 def patched_clean_attribute(
@@ -33,6 +36,11 @@ def patched_clean_attribute(
         logger.warning("invalid key `%s`. must be non-empty string.", key)
         return None
 
+    # summarize large/structured objects (ndarray, DataFrame, big bytes, dicts, ...) before
+    # anything below would stringify them whole
+    if type(value) not in _PRIMITIVE_TYPES:
+        value = to_attribute_value(value)
+
     if isinstance(value, _VALID_ATTR_VALUE_TYPES):
         return _clean_attribute_value(value, max_len)
 
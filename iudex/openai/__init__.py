@@ -1,9 +1,12 @@
-from typing import Collection
+import os
+from typing import Collection, Optional
 
 from opentelemetry.instrumentation.instrumentor import BaseInstrumentor
 
 from .shared.config import Config
-from .utils import is_openai_v1
+from .shared.token_counting import DEFAULT_PRELOAD_ENCODINGS
+from .shared.token_counting import preload_encodings as preload_tiktoken_encodings
+from .utils import is_openai_v1, resolve_sdk_versions
 from .v0 import OpenAIV0Instrumentor
 from .v1 import OpenAIV1Instrumentor
 
@@ -18,16 +21,40 @@ class OpenAIInstrumentor(BaseInstrumentor):
         enrich_assistant: bool = False,
         enrich_token_usage: bool = False,
         exception_logger=None,
+        stream_chunk_event_interval: int = 0,
+        max_embedding_prompts: int = 16,
+        background_token_count: bool = True,
+        approximate_token_count_when_busy: bool = False,
+        preload_encodings: Optional[Collection[str]] = None,
+        tiktoken_dir: Optional[str] = None,
     ):
         super().__init__()
         Config.enrich_assistant = enrich_assistant
         Config.enrich_token_usage = enrich_token_usage
         Config.exception_logger = exception_logger
+        Config.stream_chunk_event_interval = stream_chunk_event_interval
+        Config.max_embedding_prompts = max_embedding_prompts
+        Config.background_token_count = background_token_count
+        Config.approximate_token_count_when_busy = approximate_token_count_when_busy
+        if preload_encodings is None:
+            # comma separated encoding names, e.g. "cl100k_base,o200k_base"
+            preload_encodings = os.getenv("IUDEX_TIKTOKEN_PRELOAD") or ""
+        if isinstance(preload_encodings, str):
+            preload_encodings = preload_encodings.split(",")
+        Config.preload_encodings = tuple(name.strip() for name in preload_encodings if name.strip())
+        Config.tiktoken_dir = tiktoken_dir or os.getenv("IUDEX_TIKTOKEN_DIR")
+        if Config.tiktoken_dir and not Config.preload_encodings:
+            # a local directory is only useful if something is loaded from it
+            Config.preload_encodings = DEFAULT_PRELOAD_ENCODINGS
 
     def instrumentation_dependencies(self) -> Collection[str]:
         return _instruments
 
     def _instrument(self, **kwargs):
+        # resolve once here, the wrappers check the flavour on every call and chunk
+        resolve_sdk_versions()
+        if Config.enrich_token_usage and (Config.preload_encodings or Config.tiktoken_dir):
+            preload_tiktoken_encodings(Config.preload_encodings, Config.tiktoken_dir)
         if is_openai_v1():
             OpenAIV1Instrumentor().instrument(**kwargs)
         else:
@@ -2,8 +2,6 @@ import json
 import logging
 import os
 import types
-from importlib.metadata import version
-
 import openai
 from opentelemetry import context as context_api
 from opentelemetry.semconv.ai import SpanAttributes
@@ -11,16 +9,17 @@ from opentelemetry.semconv.ai import SpanAttributes
 from ..utils import (
     dont_throw,
     is_openai_v1,
+    is_pydantic_v1,
     should_record_stream_token_usage,
 )
+from .token_counting import (  # noqa: F401
+    DEFAULT_MODEL_FOR_ENCODING,
+    get_token_count_from_string,
+    tiktoken_encodings,
+)
 
 OPENAI_LLM_USAGE_TOKEN_TYPES = ["prompt_tokens", "completion_tokens"]
 
-DEFAULT_MODEL_FOR_ENCODING = "gpt-4"
-
-# tiktoken encodings map for different model, key is model_name, value is tiktoken encoding
-tiktoken_encodings = {}
-
 logger = logging.getLogger(__name__)
 
 
@@ -215,7 +214,7 @@ def is_streaming_response(response):
 
 
 def model_as_dict(model):
-    if version("pydantic") < "2.0.0":
+    if is_pydantic_v1():
         return model.dict()
     if hasattr(model, "model_dump"):
         return model.model_dump()
@@ -225,36 +224,6 @@ def model_as_dict(model):
         return model
 
 
-def get_token_count_from_string(string: str, model_name: str):
-    if not should_record_stream_token_usage():
-        return None
-
-    import tiktoken
-
-    if tiktoken_encodings.get(model_name) is None:
-        try:
-            encoding = tiktoken.encoding_for_model(model_name)
-        except KeyError as e:
-            # no such model_name in tiktoken
-            logger.debug(
-                f"Failed to get tiktoken encoding for model_name {model_name}, defaulting to cl100k_base (gpt-4). Error:\n{str(e)}"
-            )
-            encoding = tiktoken.encoding_for_model(DEFAULT_MODEL_FOR_ENCODING)
-        except Exception as e:
-            logger.warning(e)
-            encoding = tiktoken.encoding_for_model(DEFAULT_MODEL_FOR_ENCODING)
-
-        tiktoken_encodings[model_name] = encoding
-    else:
-        encoding = tiktoken_encodings.get(model_name)
-
-    if not encoding:
-        return None
-
-    token_count = len(encoding.encode(string))
-    return token_count
-
-
 def _token_type(token_type: str):
     if token_type == "prompt_tokens":
         return "input"
@@ -30,10 +30,14 @@ from ..shared import (
     should_record_stream_token_usage,
     should_send_prompts,
 )
+from .config import Config
+from .in_flight import end_request, start_request
+from .rate_limits import end_call_telemetry, record_call_telemetry, start_call_telemetry
+from .stream_accumulator import CHUNK_COUNT_ATTRIBUTE, StreamAccumulator
+from .token_counting import finish_with_token_count, get_prompt_token_count
 from ..utils import (
     _with_chat_telemetry_wrapper,
     dont_throw,
-    is_azure_openai,
     is_openai_v1,
 )
 
@@ -69,12 +73,15 @@ def chat_wrapper(
 
     _handle_request(span, kwargs, instance)
 
+    call, call_token = start_call_telemetry()
+    in_flight = start_request("chat", kwargs.get("model"), instance)
     try:
         start_time = time.time()
         response = wrapped(*args, **kwargs)
         end_time = time.time()
     except Exception as e:  # pylint: disable=broad-except
         end_time = time.time()
+        end_request(in_flight)
         duration = end_time - start_time if "start_time" in locals() else 0
 
         attributes = {
@@ -86,7 +93,18 @@ def chat_wrapper(
         if exception_counter:
             exception_counter.add(1, attributes=attributes)
 
+        # rate limited calls are the ones whose retries and headers matter most
+        record_call_telemetry(
+            span, call, kwargs.get("model"), _get_openai_base_url(instance), e
+        )
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        span.end()
         raise e
+    finally:
+        end_call_telemetry(call_token)
+
+    record_call_telemetry(span, call, kwargs.get("model"), _get_openai_base_url(instance))
 
     if is_streaming_response(response):
         # span will be closed after the generator is done
@@ -102,6 +120,7 @@ def chat_wrapper(
                 streaming_time_to_generate,
                 start_time,
                 kwargs,
+                in_flight,
             )
         else:
             return _build_from_streaming_response(
@@ -115,8 +134,10 @@ def chat_wrapper(
                 streaming_time_to_generate,
                 start_time,
                 kwargs,
+                in_flight,
             )
 
+    end_request(in_flight)
     duration = end_time - start_time
 
     _handle_response(
@@ -157,12 +178,15 @@ async def achat_wrapper(
     )
     _handle_request(span, kwargs, instance)
 
+    call, call_token = start_call_telemetry()
+    in_flight = start_request("chat", kwargs.get("model"), instance)
     try:
         start_time = time.time()
         response = await wrapped(*args, **kwargs)
         end_time = time.time()
     except Exception as e:  # pylint: disable=broad-except
         end_time = time.time()
+        end_request(in_flight)
         duration = end_time - start_time if "start_time" in locals() else 0
 
         attributes = {
@@ -174,7 +198,18 @@ async def achat_wrapper(
         if exception_counter:
             exception_counter.add(1, attributes=attributes)
 
+        # rate limited calls are the ones whose retries and headers matter most
+        record_call_telemetry(
+            span, call, kwargs.get("model"), _get_openai_base_url(instance), e
+        )
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        span.end()
         raise e
+    finally:
+        end_call_telemetry(call_token)
+
+    record_call_telemetry(span, call, kwargs.get("model"), _get_openai_base_url(instance))
 
     if is_streaming_response(response):
         # span will be closed after the generator is done
@@ -190,6 +225,7 @@ async def achat_wrapper(
                 streaming_time_to_generate,
                 start_time,
                 kwargs,
+                in_flight,
             )
         else:
             return _abuild_from_streaming_response(
@@ -203,8 +239,10 @@ async def achat_wrapper(
                 streaming_time_to_generate,
                 start_time,
                 kwargs,
+                in_flight,
             )
 
+    end_request(in_flight)
     duration = end_time - start_time
 
     _handle_response(
@@ -376,8 +414,14 @@ def _set_completions(span, choices):
             )
 
 
+@dont_throw
 def _set_streaming_token_metrics(
-    request_kwargs, complete_response, span, token_counter, shared_attributes
+    request_kwargs,
+    complete_response,
+    span,
+    token_counter,
+    shared_attributes,
+    count_tokens=get_token_count_from_string,
 ):
     # use tiktoken calculate token usage
     if not should_record_stream_token_usage():
@@ -392,23 +436,21 @@ def _set_streaming_token_metrics(
 
     # parse streaming usage if present
     # https://platform.openai.com/docs/api-reference/chat/create#chat-create-stream_options
-    if usage and not choices:
+    if usage:
         prompt_usage = usage.get("prompt_tokens", -1)
         completion_usage = usage.get("completion_tokens", -1)
 
     # prompt_usage from tokenized content, if no usage
     if prompt_usage == -1 and request_kwargs and request_kwargs.get("messages"):
-        prompt_content = ""
         # setting the default model_name as gpt-4. As this uses the embedding "cl100k_base" that
         # is used by most of the other model.
         model_name = (
             request_kwargs.get("model") or complete_response.get("model") or DEFAULT_MODEL_FOR_ENCODING
         )
-        for msg in request_kwargs.get("messages"):
-            if msg.get("content"):
-                prompt_content += msg.get("content")
         if model_name:
-            prompt_usage = get_token_count_from_string(prompt_content, model_name)
+            prompt_usage = get_prompt_token_count(
+                request_kwargs.get("messages"), model_name, count_tokens
+            )
 
     # completion_usage from tokenized content, if no usage
     if completion_usage == -1 and choices:
@@ -422,9 +464,7 @@ def _set_streaming_token_metrics(
                 completion_content += choice["message"]["content"]
 
         if model_name:
-            completion_usage = get_token_count_from_string(
-                completion_content, model_name
-            )
+            completion_usage = count_tokens(completion_content, model_name)
 
     # span record
     _set_span_stream_usage(span, prompt_usage, completion_usage)
@@ -458,6 +498,8 @@ class ChatStream(ObjectProxy):
     _streaming_time_to_generate = None
     _start_time = None
     _request_kwargs = None
+    _accumulator = None
+    _in_flight = None
 
     def __init__(
         self,
@@ -471,6 +513,7 @@ class ChatStream(ObjectProxy):
         streaming_time_to_generate=None,
         start_time=None,
         request_kwargs=None,
+        in_flight=None,
     ):
         super().__init__(response)
 
@@ -483,22 +526,25 @@ class ChatStream(ObjectProxy):
         self._streaming_time_to_generate = streaming_time_to_generate
         self._start_time = start_time
         self._request_kwargs = request_kwargs
+        self._in_flight = in_flight
 
         self._first_token = True
         # will be updated when first token is received
         self._time_of_first_token = self._start_time
-        self._complete_response = {"choices": [], "model": ""}
+        self._accumulator = StreamAccumulator()
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self._end_in_flight()
         self.__wrapped__.__exit__(exc_type, exc_val, exc_tb)
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._end_in_flight()
         await self.__wrapped__.__aexit__(exc_type, exc_val, exc_tb)
 
     def __iter__(self):
@@ -511,6 +557,7 @@ class ChatStream(ObjectProxy):
         try:
             chunk = self.__wrapped__.__next__()
         except Exception as e:
+            self._end_in_flight()
             if isinstance(e, StopIteration):
                 self._close_span()
             raise e
@@ -522,6 +569,7 @@ class ChatStream(ObjectProxy):
         try:
             chunk = await self.__wrapped__.__anext__()
         except Exception as e:
+            self._end_in_flight()
             if isinstance(e, StopAsyncIteration):
                 self._close_span()
             raise e
@@ -529,8 +577,14 @@ class ChatStream(ObjectProxy):
             self._process_item(chunk)
             return chunk
 
+    def _end_in_flight(self):
+        # once, whether the stream is exhausted, fails or is closed early
+        in_flight, self._in_flight = self._in_flight, None
+        end_request(in_flight)
+
     def _process_item(self, item):
-        self._span.add_event(name=f"{SpanAttributes.LLM_CONTENT_COMPLETION_CHUNK}")
+        self._accumulator.add(item)
+        _add_chunk_event(self._span, self._accumulator.chunk_count)
 
         if self._first_token and self._streaming_time_to_first_token:
             self._time_of_first_token = time.time()
@@ -540,56 +594,9 @@ class ChatStream(ObjectProxy):
             )
             self._first_token = False
 
-        if is_openai_v1():
-            item = model_as_dict(item)
-
-        self._complete_response["model"] = item.get("model")
-
-        for choice in item.get("choices"):
-            index = choice.get("index")
-            # prevent weird index values
-            if index is None or index > 1000:
-                logger.warning(f"Skipping invalid choice with index: {index}")
-                continue
-            while len(self._complete_response["choices"]) <= index:
-                self._complete_response["choices"].append(
-                    {"index": index, "message": {"content": "", "role": ""}}
-                )
-            try:
-                complete_choice = self._complete_response["choices"][index]
-            except IndexError as e:
-                logger.warning(f"Error processing choice with index {index}: {e}")
-                continue
-            if choice.get("finish_reason"):
-                complete_choice["finish_reason"] = choice.get("finish_reason")
-
-            delta = choice.get("delta")
-
-            if delta and delta.get("content"):
-                complete_choice["message"]["content"] += delta.get("content")
-            if delta and delta.get("role"):
-                complete_choice["message"]["role"] = delta.get("role")
-            if delta and delta.get("tool_calls"):
-                tool_calls = delta.get("tool_calls")
-                if not isinstance(tool_calls, list) or len(tool_calls) == 0:
-                    continue
-
-                if not complete_choice["message"].get("tool_calls"):
-                    complete_choice["message"]["tool_calls"] = [
-                        {"function": {"name": "", "arguments": ""}}
-                    ]
-
-                tool_call = tool_calls[0]
-                function = complete_choice["message"]["tool_calls"][0]["function"]
-
-                if tool_call.get("function") and tool_call["function"].get("name"):
-                    function["name"] += tool_call["function"]["name"]
-                if tool_call.get("function") and tool_call["function"].get("arguments"):
-                    function["arguments"] += tool_call["function"]["arguments"]
-
     def _shared_attributes(self):
         return _metric_shared_attributes(
-            response_model=self._complete_response.get("model")
+            response_model=self._accumulator.model
             or self._request_kwargs.get("model")
             or None,
             operation="chat",
@@ -599,20 +606,16 @@ class ChatStream(ObjectProxy):
 
     @dont_throw
     def _close_span(self):
-        _set_streaming_token_metrics(
-            self._request_kwargs,
-            self._complete_response,
-            self._span,
-            self._token_counter,
-            self._shared_attributes(),
-        )
+        complete_response = self._accumulator.to_response()
+        _set_span_attribute(self._span, CHUNK_COUNT_ATTRIBUTE, self._accumulator.chunk_count)
+        shared_attributes = self._shared_attributes()
 
         # choice metrics
-        if self._choice_counter and self._complete_response.get("choices"):
+        if self._choice_counter and complete_response.get("choices"):
             _set_choice_counter_metrics(
                 self._choice_counter,
-                self._complete_response.get("choices"),
-                self._shared_attributes(),
+                complete_response.get("choices"),
+                shared_attributes,
             )
 
         # duration metrics
@@ -621,22 +624,57 @@ class ChatStream(ObjectProxy):
         else:
             duration = None
         if duration and isinstance(duration, (float, int)) and self._duration_histogram:
-            self._duration_histogram.record(
-                duration, attributes=self._shared_attributes()
-            )
+            self._duration_histogram.record(duration, attributes=shared_attributes)
         if self._streaming_time_to_generate and self._time_of_first_token:
             self._streaming_time_to_generate.record(
                 time.time() - self._time_of_first_token,
-                attributes=self._shared_attributes(),
+                attributes=shared_attributes,
+            )
+
+        _finish_streaming_span(
+            self._span,
+            self._request_kwargs,
+            complete_response,
+            self._token_counter,
+            shared_attributes,
+        )
+
+
+def _needs_token_count(complete_response):
+    # streams only report usage when requested with stream_options
+    return should_record_stream_token_usage() and not complete_response.get("usage")
+
+
+def _finish_streaming_span(
+    span, request_kwargs, complete_response, token_counter, shared_attributes
+):
+    """Records token usage and the response, then ends the span.
+
+    Tokenizing the prompt and completion happens on the token counting worker, so
+    the span is ended there, with the time the stream actually finished.
+    """
+    end_time = time.time_ns()
+
+    def finish(count_tokens):
+        try:
+            _set_streaming_token_metrics(
+                request_kwargs,
+                complete_response,
+                span,
+                token_counter,
+                shared_attributes,
+                count_tokens,
             )
+            _set_response_attributes(span, complete_response)
 
-        _set_response_attributes(self._span, self._complete_response)
+            if should_send_prompts():
+                _set_completions(span, complete_response.get("choices"))
 
-        if should_send_prompts():
-            _set_completions(self._span, self._complete_response.get("choices"))
+            span.set_status(Status(StatusCode.OK))
+        finally:
+            span.end(end_time=end_time)
 
-        self._span.set_status(Status(StatusCode.OK))
-        self._span.end()
+    finish_with_token_count(finish, _needs_token_count(complete_response))
 
 
 # Backward compatibility with OpenAI v0
@@ -654,25 +692,31 @@ def _build_from_streaming_response(
     streaming_time_to_generate=None,
     start_time=None,
     request_kwargs=None,
+    in_flight=None,
 ):
-    complete_response = {"choices": [], "model": ""}
+    accumulator = StreamAccumulator()
 
     first_token = True
     time_of_first_token = start_time  # will be updated when first token is received
 
-    for item in response:
-        span.add_event(name=f"{SpanAttributes.LLM_CONTENT_COMPLETION_CHUNK}")
+    try:
+        for item in response:
+            item_to_yield = item
 
-        item_to_yield = item
+            if first_token and streaming_time_to_first_token:
+                time_of_first_token = time.time()
+                streaming_time_to_first_token.record(time_of_first_token - start_time)
+                first_token = False
 
-        if first_token and streaming_time_to_first_token:
-            time_of_first_token = time.time()
-            streaming_time_to_first_token.record(time_of_first_token - start_time)
-            first_token = False
+            accumulator.add(item)
+            _add_chunk_event(span, accumulator.chunk_count)
 
-        _accumulate_stream_items(item, complete_response)
+            yield item_to_yield
+    finally:
+        end_request(in_flight)
 
-        yield item_to_yield
+    complete_response = accumulator.to_response()
+    _set_span_attribute(span, CHUNK_COUNT_ATTRIBUTE, accumulator.chunk_count)
 
     shared_attributes = {
         SpanAttributes.LLM_RESPONSE_MODEL: complete_response.get("model") or None,
@@ -680,10 +724,6 @@ def _build_from_streaming_response(
         "stream": True,
     }
 
-    _set_streaming_token_metrics(
-        request_kwargs, complete_response, span, token_counter, shared_attributes
-    )
-
     # choice metrics
     if choice_counter and complete_response.get("choices"):
         _set_choice_counter_metrics(
@@ -700,13 +740,9 @@ def _build_from_streaming_response(
     if streaming_time_to_generate and time_of_first_token:
         streaming_time_to_generate.record(time.time() - time_of_first_token)
 
-    _set_response_attributes(span, complete_response)
-
-    if should_send_prompts():
-        _set_completions(span, complete_response.get("choices"))
-
-    span.set_status(Status(StatusCode.OK))
-    span.end()
+    _finish_streaming_span(
+        span, request_kwargs, complete_response, token_counter, shared_attributes
+    )
 
 
 @dont_throw
@@ -721,25 +757,31 @@ async def _abuild_from_streaming_response(
     streaming_time_to_generate=None,
     start_time=None,
     request_kwargs=None,
+    in_flight=None,
 ):
-    complete_response = {"choices": [], "model": ""}
+    accumulator = StreamAccumulator()
 
     first_token = True
     time_of_first_token = start_time  # will be updated when first token is received
 
-    async for item in response:
-        span.add_event(name=f"{SpanAttributes.LLM_CONTENT_COMPLETION_CHUNK}")
+    try:
+        async for item in response:
+            item_to_yield = item
 
-        item_to_yield = item
+            if first_token and streaming_time_to_first_token:
+                time_of_first_token = time.time()
+                streaming_time_to_first_token.record(time_of_first_token - start_time)
+                first_token = False
 
-        if first_token and streaming_time_to_first_token:
-            time_of_first_token = time.time()
-            streaming_time_to_first_token.record(time_of_first_token - start_time)
-            first_token = False
+            accumulator.add(item)
+            _add_chunk_event(span, accumulator.chunk_count)
 
-        _accumulate_stream_items(item, complete_response)
+            yield item_to_yield
+    finally:
+        end_request(in_flight)
 
-        yield item_to_yield
+    complete_response = accumulator.to_response()
+    _set_span_attribute(span, CHUNK_COUNT_ATTRIBUTE, accumulator.chunk_count)
 
     shared_attributes = {
         SpanAttributes.LLM_RESPONSE_MODEL: complete_response.get("model") or None,
@@ -747,11 +789,6 @@ async def _abuild_from_streaming_response(
         "stream": True,
     }
 
-    if not is_azure_openai(instance):
-        _set_streaming_token_metrics(
-            request_kwargs, complete_response, span, token_counter, shared_attributes
-        )
-
     # choice metrics
     if choice_counter and complete_response.get("choices"):
         _set_choice_counter_metrics(
@@ -768,34 +805,16 @@ async def _abuild_from_streaming_response(
     if streaming_time_to_generate and time_of_first_token:
         streaming_time_to_generate.record(time.time() - time_of_first_token)
 
-    _set_response_attributes(span, complete_response)
-
-    if should_send_prompts():
-        _set_completions(span, complete_response.get("choices"))
-
-    span.set_status(Status(StatusCode.OK))
-    span.end()
-
-
-def _accumulate_stream_items(item, complete_response):
-    if is_openai_v1():
-        item = model_as_dict(item)
-
-    complete_response["model"] = item.get("model")
-
-    for choice in item.get("choices"):
-        index = choice.get("index")
-        if len(complete_response.get("choices")) <= index:
-            complete_response["choices"].append(
-                {"index": index, "message": {"content": "", "role": ""}}
-            )
-        complete_choice = complete_response.get("choices")[index]
-        if choice.get("finish_reason"):
-            complete_choice["finish_reason"] = choice.get("finish_reason")
+    _finish_streaming_span(
+        span, request_kwargs, complete_response, token_counter, shared_attributes
+    )
 
-        delta = choice.get("delta")
 
-        if delta and delta.get("content"):
-            complete_choice["message"]["content"] += delta.get("content")
-        if delta and delta.get("role"):
-            complete_choice["message"]["role"] = delta.get("role")
+def _add_chunk_event(span, chunk_count):
+    # events for every chunk would be held in memory until export, so only sample them
+    interval = Config.stream_chunk_event_interval
+    if interval and (chunk_count == 1 or chunk_count % interval == 0):
+        span.add_event(
+            name=f"{SpanAttributes.LLM_CONTENT_COMPLETION_CHUNK}",
+            attributes={CHUNK_COUNT_ATTRIBUTE: chunk_count},
+        )
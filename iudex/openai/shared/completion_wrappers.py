@@ -1,4 +1,5 @@
 import logging
+import time
 
 from opentelemetry import context as context_api
 from opentelemetry.context import _SUPPRESS_INSTRUMENTATION_KEY
@@ -19,6 +20,9 @@ from ..shared import (
     should_record_stream_token_usage,
     should_send_prompts,
 )
+from .in_flight import end_request, start_request
+from .stream_accumulator import CHUNK_COUNT_ATTRIBUTE, StreamAccumulator
+from .token_counting import finish_with_token_count
 from ..utils import _with_tracer_wrapper, dont_throw, is_openai_v1
 
 SPAN_NAME = "openai.completion"
@@ -40,12 +44,18 @@ def completion_wrapper(tracer, wrapped, instance, args, kwargs):
     )
 
     _handle_request(span, kwargs, instance)
-    response = wrapped(*args, **kwargs)
+    in_flight = start_request("completion", kwargs.get("model"), instance)
+    try:
+        response = wrapped(*args, **kwargs)
+    except Exception:
+        end_request(in_flight)
+        raise
 
     if is_streaming_response(response):
         # span will be closed after the generator is done
-        return _build_from_streaming_response(span, kwargs, response)
+        return _build_from_streaming_response(span, kwargs, response, in_flight)
     else:
+        end_request(in_flight)
         _handle_response(response, span)
 
     span.end()
@@ -64,12 +74,18 @@ async def acompletion_wrapper(tracer, wrapped, instance, args, kwargs):
     )
 
     _handle_request(span, kwargs, instance)
-    response = await wrapped(*args, **kwargs)
+    in_flight = start_request("completion", kwargs.get("model"), instance)
+    try:
+        response = await wrapped(*args, **kwargs)
+    except Exception:
+        end_request(in_flight)
+        raise
 
     if is_streaming_response(response):
         # span will be closed after the generator is done
-        return _abuild_from_streaming_response(span, kwargs, response)
+        return _abuild_from_streaming_response(span, kwargs, response, in_flight)
     else:
+        end_request(in_flight)
         _handle_response(response, span)
 
     span.end()
@@ -124,58 +140,81 @@ def _set_completions(span, choices):
 
 
 @dont_throw
-def _build_from_streaming_response(span, request_kwargs, response):
-    complete_response = {"choices": [], "model": ""}
-    for item in response:
-        yield item
-        _accumulate_streaming_response(complete_response, item)
+def _build_from_streaming_response(span, request_kwargs, response, in_flight=None):
+    accumulator = StreamAccumulator(chat=False)
+    try:
+        for item in response:
+            yield item
+            accumulator.add(item)
+    finally:
+        end_request(in_flight)
 
-    _set_response_attributes(span, complete_response)
-
-    _set_token_usage(span, request_kwargs, complete_response)
-
-    if should_send_prompts():
-        _set_completions(span, complete_response.get("choices"))
-
-    span.set_status(Status(StatusCode.OK))
-    span.end()
+    complete_response = accumulator.to_response()
+    _set_span_attribute(span, CHUNK_COUNT_ATTRIBUTE, accumulator.chunk_count)
+    _finish_streaming_span(span, request_kwargs, complete_response)
 
 
 @dont_throw
-async def _abuild_from_streaming_response(span, request_kwargs, response):
-    complete_response = {"choices": [], "model": ""}
-    async for item in response:
-        yield item
-        _accumulate_streaming_response(complete_response, item)
-
-    _set_response_attributes(span, complete_response)
-
-    _set_token_usage(span, request_kwargs, complete_response)
-
-    if should_send_prompts():
-        _set_completions(span, complete_response.get("choices"))
-
-    span.set_status(Status(StatusCode.OK))
-    span.end()
+async def _abuild_from_streaming_response(span, request_kwargs, response, in_flight=None):
+    accumulator = StreamAccumulator(chat=False)
+    try:
+        async for item in response:
+            yield item
+            accumulator.add(item)
+    finally:
+        end_request(in_flight)
+
+    complete_response = accumulator.to_response()
+    _set_span_attribute(span, CHUNK_COUNT_ATTRIBUTE, accumulator.chunk_count)
+    _finish_streaming_span(span, request_kwargs, complete_response)
+
+
+def _finish_streaming_span(span, request_kwargs, complete_response):
+    # tokens are counted on the token counting worker, which then ends the span
+    end_time = time.time_ns()
+
+    def finish(count_tokens):
+        try:
+            _set_response_attributes(span, complete_response)
+            _set_token_usage(span, request_kwargs, complete_response, count_tokens)
+
+            if should_send_prompts():
+                _set_completions(span, complete_response.get("choices"))
+
+            span.set_status(Status(StatusCode.OK))
+        finally:
+            span.end(end_time=end_time)
+
+    finish_with_token_count(
+        finish, should_record_stream_token_usage() and not complete_response.get("usage")
+    )
 
 
 @dont_throw
-def _set_token_usage(span, request_kwargs, complete_response):
+def _set_token_usage(
+    span, request_kwargs, complete_response, count_tokens=get_token_count_from_string
+):
     # use tiktoken calculate token usage
     if should_record_stream_token_usage():
         prompt_usage = -1
         completion_usage = -1
 
-        # prompt_usage
-        if request_kwargs and request_kwargs.get("prompt"):
+        # streams report usage when requested with stream_options
+        usage = complete_response.get("usage")
+        if usage:
+            prompt_usage = usage.get("prompt_tokens", -1)
+            completion_usage = usage.get("completion_tokens", -1)
+
+        # prompt_usage, if no usage
+        if prompt_usage == -1 and request_kwargs and request_kwargs.get("prompt"):
             prompt_content = request_kwargs.get("prompt")
             model_name = request_kwargs.get("model") or None
 
             if model_name:
-                prompt_usage = get_token_count_from_string(prompt_content, model_name)
+                prompt_usage = count_tokens(prompt_content, model_name)
 
-        # completion_usage
-        if complete_response.get("choices"):
+        # completion_usage, if no usage
+        if completion_usage == -1 and complete_response.get("choices"):
             completion_content = ""
             model_name = complete_response.get("model") or None
 
@@ -184,30 +223,7 @@ def _set_token_usage(span, request_kwargs, complete_response):
                     completion_content += choice.get("text")
 
             if model_name:
-                completion_usage = get_token_count_from_string(
-                    completion_content, model_name
-                )
+                completion_usage = count_tokens(completion_content, model_name)
 
         # span record
         _set_span_stream_usage(span, prompt_usage, completion_usage)
-
-
-@dont_throw
-def _accumulate_streaming_response(complete_response, item):
-    if is_openai_v1():
-        item = model_as_dict(item)
-
-    complete_response["model"] = item.get("model")
-
-    for choice in item.get("choices"):
-        index = choice.get("index")
-        if len(complete_response.get("choices")) <= index:
-            complete_response["choices"].append({"index": index, "text": ""})
-        complete_choice = complete_response.get("choices")[index]
-        if choice.get("finish_reason"):
-            complete_choice["finish_reason"] = choice.get("finish_reason")
-
-        if choice.get("text"):
-            complete_choice["text"] += choice.get("text")
-
-    return complete_response
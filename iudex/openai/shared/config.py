@@ -2,3 +2,22 @@ class Config:
     enrich_token_usage = False
     enrich_assistant = False
     exception_logger = None
+    # add a chunk event for the first and every nth streamed chunk, 0 for none
+    stream_chunk_event_interval = 0
+    # embedding inputs recorded as prompt attributes, a digest of the whole batch covers the rest
+    max_embedding_prompts = 16
+    # count streamed tokens on a worker thread, which then ends the span
+    background_token_count = True
+    token_count_workers = 1
+    # queued spans beyond this count their tokens inline
+    token_count_max_pending = 256
+    approximate_token_count_when_busy = False
+    token_count_cache_size = 1024
+    # tiktoken encodings to load in the background at instrument time, and where from
+    preload_encodings = ()
+    tiktoken_dir = None
+    # assistants and runs are kept to build assistant run spans, bounded for long-running workers
+    assistant_cache_size = 1024
+    assistant_cache_ttl = 600
+    run_cache_size = 10_000
+    run_cache_ttl = 3600
@@ -1,5 +1,8 @@
+import hashlib
+import itertools
 import logging
 import time
+from typing import Sequence
 
 from opentelemetry import context as context_api
 from opentelemetry.context import _SUPPRESS_INSTRUMENTATION_KEY
@@ -19,6 +22,10 @@ from ..shared import (
     model_as_dict,
     should_send_prompts,
 )
+from .config import Config
+from .in_flight import end_request, start_request
+from .rate_limits import end_call_telemetry, record_call_telemetry, start_call_telemetry
+from .token_counting import APPROXIMATE_CHARS_PER_TOKEN
 from ..utils import (
     _with_embeddings_telemetry_wrapper,
     dont_throw,
@@ -29,6 +36,18 @@ from ..utils import (
 SPAN_NAME = "openai.embeddings"
 LLM_REQUEST_TYPE = LLMRequestTypeValues.EMBEDDING
 
+INPUT_COUNT_ATTRIBUTE = "llm.embeddings.input_count"
+# tokens per input, exact for token array inputs and estimated from the length of strings
+INPUT_TOKENS_ESTIMATED_MIN_ATTRIBUTE = "llm.embeddings.input_tokens.estimated_min"
+INPUT_TOKENS_ESTIMATED_MAX_ATTRIBUTE = "llm.embeddings.input_tokens.estimated_max"
+INPUT_TOKENS_ESTIMATED_MEAN_ATTRIBUTE = "llm.embeddings.input_tokens.estimated_mean"
+# exact tokens per input, from the response's usage
+INPUT_TOKENS_MEAN_ATTRIBUTE = "llm.embeddings.input_tokens.mean"
+# blake2b of all inputs, set when only the first max_embedding_prompts are recorded
+INPUT_DIGEST_ATTRIBUTE = "llm.embeddings.input_digest"
+VECTOR_COUNT_ATTRIBUTE = "llm.embeddings.vector_count"
+DIMENSIONS_ATTRIBUTE = "llm.embeddings.dimensions"
+
 logger = logging.getLogger(__name__)
 
 
@@ -54,6 +73,8 @@ def embeddings_wrapper(
     ) as span:
         _handle_request(span, kwargs, instance)
 
+        call, call_token = start_call_telemetry()
+        in_flight = start_request("embeddings", kwargs.get("model"), instance)
         try:
             # record time for duration
             start_time = time.time()
@@ -72,7 +93,15 @@ def embeddings_wrapper(
             if exception_counter:
                 exception_counter.add(1, attributes=attributes)
 
+            record_call_telemetry(
+                span, call, kwargs.get("model"), _get_openai_base_url(instance), e
+            )
             raise e
+        finally:
+            end_call_telemetry(call_token)
+            end_request(in_flight)
+
+        record_call_telemetry(span, call, kwargs.get("model"), _get_openai_base_url(instance))
 
         duration = end_time - start_time
 
@@ -111,6 +140,8 @@ async def aembeddings_wrapper(
         attributes={SpanAttributes.LLM_REQUEST_TYPE: LLM_REQUEST_TYPE.value},
     ) as span:
         _handle_request(span, kwargs, instance)
+        call, call_token = start_call_telemetry()
+        in_flight = start_request("embeddings", kwargs.get("model"), instance)
         try:
             # record time for duration
             start_time = time.time()
@@ -129,7 +160,15 @@ async def aembeddings_wrapper(
             if exception_counter:
                 exception_counter.add(1, attributes=attributes)
 
+            record_call_telemetry(
+                span, call, kwargs.get("model"), _get_openai_base_url(instance), e
+            )
             raise e
+        finally:
+            end_call_telemetry(call_token)
+            end_request(in_flight)
+
+        record_call_telemetry(span, call, kwargs.get("model"), _get_openai_base_url(instance))
 
         duration = end_time - start_time
         _handle_response(
@@ -148,8 +187,10 @@ async def aembeddings_wrapper(
 @dont_throw
 def _handle_request(span, kwargs, instance):
     _set_request_attributes(span, kwargs)
+    inputs = _batch_inputs(kwargs.get("input"))
+    _set_input_attributes(span, inputs)
     if should_send_prompts():
-        _set_prompts(span, kwargs.get("input"))
+        _set_prompts(span, inputs)
     _set_client_attributes(span, instance)
 
 
@@ -164,9 +205,21 @@ def _handle_response(
     duration=None,
 ):
     if is_openai_v1():
-        response_dict = model_as_dict(response)
+        if not hasattr(response, "data") and hasattr(response, "parse"):
+            # raw API response
+            response = response.parse()
+        # everything but the vectors, dumping a large batch would copy every float
+        response_dict = {
+            "model": getattr(response, "model", None),
+            "usage": model_as_dict(response.usage) if getattr(response, "usage", None) else None,
+        }
+        data = response.data or []
+        first_embedding = data[0].embedding if data else None
     else:
         response_dict = response
+        data = response_dict.get("data") or []
+        first_embedding = data[0].get("embedding") if data else None
+    dimensions = _embedding_dimensions(first_embedding)
     # metrics record
     _set_embeddings_metrics(
         instance,
@@ -174,10 +227,28 @@ def _handle_response(
         vector_size_counter,
         duration_histogram,
         response_dict,
+        dimensions,
         duration,
     )
     # span attributes
     _set_response_attributes(span, response_dict)
+    if span.is_recording():
+        _set_span_attribute(span, VECTOR_COUNT_ATTRIBUTE, len(data))
+        _set_span_attribute(span, DIMENSIONS_ATTRIBUTE, dimensions)
+        prompt_tokens = (response_dict.get("usage") or {}).get("prompt_tokens")
+        if prompt_tokens and data:
+            # one vector per input
+            _set_span_attribute(span, INPUT_TOKENS_MEAN_ATTRIBUTE, prompt_tokens / len(data))
+
+
+def _embedding_dimensions(embedding) -> int:
+    if not embedding:
+        return 0
+    if isinstance(embedding, str):
+        # encoding_format="base64", packed float32s, sized from the base64 length alone
+        padding = len(embedding) - len(embedding.rstrip("="))
+        return (len(embedding) * 3 // 4 - padding) // 4
+    return len(embedding)
 
 
 def _set_embeddings_metrics(
@@ -186,6 +257,7 @@ def _set_embeddings_metrics(
     vector_size_counter,
     duration_histogram,
     response_dict,
+    dimensions,
     duration,
 ):
     shared_attributes = _metric_shared_attributes(
@@ -206,27 +278,68 @@ def _set_embeddings_metrics(
                 token_counter.record(val, attributes=attributes_with_token_type)
 
     # vec size metrics
-    # should use counter for vector_size?
-    vec_embedding = (response_dict.get("data") or [{}])[0].get("embedding", [])
-    vec_size = len(vec_embedding)
     if vector_size_counter:
-        vector_size_counter.add(vec_size, attributes=shared_attributes)
+        vector_size_counter.add(dimensions, attributes=shared_attributes)
 
     # duration metrics
     if duration and isinstance(duration, (float, int)) and duration_histogram:
         duration_histogram.record(duration, attributes=shared_attributes)
 
 
-def _set_prompts(span, prompt):
-    if not span.is_recording() or not prompt:
+def _batch_inputs(prompt) -> Sequence:
+    """The inputs of an embeddings request, each a string or an array of token ids.
+
+    Batches are returned as they were passed rather than copied, only their first
+    input is looked at to tell a batch from a single tokenized input.
+    """
+    if not prompt:
+        return []
+    if isinstance(prompt, str):
+        return [prompt]
+    if isinstance(next(iter(prompt)), int):
+        # a single tokenized input
+        return [prompt]
+    return prompt
+
+
+def _input_token_count(input) -> int:
+    if not isinstance(input, str):
+        return len(input)
+    # batches can hold thousands of inputs, tokenizing them would hold up the request
+    return -(-len(input) // APPROXIMATE_CHARS_PER_TOKEN)
+
+
+def _set_input_attributes(span, inputs: Sequence):
+    if not span.is_recording() or not inputs:
         return
 
-    if isinstance(prompt, list):
-        for i, p in enumerate(prompt):
-            _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.content", p)
-    else:
-        _set_span_attribute(
-            span,
-            f"{SpanAttributes.LLM_PROMPTS}.0.content",
-            prompt,
-        )
+    token_counts = [_input_token_count(input) for input in inputs]
+    _set_span_attribute(span, INPUT_COUNT_ATTRIBUTE, len(token_counts))
+    _set_span_attribute(span, INPUT_TOKENS_ESTIMATED_MIN_ATTRIBUTE, min(token_counts))
+    _set_span_attribute(span, INPUT_TOKENS_ESTIMATED_MAX_ATTRIBUTE, max(token_counts))
+    _set_span_attribute(
+        span, INPUT_TOKENS_ESTIMATED_MEAN_ATTRIBUTE, sum(token_counts) / len(token_counts)
+    )
+
+
+def _inputs_digest(inputs: Sequence) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for input in inputs:
+        if isinstance(input, str):
+            digest.update(input.encode("utf-8", "surrogatepass"))
+        else:
+            digest.update(",".join(map(str, input)).encode())
+        # separates inputs, so ["ab"] and ["a", "b"] differ
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _set_prompts(span, inputs: Sequence):
+    if not span.is_recording() or not inputs:
+        return
+
+    # batches can hold thousands of inputs, only the first few are recorded in full
+    for i, p in enumerate(itertools.islice(inputs, Config.max_embedding_prompts)):
+        _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.content", p)
+    if len(inputs) > Config.max_embedding_prompts:
+        _set_span_attribute(span, INPUT_DIGEST_ATTRIBUTE, _inputs_digest(inputs))
@@ -7,6 +7,7 @@ from opentelemetry.metrics import Counter, Histogram
 from .. import is_openai_v1
 from ..shared import _get_openai_base_url, _metric_shared_attributes, model_as_dict
 from ..utils import _with_image_gen_metric_wrapper
+from .in_flight import end_request, start_request
 
 
 @_with_image_gen_metric_wrapper
@@ -21,6 +22,7 @@ def image_gen_metrics_wrapper(
     if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
         return wrapped(*args, **kwargs)
 
+    in_flight = start_request("image_gen", kwargs.get("model"), instance)
     try:
         # record time for duration
         start_time = time.time()
@@ -40,6 +42,8 @@ def image_gen_metrics_wrapper(
             exception_counter.add(1, attributes=attributes)
 
         raise e
+    finally:
+        end_request(in_flight)
 
     if is_openai_v1():
         response_dict = model_as_dict(response)
@@ -0,0 +1,45 @@
+from typing import Dict, Optional
+
+from opentelemetry.semconv.ai import SpanAttributes
+
+from . import _get_openai_base_url
+
+IN_FLIGHT_METRIC = "gen_ai.client.requests.in_flight"
+
+_requests_in_flight = None
+
+
+def init_in_flight_metrics(meter):
+    global _requests_in_flight
+    _requests_in_flight = (
+        meter.create_up_down_counter(
+            name=IN_FLIGHT_METRIC,
+            unit="{request}",
+            description="OpenAI requests sent and waiting on a response",
+        )
+        if meter is not None
+        else None
+    )
+
+
+def start_request(operation: str, model: Optional[str], instance) -> Optional[Dict[str, str]]:
+    """Counts a request as in flight, until `end_request` with the attributes returned.
+
+    Streamed requests stay in flight until the stream is exhausted, fails or is closed,
+    so the callers hand the attributes to the stream wrapper instead of ending them.
+    """
+    if _requests_in_flight is None:
+        return None
+    attributes = {
+        SpanAttributes.LLM_SYSTEM: "openai",
+        SpanAttributes.LLM_REQUEST_MODEL: model or "",
+        "gen_ai.operation.name": operation,
+        "server.address": _get_openai_base_url(instance),
+    }
+    _requests_in_flight.add(1, attributes=attributes)
+    return attributes
+
+
+def end_request(attributes: Optional[Dict[str, str]]):
+    if attributes is not None and _requests_in_flight is not None:
+        _requests_in_flight.add(-1, attributes=attributes)
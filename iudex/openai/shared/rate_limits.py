@@ -0,0 +1,170 @@
+import logging
+import re
+from contextvars import ContextVar, Token
+from typing import Dict, Optional, Tuple
+
+from opentelemetry.semconv.ai import SpanAttributes
+
+from ..utils import dont_throw
+
+logger = logging.getLogger(__name__)
+
+# response header -> span attribute, limits and remaining counts are ints, resets are seconds
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "gen_ai.openai.ratelimit.limit_requests",
+    "x-ratelimit-limit-tokens": "gen_ai.openai.ratelimit.limit_tokens",
+    "x-ratelimit-remaining-requests": "gen_ai.openai.ratelimit.remaining_requests",
+    "x-ratelimit-remaining-tokens": "gen_ai.openai.ratelimit.remaining_tokens",
+    "x-ratelimit-reset-requests": "gen_ai.openai.ratelimit.reset_requests",
+    "x-ratelimit-reset-tokens": "gen_ai.openai.ratelimit.reset_tokens",
+}
+RETRY_COUNT_ATTRIBUTE = "gen_ai.openai.retry.count"
+RETRY_BACKOFF_ATTRIBUTE = "gen_ai.openai.retry.backoff"
+
+# e.g. "6m0s", "1.5s", "20ms"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def _parse_header_value(header: str, value: str):
+    if header.startswith("x-ratelimit-reset-"):
+        parts = _DURATION_PART.findall(value)
+        if not parts:
+            return None
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+class CallTelemetry:
+    """Rate limit headers, retries and backoff of one wrapped OpenAI call, filled in by the SDK hooks."""
+
+    __slots__ = ("headers", "retries", "backoff")
+
+    def __init__(self):
+        self.headers: Dict[str, str] = {}
+        self.retries = 0
+        self.backoff = 0.0
+
+    def record_headers(self, headers):
+        if not headers:
+            return
+        for name in RATE_LIMIT_HEADERS:
+            value = headers.get(name)
+            if value is not None:
+                self.headers[name] = value
+
+
+_current_call: ContextVar[Optional[CallTelemetry]] = ContextVar(
+    "iudex_openai_call_telemetry", default=None
+)
+
+
+class _RateLimitMetrics:
+    def __init__(self, meter):
+        self.remaining_requests = meter.create_gauge(
+            name="gen_ai.openai.ratelimit.remaining_requests",
+            unit="{request}",
+            description="Requests left in the rate limit window, from the last response",
+        )
+        self.remaining_tokens = meter.create_gauge(
+            name="gen_ai.openai.ratelimit.remaining_tokens",
+            unit="{token}",
+            description="Tokens left in the rate limit window, from the last response",
+        )
+        self.retries = meter.create_histogram(
+            name="gen_ai.openai.retry.count",
+            unit="{retry}",
+            description="Number of retries the OpenAI SDK made per call",
+        )
+        self.backoff = meter.create_histogram(
+            name="gen_ai.openai.retry.backoff",
+            unit="s",
+            description="Time the OpenAI SDK spent backing off between retries of a call",
+        )
+
+
+_metrics: Optional[_RateLimitMetrics] = None
+
+
+def init_rate_limit_metrics(meter):
+    global _metrics
+    _metrics = _RateLimitMetrics(meter) if meter is not None else None
+
+
+def start_call_telemetry() -> Tuple[CallTelemetry, Token]:
+    call = CallTelemetry()
+    return call, _current_call.set(call)
+
+
+def end_call_telemetry(token: Token):
+    _current_call.reset(token)
+
+
+@dont_throw
+def record_call_telemetry(
+    span,
+    call: CallTelemetry,
+    model: Optional[str],
+    server_address: str,
+    error: Optional[BaseException] = None,
+):
+    """Sets the call's rate limit and retry attributes on span, and records its metrics."""
+    # API errors, like the 429 that exhausted the retries, carry their response
+    response = getattr(error, "response", None)
+    if response is not None:
+        call.record_headers(getattr(response, "headers", None))
+
+    attributes = {}
+    for header, value in call.headers.items():
+        parsed = _parse_header_value(header, value)
+        if parsed is not None:
+            attributes[RATE_LIMIT_HEADERS[header]] = parsed
+    attributes[RETRY_COUNT_ATTRIBUTE] = call.retries
+    if call.retries:
+        attributes[RETRY_BACKOFF_ATTRIBUTE] = call.backoff
+    if span.is_recording():
+        span.set_attributes(attributes)
+
+    if _metrics is None:
+        return
+    metric_attributes = {
+        SpanAttributes.LLM_SYSTEM: "openai",
+        SpanAttributes.LLM_REQUEST_MODEL: model,
+        "server.address": server_address,
+    }
+    remaining_requests = attributes.get(RATE_LIMIT_HEADERS["x-ratelimit-remaining-requests"])
+    if remaining_requests is not None:
+        _metrics.remaining_requests.set(remaining_requests, attributes=metric_attributes)
+    remaining_tokens = attributes.get(RATE_LIMIT_HEADERS["x-ratelimit-remaining-tokens"])
+    if remaining_tokens is not None:
+        _metrics.remaining_tokens.set(remaining_tokens, attributes=metric_attributes)
+    _metrics.retries.record(call.retries, attributes=metric_attributes)
+    if call.retries:
+        _metrics.backoff.record(call.backoff, attributes=metric_attributes)
+
+
+# hooks on the v1 SDK's base client, they only read response headers, never bodies
+
+
+def process_response_wrapper(wrapped, instance, args, kwargs):
+    call = _current_call.get()
+    if call is not None:
+        response = kwargs.get("response")
+        if response is not None:
+            call.record_headers(response.headers)
+    return wrapped(*args, **kwargs)
+
+
+def calculate_retry_timeout_wrapper(wrapped, instance, args, kwargs):
+    timeout = wrapped(*args, **kwargs)
+    call = _current_call.get()
+    if call is not None:
+        call.retries += 1
+        call.backoff += timeout
+        # a 429 carries the rate limit headers, even when retries then run out
+        headers = kwargs.get("response_headers", args[2] if len(args) > 2 else None)
+        call.record_headers(headers)
+    return timeout
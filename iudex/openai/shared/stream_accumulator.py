@@ -0,0 +1,197 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from ..utils import is_openai_v1
+
+logger = logging.getLogger(__name__)
+
+# prevent weird index values from growing the choices list
+MAX_CHOICE_INDEX = 1000
+
+CHUNK_COUNT_ATTRIBUTE = "llm.response.chunk_count"
+
+
+def _field(obj: Any, name: str) -> Any:
+    """Reads a field from a v1 pydantic chunk or a v0 dict-like chunk without dumping it."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _as_dict(obj: Any) -> Optional[Dict[str, Any]]:
+    if obj is None or isinstance(obj, dict):
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    return dict(vars(obj))
+
+
+class _ChoiceBuffer:
+    __slots__ = (
+        "index",
+        "role",
+        "finish_reason",
+        "content_parts",
+        "tool_name_parts",
+        "tool_arguments_parts",
+    )
+
+    def __init__(self, index: int):
+        self.index = index
+        self.role = ""
+        self.finish_reason = None
+        self.content_parts: List[str] = []
+        self.tool_name_parts: Optional[List[str]] = None
+        self.tool_arguments_parts: Optional[List[str]] = None
+
+
+class StreamAccumulator:
+    """Builds the complete response of a streamed chat or text completion in linear time.
+
+    Deltas are appended to per-choice list buffers and joined once in `to_response`,
+    and chunk fields are read directly instead of dumping every chunk to a dict.
+    `add` is picked once per stream, for v1 pydantic chunks or v0 dict chunks.
+    """
+
+    __slots__ = ("add", "chat", "model", "usage", "system_fingerprint", "chunk_count", "_choices")
+
+    def __init__(self, chat: bool = True):
+        self.add = self._add_model if is_openai_v1() else self._add_dict
+        self.chat = chat
+        self.model = ""
+        self.usage: Optional[Dict[str, Any]] = None
+        self.system_fingerprint = None
+        self.chunk_count = 0
+        self._choices: List[_ChoiceBuffer] = []
+
+    def _choice_buffer(self, index: Optional[int]) -> Optional[_ChoiceBuffer]:
+        if index is None or index > MAX_CHOICE_INDEX:
+            logger.warning(f"Skipping invalid choice with index: {index}")
+            return None
+        while len(self._choices) <= index:
+            self._choices.append(_ChoiceBuffer(len(self._choices)))
+        return self._choices[index]
+
+    def _add_model(self, chunk: Any):
+        self.chunk_count += 1
+        if chunk.model:
+            self.model = chunk.model
+        # not present on chunks of older SDK versions
+        fingerprint = getattr(chunk, "system_fingerprint", None)
+        if fingerprint:
+            self.system_fingerprint = fingerprint
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            self.usage = _as_dict(usage)
+
+        for choice in chunk.choices or ():
+            buffer = self._choice_buffer(choice.index)
+            if buffer is None:
+                continue
+            if choice.finish_reason:
+                buffer.finish_reason = choice.finish_reason
+
+            if not self.chat:
+                if choice.text:
+                    buffer.content_parts.append(choice.text)
+                continue
+
+            delta = choice.delta
+            if not delta:
+                continue
+            if delta.content:
+                buffer.content_parts.append(delta.content)
+            if delta.role:
+                buffer.role = delta.role
+            if delta.tool_calls:
+                self._add_tool_call_delta(buffer, delta.tool_calls[0])
+
+    def _add_dict(self, chunk: Any):
+        self.chunk_count += 1
+        model = _field(chunk, "model")
+        if model:
+            self.model = model
+        fingerprint = _field(chunk, "system_fingerprint")
+        if fingerprint:
+            self.system_fingerprint = fingerprint
+        usage = _field(chunk, "usage")
+        if usage:
+            self.usage = _as_dict(usage)
+
+        for choice in _field(chunk, "choices") or ():
+            buffer = self._choice_buffer(_field(choice, "index"))
+            if buffer is None:
+                continue
+            finish_reason = _field(choice, "finish_reason")
+            if finish_reason:
+                buffer.finish_reason = finish_reason
+
+            if not self.chat:
+                text = _field(choice, "text")
+                if text:
+                    buffer.content_parts.append(text)
+                continue
+
+            delta = _field(choice, "delta")
+            if not delta:
+                continue
+            content = _field(delta, "content")
+            if content:
+                buffer.content_parts.append(content)
+            role = _field(delta, "role")
+            if role:
+                buffer.role = role
+            tool_calls = _field(delta, "tool_calls")
+            if tool_calls:
+                self._add_tool_call_delta(buffer, tool_calls[0])
+
+    @staticmethod
+    def _add_tool_call_delta(buffer: _ChoiceBuffer, tool_call: Any):
+        # only the first tool call is recorded, matching the non-streamed completions
+        if buffer.tool_name_parts is None:
+            buffer.tool_name_parts = []
+            buffer.tool_arguments_parts = []
+        function = _field(tool_call, "function")
+        name = _field(function, "name")
+        if name:
+            buffer.tool_name_parts.append(name)
+        arguments = _field(function, "arguments")
+        if arguments:
+            buffer.tool_arguments_parts.append(arguments)
+
+    def to_response(self) -> Dict[str, Any]:
+        """The accumulated response, shaped like a non-streamed response dict."""
+        choices = []
+        for buffer in self._choices:
+            choice: Dict[str, Any] = {"index": buffer.index}
+            if buffer.finish_reason:
+                choice["finish_reason"] = buffer.finish_reason
+            if not self.chat:
+                choice["text"] = "".join(buffer.content_parts)
+            else:
+                message: Dict[str, Any] = {
+                    "content": "".join(buffer.content_parts),
+                    "role": buffer.role,
+                }
+                if buffer.tool_name_parts is not None:
+                    message["tool_calls"] = [
+                        {
+                            "function": {
+                                "name": "".join(buffer.tool_name_parts),
+                                "arguments": "".join(buffer.tool_arguments_parts),
+                            }
+                        }
+                    ]
+                choice["message"] = message
+            choices.append(choice)
+
+        response: Dict[str, Any] = {"choices": choices, "model": self.model}
+        if self.usage:
+            response["usage"] = self.usage
+        if self.system_fingerprint:
+            response["system_fingerprint"] = self.system_fingerprint
+        return response
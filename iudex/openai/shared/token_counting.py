@@ -0,0 +1,351 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Collection, Dict, Hashable, Optional
+
+from .config import Config
+from ..utils import should_record_stream_token_usage
+
+DEFAULT_MODEL_FOR_ENCODING = "gpt-4"
+
+# rough average of characters per token of English text in OpenAI encodings
+APPROXIMATE_CHARS_PER_TOKEN = 4
+
+# chat formatting overhead, per the OpenAI cookbook's num_tokens_from_messages:
+# every message is wrapped in <|start|>{role/name}\n{content}<|end|>\n,
+# and every reply is primed with <|start|>assistant<|message|>
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3
+
+# encodings most current models use
+DEFAULT_PRELOAD_ENCODINGS = ("cl100k_base", "o200k_base")
+
+# tiktoken encodings by encoding name, so all models sharing an encoding share one encoder,
+# None for encodings that failed to load
+tiktoken_encodings: Dict[str, Any] = {}
+_model_encoding_names: Dict[str, str] = {}
+_encodings_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+CountTokens = Callable[[str, str], Optional[int]]
+
+
+class TokenCountCache:
+    """Thread safe LRU of token counts, keyed by a hash of the text so prompts aren't retained.
+
+    System prompts and conversation history are resent on every call, so their counts repeat.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._counts: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(namespace: str, text: str) -> Hashable:
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        return namespace, digest
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+            return count
+
+    def put(self, key: Hashable, count: int):
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+_token_count_cache: Optional[TokenCountCache] = None
+_token_count_cache_lock = threading.Lock()
+
+
+def get_token_count_cache() -> TokenCountCache:
+    """The shared token count cache, rebuilt when `Config.token_count_cache_size` changes."""
+    global _token_count_cache
+    cache = _token_count_cache
+    if cache is None or cache.maxsize != Config.token_count_cache_size:
+        with _token_count_cache_lock:
+            cache = _token_count_cache
+            if cache is None or cache.maxsize != Config.token_count_cache_size:
+                cache = _token_count_cache = TokenCountCache(Config.token_count_cache_size)
+    return cache
+
+
+def _tiktoken_encoding_name(model_name: str) -> str:
+    import tiktoken
+
+    if hasattr(tiktoken, "encoding_name_for_model"):
+        return tiktoken.encoding_name_for_model(model_name)
+    # tiktoken < 0.5 can only look up the encoding itself, which loads the BPE
+    return tiktoken.encoding_for_model(model_name).name
+
+
+def encoding_name_for_model(model_name: str) -> str:
+    encoding_name = _model_encoding_names.get(model_name)
+    if encoding_name is None:
+        try:
+            encoding_name = _tiktoken_encoding_name(model_name)
+        except KeyError as e:
+            # no such model_name in tiktoken
+            logger.debug(
+                f"Failed to get tiktoken encoding for model_name {model_name}, defaulting to cl100k_base (gpt-4). Error:\n{str(e)}"
+            )
+            encoding_name = _tiktoken_encoding_name(DEFAULT_MODEL_FOR_ENCODING)
+        _model_encoding_names[model_name] = encoding_name
+    return encoding_name
+
+
+def get_encoding(encoding_name: str):
+    """The tiktoken encoding, loaded once per process, or None if it can't be loaded."""
+    if encoding_name in tiktoken_encodings:
+        return tiktoken_encodings[encoding_name]
+
+    # the preload thread and request threads would otherwise both load the BPE
+    with _encodings_lock:
+        if encoding_name not in tiktoken_encodings:
+            import tiktoken
+
+            try:
+                tiktoken_encodings[encoding_name] = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                # don't retry, without network access every attempt would wait on a download
+                logger.warning(f"Failed to load tiktoken encoding {encoding_name}: {e}")
+                tiktoken_encodings[encoding_name] = None
+        return tiktoken_encodings[encoding_name]
+
+
+def preload_encodings(
+    encoding_names: Collection[str] = DEFAULT_PRELOAD_ENCODINGS,
+    tiktoken_dir: Optional[str] = None,
+) -> threading.Thread:
+    """Loads tiktoken encodings in a background thread, ahead of the first streamed response.
+
+    Args:
+        encoding_names: Encodings to load, e.g. "o200k_base".
+        tiktoken_dir: Local tiktoken cache directory to load them from instead of downloading.
+            Populate it on a connected machine with
+            `TIKTOKEN_CACHE_DIR=<dir> python -c "import tiktoken; tiktoken.get_encoding('o200k_base')"`.
+            tiktoken only reads it from the `TIKTOKEN_CACHE_DIR` environment variable, which is
+            set for the whole process, and left as is if it's already set.
+    """
+    if tiktoken_dir and not os.environ.get("TIKTOKEN_CACHE_DIR"):
+        os.environ["TIKTOKEN_CACHE_DIR"] = tiktoken_dir
+    elif tiktoken_dir and os.environ["TIKTOKEN_CACHE_DIR"] != tiktoken_dir:
+        logger.warning(
+            f"TIKTOKEN_CACHE_DIR is already set to {os.environ['TIKTOKEN_CACHE_DIR']}, ignoring tiktoken_dir {tiktoken_dir}"
+        )
+
+    def load():
+        for encoding_name in encoding_names:
+            get_encoding(encoding_name)
+
+    thread = threading.Thread(target=load, name="iudex-tiktoken-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def _encode_count(string: str, encoding_name: str):
+    encoding = get_encoding(encoding_name)
+    if not encoding:
+        return None
+    return len(encoding.encode(string))
+
+
+def get_token_count_from_string(string: str, model_name: str):
+    if not should_record_stream_token_usage():
+        return None
+
+    encoding_name = encoding_name_for_model(model_name)
+    token_count_cache = get_token_count_cache()
+    key = token_count_cache.key(encoding_name, string)
+    token_count = token_count_cache.get(key)
+    if token_count is not None:
+        return token_count
+
+    token_count = _encode_count(string, encoding_name)
+    if token_count is not None:
+        token_count_cache.put(key, token_count)
+    return token_count
+
+
+def _message_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # content parts, only text parts are tokenized
+        return "".join(
+            part.get("text") or ""
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    return ""
+
+
+def _message_token_count(role: str, name, content: str, model_or_encoding: str, count_tokens):
+    counts = [count_tokens(role, model_or_encoding), count_tokens(content, model_or_encoding)]
+    if name:
+        counts.append(count_tokens(name, model_or_encoding))
+    if any(count is None for count in counts):
+        return None
+    return TOKENS_PER_MESSAGE + sum(counts) + (TOKENS_PER_NAME if name else 0)
+
+
+def get_message_token_count(message, model_name: str, count_tokens: Optional[CountTokens] = None):
+    """Tokens of one chat message, including its formatting overhead.
+
+    Exact counts are cached per message, keyed by encoding, role, name and a hash of the
+    content, so only the new messages of each conversation turn are tokenized.
+    """
+    role = message.get("role") or ""
+    name = message.get("name")
+    content = _message_text(message.get("content"))
+    if count_tokens is not None and count_tokens is not get_token_count_from_string:
+        return _message_token_count(role, name, content, model_name, count_tokens)
+
+    encoding_name = encoding_name_for_model(model_name)
+    token_count_cache = get_token_count_cache()
+    key = token_count_cache.key(f"{encoding_name}\0{role}\0{name or ''}", content)
+    token_count = token_count_cache.get(key)
+    if token_count is None:
+        token_count = _message_token_count(role, name, content, encoding_name, _encode_count)
+        if token_count is not None:
+            token_count_cache.put(key, token_count)
+    return token_count
+
+
+def get_prompt_token_count(messages, model_name: str, count_tokens: Optional[CountTokens] = None):
+    """Tokens of a chat prompt, counted per message so earlier turns come from the cache."""
+    if not should_record_stream_token_usage():
+        return None
+
+    token_count = TOKENS_PER_REPLY
+    for message in messages:
+        message_count = get_message_token_count(message, model_name, count_tokens)
+        if message_count is None:
+            return None
+        token_count += message_count
+    return token_count
+
+
+def estimate_token_count_from_string(string: str, model_name: str):
+    """Approximate token count from the text length, used when the counting workers are busy."""
+    if not should_record_stream_token_usage():
+        return None
+    return -(-len(string) // APPROXIMATE_CHARS_PER_TOKEN)
+
+
+class TokenCountingWorker:
+    """Counts the tokens of streamed responses off the request thread or event loop.
+
+    `finish` callbacks take the token counting function to use and finish the span.
+    The worker threads are started on the first submit, and restarted if
+    `Config.token_count_workers` has changed since. At most `Config.token_count_max_pending` of them are queued, beyond that they run
+    inline, with the approximate counter if `Config.approximate_token_count_when_busy` is set.
+    """
+
+    def __init__(self):
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = 0
+
+    def submit(self, finish: Callable[[CountTokens], None]):
+        with self._lock:
+            busy = self._pending >= Config.token_count_max_pending
+            if not busy:
+                self._pending += 1
+                if self._executor is None or self._max_workers != Config.token_count_workers:
+                    if self._executor is not None:
+                        # queued counts still finish on the old threads
+                        self._executor.shutdown(wait=False)
+                    self._max_workers = Config.token_count_workers
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._max_workers, thread_name_prefix="iudex-token-count"
+                    )
+                executor = self._executor
+
+        if busy:
+            logger.debug("Token counting workers are busy, counting inline")
+            finish(
+                estimate_token_count_from_string
+                if Config.approximate_token_count_when_busy
+                else get_token_count_from_string
+            )
+            return
+
+        try:
+            executor.submit(self._run, finish)
+        except RuntimeError:
+            # interpreter shutting down
+            self._done()
+            finish(get_token_count_from_string)
+
+    def _run(self, finish: Callable[[CountTokens], None]):
+        try:
+            finish(get_token_count_from_string)
+        except Exception as e:
+            logger.debug(f"Failed to finish span after counting tokens: {e}")
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _reset_after_fork(self):
+        # the parent's worker threads don't exist in the child
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = None
+        self._max_workers = 0
+
+
+_token_counting_worker: Optional[TokenCountingWorker] = None
+_token_counting_worker_lock = threading.Lock()
+
+
+def get_token_counting_worker() -> TokenCountingWorker:
+    global _token_counting_worker
+    if _token_counting_worker is None:
+        with _token_counting_worker_lock:
+            if _token_counting_worker is None:
+                _token_counting_worker = TokenCountingWorker()
+    return _token_counting_worker
+
+
+def _reset_token_counting_worker():
+    global _token_counting_worker_lock
+    _token_counting_worker_lock = threading.Lock()
+    if _token_counting_worker is not None:
+        _token_counting_worker._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_token_counting_worker)
+
+
+def finish_with_token_count(finish: Callable[[CountTokens], None], count_needed: bool):
+    """Runs `finish`, on the token counting worker if it has to tokenize content.
+
+    Token counting is only needed when `enrich_token_usage` is on and the response
+    had no usage, otherwise `finish` runs inline.
+    """
+    if count_needed and should_record_stream_token_usage() and Config.background_token_count:
+        get_token_counting_worker().submit(finish)
+    else:
+        finish(get_token_count_from_string)
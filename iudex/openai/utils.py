@@ -9,8 +9,35 @@ import openai
 from .shared.config import Config
 
 
-def is_openai_v1():
-    return version("openai") >= "1.0.0"
+# resolved once by `resolve_sdk_versions`, version() is a metadata lookup on disk
+_openai_v1 = None
+_pydantic_v1 = None
+
+
+def _major_version(package: str) -> int:
+    try:
+        return int(version(package).split(".")[0])
+    except Exception:
+        return 0
+
+
+def resolve_sdk_versions():
+    """Detects the OpenAI SDK and pydantic flavours, called once when instrumenting."""
+    global _openai_v1, _pydantic_v1
+    _openai_v1 = _major_version("openai") >= 1
+    _pydantic_v1 = _major_version("pydantic") < 2
+
+
+def is_openai_v1() -> bool:
+    if _openai_v1 is None:
+        resolve_sdk_versions()
+    return _openai_v1
+
+
+def is_pydantic_v1() -> bool:
+    if _pydantic_v1 is None:
+        resolve_sdk_versions()
+    return _pydantic_v1
 
 
 def is_azure_openai(instance):
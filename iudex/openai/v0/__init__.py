@@ -9,6 +9,7 @@ from wrapt import wrap_function_wrapper
 from ..shared.chat_wrappers import achat_wrapper, chat_wrapper
 from ..shared.completion_wrappers import acompletion_wrapper, completion_wrapper
 from ..shared.embeddings_wrappers import aembeddings_wrapper, embeddings_wrapper
+from ..shared.in_flight import init_in_flight_metrics
 from ..utils import is_metrics_enabled
 from ..version import __version__
 
@@ -89,6 +90,8 @@ class OpenAIV0Instrumentor(BaseInstrumentor):
                 embeddings_exception_counter,
             ) = (None, None, None)
 
+        init_in_flight_metrics(meter if is_metrics_enabled() else None)
+
         wrap_function_wrapper("openai", "Completion.create", completion_wrapper(tracer))
         wrap_function_wrapper(
             "openai", "Completion.acreate", acompletion_wrapper(tracer)
@@ -10,9 +10,20 @@ from ..shared.chat_wrappers import achat_wrapper, chat_wrapper
 from ..shared.completion_wrappers import acompletion_wrapper, completion_wrapper
 from ..shared.embeddings_wrappers import aembeddings_wrapper, embeddings_wrapper
 from ..shared.image_gen_wrappers import image_gen_metrics_wrapper
+from ..shared.in_flight import init_in_flight_metrics
+from ..shared.rate_limits import (
+    calculate_retry_timeout_wrapper,
+    init_rate_limit_metrics,
+    process_response_wrapper,
+)
 from ..utils import is_metrics_enabled
 from ..version import __version__
 from .assistant_wrappers import (
+    aassistants_create_wrapper,
+    amessages_list_wrapper,
+    aruns_create_and_stream_wrapper,
+    aruns_create_wrapper,
+    aruns_retrieve_wrapper,
     assistants_create_wrapper,
     messages_list_wrapper,
     runs_create_and_stream_wrapper,
@@ -80,6 +91,24 @@ class OpenAIV1Instrumentor(BaseInstrumentor):
                 streaming_time_to_generate,
             ) = (None, None, None, None, None, None)
 
+        init_rate_limit_metrics(meter if is_metrics_enabled() else None)
+        init_in_flight_metrics(meter if is_metrics_enabled() else None)
+        # rate limit headers and retries are only visible to the SDK's base client
+        try:
+            wrap_function_wrapper(
+                "openai._base_client", "SyncAPIClient._process_response", process_response_wrapper
+            )
+            wrap_function_wrapper(
+                "openai._base_client", "AsyncAPIClient._process_response", process_response_wrapper
+            )
+            wrap_function_wrapper(
+                "openai._base_client",
+                "BaseClient._calculate_retry_timeout",
+                calculate_retry_timeout_wrapper,
+            )
+        except AttributeError:
+            pass
+
         wrap_function_wrapper(
             "openai.resources.chat.completions",
             "Completions.create",
@@ -205,5 +234,34 @@ class OpenAIV1Instrumentor(BaseInstrumentor):
         except AttributeError:
             pass
 
+        try:
+            wrap_function_wrapper(
+                "openai.resources.beta.assistants",
+                "AsyncAssistants.create",
+                aassistants_create_wrapper(tracer),
+            )
+            wrap_function_wrapper(
+                "openai.resources.beta.threads.runs",
+                "AsyncRuns.create",
+                aruns_create_wrapper(tracer),
+            )
+            wrap_function_wrapper(
+                "openai.resources.beta.threads.runs",
+                "AsyncRuns.retrieve",
+                aruns_retrieve_wrapper(tracer),
+            )
+            wrap_function_wrapper(
+                "openai.resources.beta.threads.runs",
+                "AsyncRuns.create_and_stream",
+                aruns_create_and_stream_wrapper(tracer),
+            )
+            wrap_function_wrapper(
+                "openai.resources.beta.threads.messages",
+                "AsyncMessages.list",
+                amessages_list_wrapper(tracer),
+            )
+        except AttributeError:
+            pass
+
     def _uninstrument(self, **kwargs):
         pass
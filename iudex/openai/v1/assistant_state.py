@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+
+import openai
+from opentelemetry import context as context_api
+from opentelemetry.context import _SUPPRESS_INSTRUMENTATION_KEY
+
+from ..shared import model_as_dict
+from ..shared.config import Config
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread safe LRU whose entries expire `ttl` seconds after they were set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expiry, value)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def __setitem__(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+        if entry is _MISSING or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# assistant id -> {"model", "instructions"}, empty if it couldn't be retrieved
+assistants = TTLCache(Config.assistant_cache_size, Config.assistant_cache_ttl)
+# thread id -> the thread's latest run
+runs = TTLCache(Config.run_cache_size, Config.run_cache_ttl)
+
+AssistantCallback = Callable[[Dict[str, Any]], None]
+
+# assistant id -> callbacks waiting on its retrieval
+_pending: Dict[str, List[AssistantCallback]] = {}
+_pending_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+# the loop only keeps weak references to tasks
+_tasks: Set[asyncio.Task] = set()
+
+
+def _assistant_entry(assistant: Dict[str, Any]) -> Dict[str, Any]:
+    # only what the spans use, the rest (tools, file ids, metadata) can be large
+    return {"model": assistant.get("model"), "instructions": assistant.get("instructions")}
+
+
+def remember_assistant(assistant_id: str, assistant: Dict[str, Any]):
+    assistants[assistant_id] = _assistant_entry(assistant)
+
+
+def _claim(assistant_id: str, on_ready: Optional[AssistantCallback]) -> bool:
+    """Registers on_ready, True if the caller should retrieve the assistant."""
+    with _pending_lock:
+        callbacks = _pending.get(assistant_id)
+        if callbacks is not None:
+            if on_ready:
+                callbacks.append(on_ready)
+            return False
+        _pending[assistant_id] = [on_ready] if on_ready else []
+        return True
+
+
+def _resolve(assistant_id: str, assistant: Optional[Dict[str, Any]]):
+    # failures are cached too, so they are retried at most once per TTL
+    entry = _assistant_entry(assistant) if assistant else {}
+    assistants[assistant_id] = entry
+    with _pending_lock:
+        callbacks = _pending.pop(assistant_id, [])
+    if not entry:
+        return
+    for callback in callbacks:
+        try:
+            callback(entry)
+        except Exception as e:
+            logger.debug(f"Failed to enrich span with assistant {assistant_id}: {e}")
+
+
+def _retrieve(client, assistant_id: str):
+    assistant = None
+    # the retrieval is iudex's own call, don't trace it
+    token = context_api.attach(context_api.set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+    try:
+        assistant = model_as_dict(client.beta.assistants.retrieve(assistant_id))
+    except Exception as e:
+        logger.debug(f"Failed to retrieve assistant {assistant_id}: {e}")
+    finally:
+        context_api.detach(token)
+        _resolve(assistant_id, assistant)
+
+
+async def _aretrieve(client, assistant_id: str):
+    assistant = None
+    token = context_api.attach(context_api.set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+    try:
+        assistant = model_as_dict(await client.beta.assistants.retrieve(assistant_id))
+    except Exception as e:
+        logger.debug(f"Failed to retrieve assistant {assistant_id}: {e}")
+    finally:
+        context_api.detach(token)
+        _resolve(assistant_id, assistant)
+
+
+def prefetch_assistant(client, assistant_id: Optional[str], on_ready: Optional[AssistantCallback] = None):
+    """Retrieves the assistant in the background, at most once per assistant per TTL.
+
+    With `enrich_assistant` off, or the assistant already cached, nothing is retrieved.
+    on_ready is called with the assistant once retrieved, from the background thread,
+    or from a task on the running event loop for async clients.
+    """
+    global _executor
+    if not Config.enrich_assistant or not assistant_id or assistant_id in assistants:
+        return
+    if not _claim(assistant_id, on_ready):
+        return
+    if isinstance(client, openai.AsyncOpenAI):
+        try:
+            task = asyncio.get_running_loop().create_task(_aretrieve(client, assistant_id))
+        except RuntimeError:
+            # no running loop to retrieve it on
+            _resolve(assistant_id, None)
+            return
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        return
+    with _pending_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="iudex-assistant-enrich")
+        executor = _executor
+    try:
+        executor.submit(_retrieve, client, assistant_id)
+    except RuntimeError:
+        # interpreter shutting down
+        _resolve(assistant_id, None)
+
+
+def _reset_after_fork():
+    # the parent's enrichment thread and its retrievals don't exist in the child
+    global _executor, _pending_lock
+    _executor = None
+    _pending_lock = threading.Lock()
+    _pending.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
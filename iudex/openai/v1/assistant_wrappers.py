@@ -7,15 +7,149 @@ from opentelemetry import context as context_api
 from opentelemetry.context import _SUPPRESS_INSTRUMENTATION_KEY
 from opentelemetry.semconv.ai import LLMRequestTypeValues, SpanAttributes
 from opentelemetry.trace import SpanKind
+from wrapt import ObjectProxy
 
 from ..shared import _set_span_attribute, model_as_dict
 from ..shared.config import Config
 from ..utils import _with_tracer_wrapper, dont_throw
+from .assistant_state import assistants, prefetch_assistant, remember_assistant, runs
 
 logger = logging.getLogger(__name__)
 
-assistants = {}
-runs = {}
+RUN_POLL_COUNT_ATTRIBUTE = "llm.assistant.run.poll_count"
+RUN_STATUS_ATTRIBUTE = "llm.assistant.run.status"
+# seconds from creation until the run started, and from then until it ended
+RUN_QUEUE_TIME_ATTRIBUTE = "llm.assistant.run.queue_time"
+RUN_IN_PROGRESS_TIME_ATTRIBUTE = "llm.assistant.run.in_progress_time"
+
+_RUN_TIMESTAMPS = ("created_at", "started_at", "completed_at", "failed_at", "cancelled_at")
+
+
+def _set_assistant_attributes(span, assistant):
+    if not span.is_recording():
+        return
+    _set_span_attribute(span, SpanAttributes.LLM_REQUEST_MODEL, assistant.get("model"))
+    _set_span_attribute(span, SpanAttributes.LLM_RESPONSE_MODEL, assistant.get("model"))
+    _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.0.role", "system")
+    _set_span_attribute(
+        span, f"{SpanAttributes.LLM_PROMPTS}.0.content", assistant.get("instructions")
+    )
+
+
+def _set_run_timing_attributes(span, run):
+    _set_span_attribute(span, RUN_STATUS_ATTRIBUTE, run.get("status"))
+    if run.get("poll_count"):
+        _set_span_attribute(span, RUN_POLL_COUNT_ATTRIBUTE, run["poll_count"])
+
+    created_at, started_at = run.get("created_at"), run.get("started_at")
+    ended_at = run.get("completed_at") or run.get("failed_at") or run.get("cancelled_at")
+    if created_at and started_at:
+        _set_span_attribute(span, RUN_QUEUE_TIME_ATTRIBUTE, started_at - created_at)
+    if started_at and ended_at:
+        _set_span_attribute(span, RUN_IN_PROGRESS_TIME_ATTRIBUTE, ended_at - started_at)
+
+
+def _remember_run(instance, args, kwargs):
+    # thread_id is the first positional argument of Runs.create
+    thread_id = kwargs.get("thread_id") or (args[0] if args else None)
+    runs[thread_id] = {
+        "start_time": time.time_ns(),
+        "assistant_id": kwargs.get("assistant_id"),
+        "instructions": kwargs.get("instructions"),
+        "poll_count": 0,
+    }
+    # ready by the time the run's messages are listed
+    prefetch_assistant(instance._client, kwargs.get("assistant_id"))
+
+
+@dont_throw
+def _record_run_poll(thread_id, response):
+    if type(response) is LegacyAPIResponse:
+        parsed_response = response.parse()
+    else:
+        parsed_response = response
+    assert type(parsed_response) is Run
+
+    run = runs.get(thread_id)
+    if run is None:
+        return
+    run["end_time"] = time.time_ns()
+    run["poll_count"] = run.get("poll_count", 0) + 1
+    run["status"] = parsed_response.status
+    for name in _RUN_TIMESTAMPS:
+        value = getattr(parsed_response, name, None)
+        if value:
+            run[name] = value
+
+
+def _record_run_span(tracer, instance, thread_id, response):
+    run = runs.get(thread_id)
+    if run is None:
+        return
+
+    response_dict = model_as_dict(response)
+    messages = sorted(response_dict["data"], key=lambda x: x["created_at"])
+
+    span = tracer.start_span(
+        "openai.assistant.run",
+        kind=SpanKind.CLIENT,
+        attributes={SpanAttributes.LLM_REQUEST_TYPE: LLMRequestTypeValues.CHAT.value},
+        start_time=run.get("start_time"),
+    )
+
+    i = 0
+    assistant = assistants.get(run["assistant_id"])
+    if assistant:
+        _set_assistant_attributes(span, assistant)
+        i += 1
+    else:
+        # the span ends right away, so the assistant is only there for later runs
+        prefetch_assistant(instance._client, run["assistant_id"])
+    _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.role", "system")
+    _set_span_attribute(
+        span, f"{SpanAttributes.LLM_PROMPTS}.{i}.content", run["instructions"]
+    )
+    _set_run_timing_attributes(span, run)
+
+    for i, msg in enumerate(messages):
+        prefix = f"{SpanAttributes.LLM_COMPLETIONS}.{i}"
+        content = msg.get("content")
+
+        _set_span_attribute(span, f"{prefix}.role", msg.get("role"))
+        _set_span_attribute(
+            span, f"{prefix}.content", content[0].get("text").get("value")
+        )
+
+    span.end(run.get("end_time"))
+
+
+def _start_run_stream_span(tracer, instance, kwargs):
+    assistant_id = kwargs.get("assistant_id")
+    instructions = kwargs.get("instructions")
+
+    span = tracer.start_span(
+        "openai.assistant.run_stream",
+        kind=SpanKind.CLIENT,
+        attributes={SpanAttributes.LLM_REQUEST_TYPE: LLMRequestTypeValues.CHAT.value},
+    )
+
+    i = 0
+    assistant = assistants.get(assistant_id)
+    if assistant:
+        _set_assistant_attributes(span, assistant)
+        i += 1
+    elif Config.enrich_assistant and assistant is None:
+        # the span stays open while the run streams, it's enriched once retrieved
+        prefetch_assistant(
+            instance._client,
+            assistant_id,
+            lambda assistant: _set_assistant_attributes(span, assistant),
+        )
+        i += 1
+    _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.role", "system")
+    _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.content", instructions)
+
+    return span
 
 
 @_with_tracer_wrapper
@@ -25,10 +159,7 @@ def assistants_create_wrapper(tracer, wrapped, instance, args, kwargs):
 
     response = wrapped(*args, **kwargs)
 
-    assistants[response.id] = {
-        "model": kwargs.get("model"),
-        "instructions": kwargs.get("instructions"),
-    }
+    remember_assistant(response.id, kwargs)
 
     return response
 
@@ -38,39 +169,21 @@ def runs_create_wrapper(tracer, wrapped, instance, args, kwargs):
     if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
         return wrapped(*args, **kwargs)
 
-    thread_id = kwargs.get("thread_id")
-    instructions = kwargs.get("instructions")
-
     response = wrapped(*args, **kwargs)
 
-    runs[thread_id] = {
-        "start_time": time.time_ns(),
-        "assistant_id": kwargs.get("assistant_id"),
-        "instructions": instructions,
-    }
+    _remember_run(instance, args, kwargs)
 
     return response
 
 
 @_with_tracer_wrapper
 def runs_retrieve_wrapper(tracer, wrapped, instance, args, kwargs):
-    @dont_throw
-    def process_response(response):
-        if type(response) is LegacyAPIResponse:
-            parsed_response = response.parse()
-        else:
-            parsed_response = response
-        assert type(parsed_response) is Run
-
-        if parsed_response.id in runs:
-            runs[thread_id]["end_time"] = time.time_ns()
-
     if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
         return wrapped(*args, **kwargs)
 
     thread_id = kwargs.get("thread_id")
     response = wrapped(*args, **kwargs)
-    process_response(response)
+    _record_run_poll(thread_id, response)
 
     return response
 
@@ -84,116 +197,121 @@ def messages_list_wrapper(tracer, wrapped, instance, args, kwargs):
 
     response = wrapped(*args, **kwargs)
 
-    response_dict = model_as_dict(response)
-    if id not in runs:
-        return response
+    _record_run_span(tracer, instance, id, response)
 
-    run = runs[id]
-    messages = sorted(response_dict["data"], key=lambda x: x["created_at"])
+    return response
 
-    span = tracer.start_span(
-        "openai.assistant.run",
-        kind=SpanKind.CLIENT,
-        attributes={SpanAttributes.LLM_REQUEST_TYPE: LLMRequestTypeValues.CHAT.value},
-        start_time=run.get("start_time"),
-    )
 
-    i = 0
-    if assistants.get(run["assistant_id"]) is not None or Config.enrich_assistant:
-        if Config.enrich_assistant:
-            assistant = model_as_dict(
-                instance._client.beta.assistants.retrieve(run["assistant_id"])
-            )
-            assistants[run["assistant_id"]] = assistant
-        else:
-            assistant = assistants[run["assistant_id"]]
+@_with_tracer_wrapper
+def runs_create_and_stream_wrapper(tracer, wrapped, instance, args, kwargs):
+    if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
+        return wrapped(*args, **kwargs)
 
-        _set_span_attribute(
-            span,
-            SpanAttributes.LLM_REQUEST_MODEL,
-            assistant["model"],
-        )
-        _set_span_attribute(
-            span,
-            SpanAttributes.LLM_RESPONSE_MODEL,
-            assistant["model"],
-        )
-        _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.role", "system")
-        _set_span_attribute(
-            span,
-            f"{SpanAttributes.LLM_PROMPTS}.{i}.content",
-            assistant["instructions"],
-        )
-        i += 1
-    _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.role", "system")
-    _set_span_attribute(
-        span, f"{SpanAttributes.LLM_PROMPTS}.{i}.content", run["instructions"]
+    span = _start_run_stream_span(tracer, instance, kwargs)
+
+    from openai import AssistantEventHandler
+
+    from .event_handler_wrapper import EventHandleWrapper
+
+    kwargs["event_handler"] = EventHandleWrapper(
+        original_handler=kwargs.get("event_handler") or AssistantEventHandler(),
+        span=span,
     )
 
-    for i, msg in enumerate(messages):
-        prefix = f"{SpanAttributes.LLM_COMPLETIONS}.{i}"
-        content = msg.get("content")
+    return wrapped(*args, **kwargs)
 
-        _set_span_attribute(span, f"{prefix}.role", msg.get("role"))
-        _set_span_attribute(
-            span, f"{prefix}.content", content[0].get("text").get("value")
-        )
 
-    span.end(run.get("end_time"))
+# Async Assistants API, sharing the state above
+
+
+@_with_tracer_wrapper
+async def aassistants_create_wrapper(tracer, wrapped, instance, args, kwargs):
+    if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
+        return await wrapped(*args, **kwargs)
+
+    response = await wrapped(*args, **kwargs)
+
+    remember_assistant(response.id, kwargs)
 
     return response
 
 
 @_with_tracer_wrapper
-def runs_create_and_stream_wrapper(tracer, wrapped, instance, args, kwargs):
+async def aruns_create_wrapper(tracer, wrapped, instance, args, kwargs):
+    if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
+        return await wrapped(*args, **kwargs)
+
+    response = await wrapped(*args, **kwargs)
+
+    _remember_run(instance, args, kwargs)
+
+    return response
+
+
+@_with_tracer_wrapper
+async def aruns_retrieve_wrapper(tracer, wrapped, instance, args, kwargs):
+    if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
+        return await wrapped(*args, **kwargs)
+
+    thread_id = kwargs.get("thread_id")
+    response = await wrapped(*args, **kwargs)
+    _record_run_poll(thread_id, response)
+
+    return response
+
+
+class AsyncMessagesPage(ObjectProxy):
+    """Wraps the paginator AsyncMessages.list returns, to record the run span once awaited."""
+
+    def __init__(self, paginator, on_page):
+        super().__init__(paginator)
+        self._self_on_page = on_page
+
+    def __await__(self):
+        return self._get_page().__await__()
+
+    def __aiter__(self):
+        # iterating fetches pages lazily, so no run span is recorded
+        return self.__wrapped__.__aiter__()
+
+    async def _get_page(self):
+        page = await self.__wrapped__
+        self._self_on_page(page)
+        return page
+
+
+@_with_tracer_wrapper
+def amessages_list_wrapper(tracer, wrapped, instance, args, kwargs):
     if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
         return wrapped(*args, **kwargs)
 
-    assistant_id = kwargs.get("assistant_id")
-    instructions = kwargs.get("instructions")
+    id = kwargs.get("thread_id")
 
-    span = tracer.start_span(
-        "openai.assistant.run_stream",
-        kind=SpanKind.CLIENT,
-        attributes={SpanAttributes.LLM_REQUEST_TYPE: LLMRequestTypeValues.CHAT.value},
-    )
+    paginator = wrapped(*args, **kwargs)
+    if id not in runs:
+        return paginator
 
-    i = 0
-    if assistants.get(assistant_id) is not None or Config.enrich_assistant:
-        if Config.enrich_assistant:
-            assistant = model_as_dict(
-                instance._client.beta.assistants.retrieve(assistant_id)
-            )
-            assistants[assistant_id] = assistant
-        else:
-            assistant = assistants[assistant_id]
+    @dont_throw
+    def on_page(page):
+        _record_run_span(tracer, instance, id, page)
 
-        _set_span_attribute(
-            span, SpanAttributes.LLM_REQUEST_MODEL, assistants[assistant_id]["model"]
-        )
-        _set_span_attribute(
-            span,
-            SpanAttributes.LLM_RESPONSE_MODEL,
-            assistants[assistant_id]["model"],
-        )
-        _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.role", "system")
-        _set_span_attribute(
-            span,
-            f"{SpanAttributes.LLM_PROMPTS}.{i}.content",
-            assistants[assistant_id]["instructions"],
-        )
-        i += 1
-    _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.role", "system")
-    _set_span_attribute(span, f"{SpanAttributes.LLM_PROMPTS}.{i}.content", instructions)
+    return AsyncMessagesPage(paginator, on_page)
 
-    from .event_handler_wrapper import (
-        EventHandleWrapper,
-    )
 
-    kwargs["event_handler"] = EventHandleWrapper(
-        original_handler=kwargs["event_handler"], span=span
-    )
+@_with_tracer_wrapper
+def aruns_create_and_stream_wrapper(tracer, wrapped, instance, args, kwargs):
+    if context_api.get_value(_SUPPRESS_INSTRUMENTATION_KEY):
+        return wrapped(*args, **kwargs)
 
-    response = wrapped(*args, **kwargs)
+    span = _start_run_stream_span(tracer, instance, kwargs)
 
-    return response
+    from openai.lib.streaming import AsyncAssistantEventHandler
+
+    from .event_handler_wrapper import AsyncEventHandleWrapper
+
+    kwargs["event_handler"] = AsyncEventHandleWrapper(
+        original_handler=kwargs.get("event_handler") or AsyncAssistantEventHandler(),
+        span=span,
+    )
+
+    return wrapped(*args, **kwargs)
@@ -1,11 +1,36 @@
 from openai import AssistantEventHandler
+from openai.lib.streaming import AsyncAssistantEventHandler
 from opentelemetry.semconv.ai import SpanAttributes
 from typing_extensions import override
 
 from ..shared import _set_span_attribute
 
-
-class EventHandleWrapper(AssistantEventHandler):
+# events passed straight through to the original handler
+_FORWARDED_EVENTS = (
+    "on_event",
+    "on_run_step_created",
+    "on_run_step_delta",
+    "on_run_step_done",
+    "on_tool_call_created",
+    "on_tool_call_delta",
+    "on_tool_call_done",
+    "on_exception",
+    "on_timeout",
+    "on_message_created",
+    "on_message_delta",
+    "on_message_done",
+    "on_text_created",
+    "on_text_delta",
+    "on_image_file_done",
+)
+
+
+class _EventHandleWrapperMixin:
+    """Span recording shared by the sync and async event handler wrappers.
+
+    Subclasses forward every event to the original handler, recording the completed
+    texts on the span and ending it with the run.
+    """
 
     _current_text_index = 0
 
@@ -14,83 +39,65 @@ class EventHandleWrapper(AssistantEventHandler):
         self._original_handler = original_handler
         self._span = span
 
-    @override
-    def on_end(self):
-        self._original_handler.on_end()
-        self._span.end()
-
-    @override
-    def on_event(self, event):
-        self._original_handler.on_event(event)
-
-    @override
-    def on_run_step_created(self, run_step):
-        self._original_handler.on_run_step_created(run_step)
-
-    @override
-    def on_run_step_delta(self, delta, snapshot):
-        self._original_handler.on_run_step_delta(delta, snapshot)
-
-    @override
-    def on_run_step_done(self, run_step):
-        self._original_handler.on_run_step_done(run_step)
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        is_async = issubclass(cls, AsyncAssistantEventHandler)
+        for name in _FORWARDED_EVENTS:
+            if name not in cls.__dict__:
+                forward = _async_forward(name) if is_async else _forward(name)
+                forward.__qualname__ = f"{cls.__qualname__}.{name}"
+                setattr(cls, name, forward)
 
-    @override
-    def on_tool_call_created(self, tool_call):
-        self._original_handler.on_tool_call_created(tool_call)
+    def _record_text(self, text):
+        _set_span_attribute(
+            self._span,
+            f"{SpanAttributes.LLM_COMPLETIONS}.{self._current_text_index}.role",
+            "assistant",
+        )
+        _set_span_attribute(
+            self._span,
+            f"{SpanAttributes.LLM_COMPLETIONS}.{self._current_text_index}.content",
+            text.value,
+        )
 
-    @override
-    def on_tool_call_delta(self, delta, snapshot):
-        self._original_handler.on_tool_call_delta(delta, snapshot)
+        self._current_text_index += 1
 
-    @override
-    def on_tool_call_done(self, tool_call):
-        self._original_handler.on_tool_call_done(tool_call)
 
-    @override
-    def on_exception(self, exception: Exception):
-        self._original_handler.on_exception(exception)
+def _forward(name):
+    def forward(self, *args):
+        return getattr(self._original_handler, name)(*args)
 
-    @override
-    def on_timeout(self):
-        self._original_handler.on_timeout()
+    forward.__name__ = name
+    return override(forward)
 
-    @override
-    def on_message_created(self, message):
-        self._original_handler.on_message_created(message)
 
-    @override
-    def on_message_delta(self, delta, snapshot):
-        self._original_handler.on_message_delta(delta, snapshot)
+def _async_forward(name):
+    async def forward(self, *args):
+        return await getattr(self._original_handler, name)(*args)
 
-    @override
-    def on_message_done(self, message):
-        self._original_handler.on_message_done(message)
+    forward.__name__ = name
+    return override(forward)
 
-    @override
-    def on_text_created(self, text):
-        self._original_handler.on_text_created(text)
 
+class EventHandleWrapper(_EventHandleWrapperMixin, AssistantEventHandler):
     @override
-    def on_text_delta(self, delta, snapshot):
-        self._original_handler.on_text_delta(delta, snapshot)
+    def on_end(self):
+        self._original_handler.on_end()
+        self._span.end()
 
     @override
     def on_text_done(self, text):
         self._original_handler.on_text_done(text)
-        _set_span_attribute(
-            self._span,
-            f"{SpanAttributes.LLM_COMPLETIONS}.{self._current_text_index}.role",
-            "assistant",
-        )
-        _set_span_attribute(
-            self._span,
-            f"{SpanAttributes.LLM_COMPLETIONS}.{self._current_text_index}.content",
-            text.value,
-        )
+        self._record_text(text)
 
-        self._current_text_index += 1
+
+class AsyncEventHandleWrapper(_EventHandleWrapperMixin, AsyncAssistantEventHandler):
+    @override
+    async def on_end(self):
+        await self._original_handler.on_end()
+        self._span.end()
 
     @override
-    def on_image_file_done(self, image_file):
-        self._original_handler.on_image_file_done(image_file)
+    async def on_text_done(self, text):
+        await self._original_handler.on_text_done(text)
+        self._record_text(text)
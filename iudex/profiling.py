@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from types import CodeType, FrameType
+from typing import Dict, List, Optional, Tuple
+
+from opentelemetry._logs import SeverityNumber, get_logger_provider
+from opentelemetry.context import Context
+from opentelemetry.sdk._logs import LogRecord
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 64
+# folded stacks exported per span name and interval, the rest are summed into one line
+MAX_EXPORTED_STACKS = 100
+_MAX_CODE_LABELS = 10_000
+
+
+def _running_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        # no running event loop
+        return None
+
+
+class ActiveSpanTracker(SpanProcessor):
+    """Keeps the spans open on each thread, and on each asyncio task, innermost last.
+
+    Background samplers can't read another thread's context, so the innermost span
+    started on a thread and not yet ended stands in for the span active on it. On event
+    loop threads, spans are kept per task, and only the task running at that moment
+    counts as active, so a task suspended in an `await` isn't charged for the others.
+    """
+
+    def __init__(self):
+        # (thread id, task or None) -> open spans
+        self._stacks: Dict[Tuple[int, Optional[asyncio.Task]], List[Span]] = {}
+        # span id -> stack key of the span, spans may end on another thread
+        self._owners: Dict[int, Tuple[int, Optional[asyncio.Task]]] = {}
+        # thread id -> the event loop running on it, to find that loop's current task
+        self._loops: "weakref.WeakValueDictionary[int, asyncio.AbstractEventLoop]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        thread_id = threading.get_ident()
+        task = _running_task()
+        if task is not None:
+            loop = task.get_loop()
+            if self._loops.get(thread_id) is not loop:
+                self._loops[thread_id] = loop
+        key = (thread_id, task)
+        self._owners[span.get_span_context().span_id] = key
+        stack = self._stacks.get(key)
+        if stack is None:
+            stack = self._stacks[key] = []
+        stack.append(span)
+
+    def on_end(self, span: ReadableSpan):
+        span_id = span.get_span_context().span_id
+        key = self._owners.pop(span_id, None)
+        stack = self._stacks.get(key)
+        if not stack:
+            return
+        # usually the innermost span, unless spans on this thread end out of order
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i].get_span_context().span_id == span_id:
+                del stack[i]
+                break
+        if not stack:
+            self._stacks.pop(key, None)
+
+    def _running_task_on(self, thread_id: int) -> Optional[asyncio.Task]:
+        loop = self._loops.get(thread_id)
+        if loop is None or loop.is_closed():
+            return None
+        return asyncio.current_task(loop)
+
+    def current_span(self, thread_id: int) -> Optional[Span]:
+        try:
+            return self._stacks[(thread_id, self._running_task_on(thread_id))][-1]
+        except (KeyError, IndexError):
+            return None
+
+    def open_spans(self) -> List[Tuple[int, Span]]:
+        """(thread id, span) of every open span, safe to call from any thread."""
+        return [(key[0], span) for key, stack in list(self._stacks.items()) for span in list(stack)]
+
+    def running_spans(self) -> List[Tuple[int, Span]]:
+        """(thread id, span) of the open spans of what runs on each thread now, outermost first.
+
+        Spans of suspended tasks are left out, the thread's stack belongs to another task.
+        """
+        running_tasks: Dict[int, Optional[asyncio.Task]] = {}
+        spans = []
+        for (thread_id, task), stack in list(self._stacks.items()):
+            if thread_id not in running_tasks:
+                running_tasks[thread_id] = self._running_task_on(thread_id)
+            if task is running_tasks[thread_id]:
+                spans.extend((thread_id, span) for span in list(stack))
+        return spans
+
+
+# set by configure when span tracking is enabled, for other monitors to attribute work to spans
+_active_span_tracker: Optional[ActiveSpanTracker] = None
+
+
+def set_active_span_tracker(tracker: Optional[ActiveSpanTracker]):
+    global _active_span_tracker
+    _active_span_tracker = tracker
+
+
+def get_active_span_tracker() -> Optional[ActiveSpanTracker]:
+    return _active_span_tracker
+
+
+_code_labels: Dict[CodeType, str] = {}
+
+
+def _code_label(frame: FrameType) -> str:
+    code = frame.f_code
+    label = _code_labels.get(code)
+    if label is None:
+        if len(_code_labels) >= _MAX_CODE_LABELS:
+            _code_labels.clear()
+        module = frame.f_globals.get("__name__", "?")
+        label = _code_labels[code] = f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+    return label
+
+
+def fold_stack(frame: Optional[FrameType], max_depth: int = MAX_STACK_DEPTH) -> str:
+    """Folded stack of frame, root first and separated by `;`, as flame graph tools expect."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_code_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class StackSampler:
+    """Samples the stacks of threads inside a span and aggregates them per span name.
+
+    Every `export_interval` seconds, each span name's folded stacks are emitted as one
+    log record, ready for a flame graph. Samples are wall clock, so threads blocked on
+    I/O inside a span show up too, under the frame they are waiting in.
+    """
+
+    def __init__(
+        self,
+        tracker: ActiveSpanTracker,
+        hz: float = 19,
+        export_interval: float = 60,
+    ):
+        self.tracker = tracker
+        self.hz = hz
+        self.export_interval = export_interval
+        # span name -> folded stack -> sample count
+        self._samples: Dict[str, Dict[str, int]] = {}
+        self._window_start = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="iudex-stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+
+    def sample(self):
+        own_thread_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            span = self.tracker.current_span(thread_id)
+            if span is None:
+                continue
+            stacks = self._samples.get(span.name)
+            if stacks is None:
+                stacks = self._samples[span.name] = {}
+            stack = fold_stack(frame)
+            stacks[stack] = stacks.get(stack, 0) + 1
+
+    def export(self):
+        samples, self._samples = self._samples, {}
+        now = time.monotonic()
+        window, self._window_start = now - self._window_start, now
+        if not samples:
+            return
+        provider = get_logger_provider()
+        otel_logger = provider.get_logger(__name__)
+        resource = getattr(provider, "resource", None)
+        timestamp = time.time_ns()
+        for span_name, stacks in samples.items():
+            ranked = sorted(stacks.items(), key=lambda item: item[1], reverse=True)
+            lines = [f"{stack} {count}" for stack, count in ranked[:MAX_EXPORTED_STACKS]]
+            dropped = sum(count for _, count in ranked[MAX_EXPORTED_STACKS:])
+            if dropped:
+                lines.append(f"(other stacks) {dropped}")
+            otel_logger.emit(
+                LogRecord(
+                    timestamp=timestamp,
+                    observed_timestamp=timestamp,
+                    severity_text="INFO",
+                    severity_number=SeverityNumber.INFO,
+                    body="\n".join(lines),
+                    resource=resource,
+                    attributes={
+                        "iudex.profile.format": "folded",
+                        "iudex.profile.span.name": span_name,
+                        "iudex.profile.sample.count": sum(stacks.values()),
+                        "iudex.profile.sample.hz": self.hz,
+                        "iudex.profile.duration_s": window,
+                    },
+                )
+            )
+
+    def _run(self):
+        interval = 1 / self.hz
+        next_export = time.monotonic() + self.export_interval
+        while not self._stopped.wait(interval):
+            try:
+                self.sample()
+                if time.monotonic() >= next_export:
+                    next_export += self.export_interval
+                    self.export()
+            except Exception as e:
+                logger.debug(f"Stack sampler failed: {e}")
+
+
+class SlowSpanWatchdog:
+    """Snapshots the owning thread's stack while a span stays open past `threshold` seconds.
+
+    Up to `max_snapshots` stacks, `interval` seconds apart, are added to the innermost slow
+    span on each thread as `iudex.slow_span.stack` events, so they are exported with the span.
+    Between slow spans, the only cost is a periodic scan of the open spans.
+    """
+
+    def __init__(
+        self,
+        tracker: ActiveSpanTracker,
+        threshold: float = 5,
+        max_snapshots: int = 3,
+        interval: Optional[float] = None,
+    ):
+        self.tracker = tracker
+        self.threshold = threshold
+        self.max_snapshots = max_snapshots
+        self.interval = interval or threshold / 2
+        # span id -> snapshots taken, only for spans still open
+        self._snapshots: Dict[int, int] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="iudex-slow-span-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self):
+        now = time.time_ns()
+        threshold_ns = int(self.threshold * 1e9)
+        # innermost slow span per thread, running spans are listed outermost first.
+        # a suspended task's span isn't snapshotted, the thread's stack isn't its own
+        slow_spans: Dict[int, Span] = {}
+        for thread_id, span in self.tracker.running_spans():
+            if span.start_time is not None and now - span.start_time >= threshold_ns:
+                slow_spans[thread_id] = span
+
+        if slow_spans:
+            frames = sys._current_frames()
+            for thread_id, span in slow_spans.items():
+                span_id = span.get_span_context().span_id
+                taken = self._snapshots.get(span_id, 0)
+                frame = frames.get(thread_id)
+                if taken >= self.max_snapshots or frame is None:
+                    continue
+                self._snapshots[span_id] = taken + 1
+                span.add_event(
+                    "iudex.slow_span.stack",
+                    {
+                        "code.stacktrace": "".join(traceback.format_stack(frame, MAX_STACK_DEPTH)),
+                        "thread.id": thread_id,
+                        "iudex.slow_span.elapsed_ms": (now - span.start_time) / 1e6,
+                        "iudex.slow_span.snapshot": taken + 1,
+                    },
+                )
+
+        open_span_ids = {span.get_span_context().span_id for _, span in self.tracker.open_spans()}
+        for span_id in [key for key in self._snapshots if key not in open_span_ids]:
+            del self._snapshots[span_id]
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.debug(f"Slow span watchdog failed: {e}")
+
+
+class CpuTimeSpanProcessor(SpanProcessor):
+    """Records the CPU time of spans that start and end on the same thread.
+
+    Adds `iudex.span.cpu_time_ms` and `iudex.span.cpu_ratio` (CPU time over wall time),
+    close to 1 for compute bound spans and close to 0 for I/O bound ones. Spans on a thread
+    that interleaves other work, like an event loop, count that work too, so their ratio
+    is an upper bound.
+
+    Attributes can only be set while a span is recording, so `on_start` wraps each span's
+    `end` to set them right before the span ends. Spans ended with an explicit end_time were
+    timed by their creator, not as they ran, so they are skipped.
+    """
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        thread_id = threading.get_ident()
+        cpu_start = time.thread_time_ns()
+        wall_start = time.time_ns()
+        end = span.end
+
+        def end_with_cpu_time(end_time: Optional[int] = None):
+            # drop the wrapper first, so the span no longer references it
+            del span.end
+            if end_time is None and threading.get_ident() == thread_id and span.is_recording():
+                cpu_ns = time.thread_time_ns() - cpu_start
+                attributes = {"iudex.span.cpu_time_ms": cpu_ns / 1e6}
+                wall_ns = time.time_ns() - wall_start
+                if wall_ns > 0:
+                    attributes["iudex.span.cpu_ratio"] = cpu_ns / wall_ns
+                span.set_attributes(attributes)
+            end(end_time)
+
+        span.end = end_with_cpu_time
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import reprlib
+from itertools import islice
+from typing import Any, Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Summarizer = Callable[[Any], Any]
+
+MAX_SUMMARY_ITEMS = 32
+MAX_SUMMARY_DEPTH = 3
+MAX_SUMMARY_STR_LENGTH = 256
+# bytes at or below this length are left for the attribute cleaner to decode
+MAX_RAW_BYTES = 1024
+
+# summarizers keyed by type, and by "module.QualName" for types of optional libraries
+# (numpy, pandas, pydantic) so they are matched without importing those libraries
+_type_summarizers: Dict[type, Summarizer] = {}
+_name_summarizers: Dict[str, Summarizer] = {}
+# resolved summarizer (or None) per concrete class, cleared on registration
+_resolved: Dict[type, Optional[Summarizer]] = {}
+
+_PRIMITIVE_TYPES = (bool, str, int, float)
+
+
+def register_summarizer(type_or_name: Union[type, str], summarizer: Summarizer):
+    """Registers how values of a type are summarized before becoming span attributes.
+
+    Summarizers run instead of `str(value)`, so they should be cheap and return a
+    primitive (usually a short string). Subclasses use their closest registered base.
+
+    Args:
+        type_or_name: The type, or its fully qualified "module.QualName" to avoid importing it.
+        summarizer: Called with the value, returns an attribute value.
+    """
+    if isinstance(type_or_name, str):
+        _name_summarizers[type_or_name] = summarizer
+    else:
+        _type_summarizers[type_or_name] = summarizer
+    _resolved.clear()
+
+
+def get_summarizer(value: Any) -> Optional[Summarizer]:
+    cls = type(value)
+    try:
+        return _resolved[cls]
+    except KeyError:
+        pass
+
+    summarizer = None
+    for base in cls.__mro__:
+        summarizer = _type_summarizers.get(base) or _name_summarizers.get(
+            f"{base.__module__}.{base.__qualname__}"
+        )
+        if summarizer:
+            break
+    _resolved[cls] = summarizer
+    return summarizer
+
+
+def summarize(value: Any) -> Any:
+    """Returns the registered summary of value, or value itself if it has no summarizer."""
+    if type(value) in _PRIMITIVE_TYPES or value is None:
+        return value
+    summarizer = get_summarizer(value)
+    if summarizer is None:
+        return value
+    try:
+        return summarizer(value)
+    except Exception as e:
+        logger.debug(f"Failed to summarize {type(value).__name__}: {e}")
+        return f"<{type(value).__name__}>"
+
+
+def _is_scalar_sequence(value: Any) -> bool:
+    # what the attribute cleaner accepts as sequence items
+    return isinstance(value, (list, tuple)) and all(
+        item is None or type(item) in _PRIMITIVE_TYPES or type(item) is bytes
+        for item in islice(value, MAX_SUMMARY_ITEMS)
+    )
+
+
+def to_attribute_value(value: Any) -> Any:
+    """Summarizes value, and reduces containers to bounded strings, so nothing is str()-ed whole.
+
+    Primitives and sequences of primitives are returned as is. Other containers keep the
+    `str(value)` format, cut off at the summary limits. Summarizers that return a container
+    get it as bounded JSON.
+    """
+    if type(value) in _PRIMITIVE_TYPES or value is None:
+        return value
+    if get_summarizer(value) is not None:
+        value = summarize(value)
+        if isinstance(value, (set, frozenset)):
+            value = list(islice(value, MAX_SUMMARY_ITEMS + 1))
+        if isinstance(value, dict) or (
+            isinstance(value, (list, tuple)) and not _is_scalar_sequence(value)
+        ):
+            return json.dumps(bounded(value), default=str)
+        return value
+    if isinstance(value, (dict, set, frozenset)) or (
+        isinstance(value, (list, tuple)) and not _is_scalar_sequence(value)
+    ):
+        return _bounded_repr.repr(value)
+    return value
+
+
+class _BoundedRepr(reprlib.Repr):
+    """`repr` cut off at the summary limits, in the same format as `str(value)` below them."""
+
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = MAX_SUMMARY_DEPTH
+        self.maxdict = self.maxlist = self.maxtuple = MAX_SUMMARY_ITEMS
+        self.maxset = self.maxfrozenset = self.maxdeque = self.maxarray = MAX_SUMMARY_ITEMS
+        self.maxstring = self.maxother = self.maxlong = MAX_SUMMARY_STR_LENGTH
+
+    def repr1(self, x, level):
+        if get_summarizer(x) is not None:
+            x = summarize(x)
+        return super().repr1(x, level)
+
+    # reprlib sorts dicts and sets, which reads all of them and reorders them from str()
+
+    def repr_dict(self, x, level):
+        if not x:
+            return "{}"
+        if level <= 0:
+            return "{...}"
+        pieces = [
+            f"{self.repr1(k, level - 1)}: {self.repr1(v, level - 1)}"
+            for k, v in islice(x.items(), self.maxdict)
+        ]
+        if len(x) > self.maxdict:
+            pieces.append("...")
+        return "{" + ", ".join(pieces) + "}"
+
+    def repr_set(self, x, level):
+        if not x:
+            return "set()"
+        return self._repr_iterable(x, level, "{", "}", self.maxset)
+
+    def repr_frozenset(self, x, level):
+        if not x:
+            return "frozenset()"
+        return self._repr_iterable(x, level, "frozenset({", "})", self.maxfrozenset)
+
+
+_bounded_repr = _BoundedRepr()
+
+
+def _truncate(value: str) -> str:
+    if len(value) > MAX_SUMMARY_STR_LENGTH:
+        return value[:MAX_SUMMARY_STR_LENGTH] + "..."
+    return value
+
+
+def bounded(value: Any, depth: int = 0) -> Any:
+    """JSON-friendly copy of value bounded by item count, depth and string length."""
+    if isinstance(value, str):
+        return _truncate(value)
+    if type(value) in _PRIMITIVE_TYPES or value is None:
+        return value
+    if depth >= MAX_SUMMARY_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        # never copy the whole dict, it can be arbitrarily large
+        result = {
+            str(k): bounded(v, depth + 1) for k, v in islice(value.items(), MAX_SUMMARY_ITEMS)
+        }
+        if len(value) > MAX_SUMMARY_ITEMS:
+            result["..."] = f"{len(value) - MAX_SUMMARY_ITEMS} more"
+        return result
+    if isinstance(value, (list, tuple)):
+        result = [bounded(v, depth + 1) for v in value[:MAX_SUMMARY_ITEMS]]
+        if len(value) > MAX_SUMMARY_ITEMS:
+            result.append(f"... {len(value) - MAX_SUMMARY_ITEMS} more")
+        return result
+    summary = summarize(value)
+    if isinstance(summary, (bytes, bytearray, memoryview)):
+        return _truncate(bytes(summary).decode("utf-8", errors="replace"))
+    if summary is not value:
+        return bounded(summary, depth + 1)
+    return f"<{type(value).__name__}>"
+
+
+def summarize_bytes(value: Union[bytes, bytearray, memoryview]) -> Any:
+    if len(value) <= MAX_RAW_BYTES:
+        return bytes(value)
+    digest = hashlib.blake2b(value, digest_size=8).hexdigest()
+    return f"{type(value).__name__}(len={len(value)}, blake2b={digest})"
+
+
+def summarize_ndarray(value) -> str:
+    return f"ndarray(dtype={value.dtype}, shape={value.shape}, nbytes={value.nbytes})"
+
+
+def summarize_dataframe(value) -> str:
+    columns = [str(c) for c in value.columns[:MAX_SUMMARY_ITEMS]]
+    if len(value.columns) > MAX_SUMMARY_ITEMS:
+        columns.append("...")
+    return f"DataFrame(shape={value.shape}, columns={columns})"
+
+
+def summarize_series(value) -> str:
+    return f"Series(name={value.name}, dtype={value.dtype}, len={len(value)})"
+
+
+def summarize_pydantic_model(value) -> str:
+    # walk fields instead of model_dump/dict so large models are never fully serialized
+    fields = {k: v for k, v in vars(value).items() if not k.startswith("_")}
+    return json.dumps({type(value).__name__: bounded(fields)}, default=str)
+
+
+register_summarizer(bytes, summarize_bytes)
+register_summarizer(bytearray, summarize_bytes)
+register_summarizer(memoryview, summarize_bytes)
+register_summarizer("numpy.ndarray", summarize_ndarray)
+register_summarizer("pandas.core.frame.DataFrame", summarize_dataframe)
+register_summarizer("pandas.core.series.Series", summarize_series)
+register_summarizer("pydantic.main.BaseModel", summarize_pydantic_model)
+# pydantic v2 also exposes the v1 API
+register_summarizer("pydantic.v1.main.BaseModel", summarize_pydantic_model)
@@ -1,41 +1,212 @@
+import asyncio
 import functools
-from typing import Callable, Any, Iterator, Optional
+import heapq
+import importlib
+import inspect
+import pickle
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from itertools import islice
+from typing import AsyncGenerator, Callable, Any, Dict, Generator, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 import wrapt
 from opentelemetry import trace as otel_trace, context
+from opentelemetry.metrics import get_meter
 from opentelemetry.trace import StatusCode
 from opentelemetry.trace.span import Span
 import logging
 
+from .histogram import LATENCY_BOUNDS, FixedBucketHistogram
+from .summarizers import to_attribute_value
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# caps on how much of a traced function's arguments is recorded
+MAX_TRACED_ARGS = 16
+MAX_TRACED_ARG_LENGTH = int(os.getenv("IUDEX_TRACE_MAX_ARG_LENGTH", 1024))
+_PRIMITIVE_TYPES = (bool, str, int, float)
+
+# proxy instruments, bound to the meter provider once one is set
+_meter = get_meter(__name__)
+_function_duration_histogram = _meter.create_histogram(
+    name="iudex.function.duration",
+    unit="s",
+    description="Duration of functions traced with metrics=True",
+)
+_function_error_counter = _meter.create_counter(
+    name="iudex.function.errors",
+    unit="error",
+    description="Number of exceptions raised by functions traced with metrics=True",
+)
+
+
+class SpanHandle:
+    """A manually started span, ended by `end` or by leaving it as a (async) context manager.
+
+    The handle ends exactly its own span, so nested or interleaved handles can't end each other's.
+    """
+
+    __slots__ = ("span", "_token", "_owner", "_started", "__weakref__")
+
+    def __init__(self, span: Span, token: Optional[object]):
+        self.span = span
+        self._token = token
+        # the thread and task whose context the token belongs to
+        self._owner = _context_owner() if token is not None else None
+        self._started = time.monotonic()
+
+    @property
+    def ended(self) -> bool:
+        return self._token is _ENDED
+
+    def end(self, error: Optional[BaseException] = None):
+        """Ends the span, recording error if given. Ending twice is a no-op."""
+        token, self._token = self._token, _ENDED
+        if token is _ENDED:
+            return
+        _open_handles.pop(id(self), None)
+        # a token can only be detached in the context it was attached in, ending the handle
+        # from another thread or task just ends the span
+        if token is not None and self._owner == _context_owner():
+            # only restore the previous context while this span is still the current one,
+            # otherwise a span started after it (and still open) would be dropped from context.
+            # the skipped detach happens once that later span ends and this one is current again
+            if otel_trace.get_current_span() is self.span:
+                context.detach(token)
+                _detach_ended_spans()
+            else:
+                _pending_detach.set({**_pending_detach.get(), self.span: token})
+        if isinstance(error, Exception):
+            _record_error(self.span, error)
+        self.span.end()
+
+    def __enter__(self) -> "SpanHandle":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+
+    async def __aenter__(self) -> "SpanHandle":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.end(exc)
+
+    def __repr__(self) -> str:
+        name = getattr(self.span, "name", None)
+        return f"<SpanHandle {name!r}{' ended' if self.ended else ''}>"
+
+
+_ENDED = object()
+# open handles by id, only tracked while the leak detector runs
+_open_handles: Dict[int, SpanHandle] = {}
+_leak_detector: Optional[threading.Thread] = None
+# context tokens of handles that ended while a later span was current, by their span.
+# kept per context like the tokens themselves, and replaced rather than mutated,
+# so tasks and threads that copy the context don't share it
+_pending_detach: ContextVar[Dict[Span, object]] = ContextVar("iudex_pending_detach", default={})
+
+
+def _context_owner() -> Tuple[int, Optional[asyncio.Task]]:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        # no running event loop
+        task = None
+    return threading.get_ident(), task
+
+
+def _detach_ended_spans():
+    pending = _pending_detach.get()
+    while pending:
+        span = otel_trace.get_current_span()
+        token = pending.get(span)
+        if token is None:
+            break
+        pending = {key: value for key, value in pending.items() if key is not span}
+        context.detach(token)
+    _pending_detach.set(pending)
+
 
 def start_trace(
     name: Optional[str] = "default",
     attributes: Optional[dict] = None,
     current_context: Optional[otel_trace.SpanContext] = None,
-) -> Optional[object]:
+    make_current: bool = True,
+) -> SpanHandle:
+    """Starts a span and returns its handle, pass it to `end_trace` or call `handle.end()`.
+
+    Also works as a context manager:
+
+        with start_trace("job") as handle:
+            ...
+
+    Args:
+        name (Optional[str]): Span name.
+        attributes (Optional[Dict[str, Any]]): Attributes to add to the span.
+        current_context (Optional[Context]): Context the span is made current in, defaults to
+            the current one. The span's parent is always the current span.
+        make_current (bool): Whether the span becomes current until it ends.
+    """
     tracer = otel_trace.get_tracer(__name__)
+    span = tracer.start_span(name or "default", attributes=attributes)
+    token = None
+    if make_current:
+        token = context.attach(otel_trace.set_span_in_context(span, current_context))
+    handle = SpanHandle(span, token)
+    if _leak_detector is not None:
+        _open_handles[id(handle)] = handle
+    return handle
 
-    # Create new span
-    span = tracer.start_span(name or "default")
-    if attributes:
-        span.set_attributes(attributes)
 
-    ctx = otel_trace.set_span_in_context(span, current_context)
-    return context.attach(ctx)
+def end_trace(handle: SpanHandle) -> Optional[Span]:
+    """Ends the span started by `start_trace`, even if another span is current."""
+    if not isinstance(handle, SpanHandle):
+        # raw context tokens can't tell which span they belong to, end the current one
+        span = otel_trace.get_current_span()
+        context.detach(handle)
+        span.end()
+        return span
+    handle.end()
+    return handle.span
 
 
-def end_trace(
-    token: object,
-) -> Optional[Span]:
-    span = otel_trace.get_current_span()
-    
-    # End the span and remove span from context
-    context.detach(token)
-    span.end()
+def enable_span_leak_detector(timeout: float = 300, interval: Optional[float] = None):
+    """Warns about spans from `start_trace` that are still open after timeout seconds.
+
+    Each leaked span is reported once, logged and marked with `iudex.span.leaked`.
+    Can also be enabled with the IUDEX_SPAN_LEAK_TIMEOUT env var.
+    """
+    global _leak_detector
+    if _leak_detector is not None:
+        return
+    interval = interval or min(timeout, 60)
+
+    def check_leaks():
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            for key, handle in list(_open_handles.items()):
+                age = now - handle._started
+                if age < timeout:
+                    continue
+                _open_handles.pop(key, None)
+                name = getattr(handle.span, "name", None)
+                logger.warning(f"[IUDEX] span {name!r} was not ended after {age:.1f}s")
+                if handle.span.is_recording():
+                    handle.span.set_attribute("iudex.span.leaked", True)
 
-    return span
+    _leak_detector = threading.Thread(target=check_leaks, name="iudex-span-leak-detector", daemon=True)
+    _leak_detector.start()
+
+
+if os.getenv("IUDEX_SPAN_LEAK_TIMEOUT"):
+    enable_span_leak_detector(float(os.environ["IUDEX_SPAN_LEAK_TIMEOUT"]))
 
 
 def trace(
@@ -46,14 +217,30 @@ def trace(
     ignore_kwargs: Optional[bool] = None,
     attributes: Optional[dict] = None,
     get_attributes: Optional[Callable] = None,
+    sample_rate: float = 1.0,
+    slow_threshold: Optional[float] = None,
+    metrics: bool = False,
 ) -> Callable:
     """Decorator to trace a function with OpenTelemetry.
 
+    Coroutine functions, generators and async generators are supported,
+    the span stays open until the coroutine returns or the generator is exhausted or closed.
+    Generator spans also record the number of items yielded and the time to the first item.
+
+    For hot functions, use sample_rate to only create spans for a fraction of calls.
+    Sampled out calls that raise or are slower than slow_threshold still get a span after the fact,
+    and with metrics=True every call feeds the `iudex.function.duration` histogram and
+    `iudex.function.errors` counter, keyed by function name.
+
     Args:
         name (Optional[str]): Optional span name. Defaults to the wrapped function's name.
         ignore_args (Optional[bool]): Whether to ignore positional arguments, tracking is on by default.
         ignore_kwargs (Optional[bool]): Whether to ignore keyword arguments, tracking is on by default.
         attributes (Optional[Dict[str, Any]]): Additional attributes to add to the span.
+        get_attributes (Optional[Callable]): Called with the bound instance to get additional span attributes.
+        sample_rate (float): Fraction of calls that create a span, 1.0 by default.
+        slow_threshold (Optional[float]): Seconds after which a sampled out call still gets a span.
+        metrics (bool): Whether to record duration and error metrics for every call.
     """
     if wrapped is None:
         return functools.partial(
@@ -62,39 +249,397 @@ def trace(
             ignore_args=ignore_args,
             ignore_kwargs=ignore_kwargs,
             attributes=attributes,
+            get_attributes=get_attributes,
+            sample_rate=sample_rate,
+            slow_threshold=slow_threshold,
+            metrics=metrics,
         )
 
-    @wrapt.decorator
+    span_name = name or wrapped.__name__
+    # resolved once, the API's proxy tracer picks up the provider set later by `instrument`
+    tracer = otel_trace.get_tracer(__name__)
+    call_metrics = _FunctionMetrics(span_name, wrapped.__module__) if metrics else None
+    sampled = sample_rate < 1.0
+    if sampled:
+        # lets backends scale counts from sampled spans back up
+        attributes = {**(attributes or {}), "iudex.sample_rate": sample_rate}
+
+    def set_call_attributes(span: Span, instance, args, kwargs):
+        # skip all argument work for sampled out / non-recording spans
+        if not span.is_recording():
+            return
+        if get_attributes:
+            instance_attrs = get_attributes(instance)
+            if instance_attrs:
+                span.set_attributes(instance_attrs)
+        if args and not ignore_args:
+            _set_args_attributes(span, args)
+        if kwargs and not ignore_kwargs:
+            _set_kwargs_attributes(span, kwargs)
+
+    def is_sampled_out() -> bool:
+        return sampled and random.random() >= sample_rate
+
+    def finish_call(start: float, error: Optional[Exception]):
+        if call_metrics:
+            call_metrics.record(time.perf_counter() - start, error)
+
+    def finish_sampled_out_call(
+        start_ns: int, start: float, error: Optional[Exception], instance, args, kwargs
+    ):
+        duration = time.perf_counter() - start
+        if call_metrics:
+            call_metrics.record(duration, error)
+        is_slow = slow_threshold is not None and duration >= slow_threshold
+        if error is None and not is_slow:
+            return
+        # children of this call already ran under the caller's span, so this one is a leaf
+        span = tracer.start_span(span_name, attributes=attributes, start_time=start_ns)
+        set_call_attributes(span, instance, args, kwargs)
+        span.set_attribute("iudex.sampled_by", "error" if error is not None else "slow_threshold")
+        if error is not None:
+            _record_error(span, error)
+        span.end(end_time=start_ns + int(duration * 1e9))
+
+    if inspect.isasyncgenfunction(wrapped):
+
+        @wrapt.decorator(proxy=_TracedFunction)
+        def async_gen_wrapper(wrapped: Callable, instance, args, kwargs) -> Any:
+            if is_sampled_out():
+                return wrapped(*args, **kwargs)
+            span = tracer.start_span(span_name, attributes=attributes)
+            try:
+                set_call_attributes(span, instance, args, kwargs)
+                agen = wrapped(*args, **kwargs)
+            except Exception as e:
+                _record_error(span, e)
+                span.end()
+                raise e
+            return _traced_async_generator(span, agen)
+
+        return async_gen_wrapper(wrapped)  # type: ignore
+
+    if inspect.isgeneratorfunction(wrapped):
+
+        @wrapt.decorator(proxy=_TracedFunction)
+        def gen_wrapper(wrapped: Callable, instance, args, kwargs) -> Any:
+            if is_sampled_out():
+                return wrapped(*args, **kwargs)
+            span = tracer.start_span(span_name, attributes=attributes)
+            try:
+                set_call_attributes(span, instance, args, kwargs)
+                gen = wrapped(*args, **kwargs)
+            except Exception as e:
+                _record_error(span, e)
+                span.end()
+                raise e
+            return _traced_generator(span, gen)
+
+        return gen_wrapper(wrapped)  # type: ignore
+
+    if inspect.iscoroutinefunction(wrapped):
+
+        @wrapt.decorator(proxy=_TracedFunction)
+        async def async_wrapper(wrapped: Callable, instance, args, kwargs) -> Any:
+            start = time.perf_counter()
+            error = None
+            if is_sampled_out():
+                start_ns = time.time_ns()
+                try:
+                    return await wrapped(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise e
+                finally:
+                    finish_sampled_out_call(start_ns, start, error, instance, args, kwargs)
+
+            span = tracer.start_span(span_name, attributes=attributes)
+            token = context.attach(otel_trace.set_span_in_context(span))
+            try:
+                set_call_attributes(span, instance, args, kwargs)
+                return await wrapped(*args, **kwargs)
+            except Exception as e:
+                error = e
+                _record_error(span, e)
+                raise e
+            finally:
+                context.detach(token)
+                span.end()
+                finish_call(start, error)
+
+        return async_wrapper(wrapped)  # type: ignore
+
+    # attach/detach directly instead of start_as_current_span, whose nested
+    # context managers dominate the per-call cost of unsampled spans
+    @wrapt.decorator(proxy=_TracedFunction)
     def wrapper(wrapped: Callable, instance, args, kwargs) -> Any:
-        tracer = otel_trace.get_tracer(__name__)
-        with tracer.start_as_current_span(name or wrapped.__name__) as span:
+        start = time.perf_counter()
+        error = None
+        if is_sampled_out():
+            start_ns = time.time_ns()
             try:
-                if attributes:
-                    span.set_attributes(attributes)
-                if get_attributes:
-                    instance_attrs = get_attributes(instance)
-                    if instance_attrs:
-                        span.set_attributes(instance_attrs)
-
-                if args and not ignore_args:
-                    if len(args) == 1:
-                        span.set_attribute("arg", args[0])
-                    elif len(args) > 1:
-                        span.set_attribute("args", args)
-                if kwargs and not ignore_kwargs:
-                    span.set_attributes(kwargs)
-
-                ret = wrapped(*args, **kwargs)
-
-                return ret
+                return wrapped(*args, **kwargs)
             except Exception as e:
-                span.set_status(StatusCode.ERROR, str(e))
-                span.record_exception(e)
+                error = e
                 raise e
+            finally:
+                finish_sampled_out_call(start_ns, start, error, instance, args, kwargs)
+
+        span = tracer.start_span(span_name, attributes=attributes)
+        token = context.attach(otel_trace.set_span_in_context(span))
+        try:
+            set_call_attributes(span, instance, args, kwargs)
+            return wrapped(*args, **kwargs)
+        except Exception as e:
+            error = e
+            _record_error(span, e)
+            raise e
+        finally:
+            context.detach(token)
+            span.end()
+            finish_call(start, error)
 
     return wrapper(wrapped)  # type: ignore
 
 
+def _import_traced(module: str, qualname: str) -> Any:
+    obj = importlib.import_module(module)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+class _TracedFunction(wrapt.FunctionWrapper):
+    """A traced function, pickled by reference like the function it wraps.
+
+    Lets traced functions be submitted to process pools, where the worker imports them.
+    """
+
+    def __reduce_ex__(self, protocol):
+        module, qualname = self.__module__, self.__qualname__
+        if "<locals>" in qualname:
+            raise pickle.PicklingError(
+                f"Can't pickle traced function {module}.{qualname}, it is defined inside a function"
+            )
+        return _import_traced, (module, qualname)
+
+
+class _FunctionMetrics:
+    """Per-function duration histogram and error counter, attributes built once."""
+
+    __slots__ = ("attributes",)
+
+    def __init__(self, function_name: str, namespace: str):
+        self.attributes = {"code.function": function_name, "code.namespace": namespace}
+
+    def record(self, duration: float, error: Optional[Exception]):
+        _function_duration_histogram.record(duration, attributes=self.attributes)
+        if error is not None:
+            _function_error_counter.add(
+                1, attributes={**self.attributes, "error.type": error.__class__.__name__}
+            )
+
+
+def _capped(value: Any) -> Any:
+    """Bounds an argument before it becomes a span attribute."""
+    value = to_attribute_value(value)
+    if isinstance(value, str):
+        if len(value) > MAX_TRACED_ARG_LENGTH:
+            return value[:MAX_TRACED_ARG_LENGTH] + "..."
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        if len(value) > MAX_TRACED_ARG_LENGTH:
+            return f"<{type(value).__name__} len={len(value)}>"
+        return value
+    if isinstance(value, (list, tuple)) and len(value) > MAX_TRACED_ARGS:
+        return value[:MAX_TRACED_ARGS]
+    return value
+
+
+def _set_args_attributes(span: Span, args: tuple):
+    if len(args) == 1:
+        span.set_attribute("arg", _capped(args[0]))
+        return
+    capped_args = tuple(_capped(arg) for arg in args[:MAX_TRACED_ARGS])
+    # attribute sequences must be homogeneous, stringify rather than have the value dropped
+    first_type = type(capped_args[0])
+    if first_type not in _PRIMITIVE_TYPES or any(type(arg) is not first_type for arg in capped_args):
+        capped_args = tuple(_capped(str(arg)) for arg in capped_args)
+    span.set_attribute("args", capped_args)
+
+
+def _set_kwargs_attributes(span: Span, kwargs: dict):
+    span.set_attributes(
+        {key: _capped(value) for key, value in islice(kwargs.items(), MAX_TRACED_ARGS)}
+    )
+
+
+def _record_error(span: Span, e: Exception):
+    span.set_status(StatusCode.ERROR, str(e))
+    span.record_exception(e)
+
+
+class _YieldStats:
+    __slots__ = ("start", "count", "first_item")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.count = 0
+        self.first_item: Optional[float] = None
+
+    def on_item(self):
+        if self.first_item is None:
+            self.first_item = time.perf_counter()
+        self.count += 1
+
+    def set_attributes(self, span: Span):
+        span.set_attribute("generator.yield_count", self.count)
+        if self.first_item is not None:
+            span.set_attribute(
+                "generator.time_to_first_item_ms", (self.first_item - self.start) * 1000
+            )
+
+
+def _traced_generator(span: Span, gen: Generator) -> Generator:
+    """Drives gen with span current only while gen runs, so context never leaks across yields."""
+    stats = _YieldStats()
+    to_send: Any = None
+    to_throw: Optional[BaseException] = None
+    try:
+        while True:
+            token = context.attach(otel_trace.set_span_in_context(span))
+            try:
+                if to_throw is not None:
+                    exc, to_throw = to_throw, None
+                    item = gen.throw(exc)
+                else:
+                    item = gen.send(to_send)
+            except StopIteration as e:
+                return e.value
+            finally:
+                context.detach(token)
+
+            stats.on_item()
+            try:
+                to_send = yield item
+            except GeneratorExit:
+                gen.close()
+                raise
+            except BaseException as e:
+                to_throw = e
+    except Exception as e:
+        _record_error(span, e)
+        raise e
+    finally:
+        stats.set_attributes(span)
+        span.end()
+
+
+async def _traced_async_generator(span: Span, agen: AsyncGenerator) -> AsyncGenerator:
+    stats = _YieldStats()
+    to_send: Any = None
+    to_throw: Optional[BaseException] = None
+    try:
+        while True:
+            token = context.attach(otel_trace.set_span_in_context(span))
+            try:
+                if to_throw is not None:
+                    exc, to_throw = to_throw, None
+                    item = await agen.athrow(exc)
+                else:
+                    item = await agen.asend(to_send)
+            except StopAsyncIteration:
+                return
+            finally:
+                context.detach(token)
+
+            stats.on_item()
+            try:
+                to_send = yield item
+            except GeneratorExit:
+                await agen.aclose()
+                raise
+            except BaseException as e:
+                to_throw = e
+    except Exception as e:
+        _record_error(span, e)
+        raise e
+    finally:
+        stats.set_attributes(span)
+        span.end()
+
+
+def trace_iter(
+    iterable: Iterable[T],
+    name: Optional[str] = None,
+    attributes: Optional[dict] = None,
+    slowest: int = 5,
+) -> Generator[T, None, None]:
+    """Traces a whole loop as a single span instead of one span per item.
+
+    Each item's latency, from requesting it until the loop asks for the next one, is kept
+    in a fixed-bucket histogram, and the span records the item count, total duration,
+    throughput, latency percentiles, and the slowest items as `iteration.slow_item` events.
+    The span is not made current while the loop body runs, so breaking out of the loop can't leak it.
+
+    Example:
+        for row in trace_iter(rows, name="process_rows"):
+            process(row)
+
+    Args:
+        iterable (Iterable): The items to loop over.
+        name (Optional[str]): Optional span name. Defaults to "iteration".
+        attributes (Optional[Dict[str, Any]]): Additional attributes to add to the span.
+        slowest (int): Number of slowest items to record as span events.
+    """
+    tracer = otel_trace.get_tracer(__name__)
+    start_ns = time.time_ns()
+    span = tracer.start_span(name or "iteration", attributes=attributes, start_time=start_ns)
+    if not span.is_recording():
+        try:
+            yield from iterable
+        finally:
+            span.end()
+        return
+
+    histogram = FixedBucketHistogram(LATENCY_BOUNDS)
+    # min-heap of (duration, index, item start), so the fastest of the slowest is evicted
+    slowest_items: List[Tuple[float, int, float]] = []
+    loop_start = time.perf_counter()
+    item_start = loop_start
+    index = 0
+    try:
+        for item in iterable:
+            yield item
+            now = time.perf_counter()
+            duration = now - item_start
+            histogram.record(duration)
+            if slowest > 0:
+                if len(slowest_items) < slowest:
+                    heapq.heappush(slowest_items, (duration, index, item_start))
+                elif duration > slowest_items[0][0]:
+                    heapq.heapreplace(slowest_items, (duration, index, item_start))
+            index += 1
+            item_start = now
+    except Exception as e:
+        _record_error(span, e)
+        raise e
+    finally:
+        total = time.perf_counter() - loop_start
+        span.set_attributes(histogram.to_attributes("iteration.item_duration"))
+        span.set_attribute("iteration.duration", total)
+        if total > 0:
+            span.set_attribute("iteration.items_per_second", histogram.count / total)
+        for duration, item_index, item_started in sorted(slowest_items, reverse=True):
+            span.add_event(
+                "iteration.slow_item",
+                {"iteration.index": item_index, "iteration.item_duration": duration},
+                # perf_counter offsets mapped onto the span's wall clock start
+                timestamp=start_ns + int((item_started - loop_start) * 1e9),
+            )
+        span.end()
+
+
 def trace_lambda(
     name: Optional[str] = None,
     ignore_args: Optional[bool] = None,
@@ -107,5 +652,5 @@ def trace_lambda(
 def set_attribute(key: str, value: Any):
     """Set an attribute in the current span."""
     span = otel_trace.get_current_span()
-    if span:
-        span.set_attribute(key, value)
+    if span and span.is_recording():
+        span.set_attribute(key, to_attribute_value(value))
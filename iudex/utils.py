@@ -8,6 +8,7 @@ from typing import Any
 from packaging.requirements import Requirement
 
 from .asgi import client_request_hook, client_response_hook
+from .wsgi import WSGI_INSTRUMENTOR_HOOKS
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +21,13 @@ def maybe_instrument_lib(
     instrumentor_class_name: str,
     constructor_kwargs: dict[str, Any],
     instrument_kwargs: dict[str, Any],
+    websocket_sessions: bool = False,
 ):
+    """Instruments a library if it's installed.
+
+    Set `websocket_sessions` only when `WebSocketSessionMiddleware` is installed, since it
+    stops the ASGI instrumentors from creating per-message websocket spans.
+    """
     try:
         # skip lambda warnings
         if instrumentor_class_name == "AwsLambdaInstrumentor":
@@ -34,6 +41,13 @@ def maybe_instrument_lib(
         if not disable_req_res_tracing and instrumentor_class_name in ASGI_INSTRUMENTORS:
             instrument_kwargs["client_request_hook"] = client_request_hook
             instrument_kwargs["client_response_hook"] = client_response_hook
+        # websocket sessions are aggregated by WebSocketSessionMiddleware instead of per-message spans
+        if websocket_sessions and instrumentor_class_name in ASGI_INSTRUMENTORS:
+            instrument_kwargs.setdefault("exclude_spans", ["receive", "send"])
+        if not disable_req_res_tracing and module_path in WSGI_INSTRUMENTOR_HOOKS:
+            request_hook, response_hook = WSGI_INSTRUMENTOR_HOOKS[module_path]
+            instrument_kwargs.setdefault("request_hook", request_hook)
+            instrument_kwargs.setdefault("response_hook", response_hook)
 
         # get instrumentor and its requirements
         package = "iudex" if module_path[0] == "." else None
@@ -0,0 +1,197 @@
+import logging
+from typing import Any, Dict, Optional
+
+from opentelemetry.trace import Span
+
+from .body import (
+    DEFAULT_MAX_BODY_BYTES,
+    process_value,
+    set_body_attributes,
+    set_request_body_attributes,
+    set_response_body_attributes,
+)
+
+logger = logging.getLogger(__name__)
+
+_ENVIRON_TEE_KEY = "iudex.wsgi.input_tee"
+
+
+class TeeInput:
+    """Proxy for `wsgi.input` that keeps a copy of the first `max_bytes` the app reads.
+
+    Only bytes the app reads are captured, so the app never waits on a body read it didn't ask for.
+    """
+
+    __slots__ = ("_stream", "_buffer", "_max_bytes")
+
+    def __init__(self, stream, max_bytes: int = DEFAULT_MAX_BODY_BYTES):
+        self._stream = stream
+        self._buffer = bytearray()
+        self._max_bytes = max_bytes
+
+    def _tee(self, data):
+        remaining = self._max_bytes - len(self._buffer)
+        if remaining > 0 and data:
+            self._buffer += data[:remaining]
+        return data
+
+    def read(self, *args):
+        return self._tee(self._stream.read(*args))
+
+    def readline(self, *args):
+        return self._tee(self._stream.readline(*args))
+
+    def readlines(self, *args):
+        return [self._tee(line) for line in self._stream.readlines(*args)]
+
+    def __iter__(self):
+        for line in self._stream:
+            yield self._tee(line)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    @property
+    def captured(self) -> bytes:
+        return bytes(self._buffer)
+
+
+def _content_length(value) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _set_captured_request_body(span: Span, tee: Optional[TeeInput], content_type: str, content_length):
+    if tee is None:
+        return
+    set_request_body_attributes(span, tee.captured, content_type, _content_length(content_length))
+
+
+def _capped_body(body) -> Optional[bytes]:
+    if isinstance(body, str):
+        body = body[:DEFAULT_MAX_BODY_BYTES].encode("utf-8")
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return bytes(body[:DEFAULT_MAX_BODY_BYTES])
+    return None
+
+
+def _capped_chunks(chunks) -> bytes:
+    """Joins body chunks up to `DEFAULT_MAX_BODY_BYTES`, stopping there instead of joining the whole body."""
+    buffer = bytearray()
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        buffer += chunk[: DEFAULT_MAX_BODY_BYTES - len(buffer)]
+        if len(buffer) >= DEFAULT_MAX_BODY_BYTES:
+            break
+    return bytes(buffer)
+
+
+# Flask
+# request_hook(span, environ), response_hook(span, status, response_headers)
+
+
+def flask_request_hook(span: Span, environ: Dict[str, Any]):
+    if not (span and span.is_recording()):
+        return
+    tee = TeeInput(environ["wsgi.input"])
+    environ["wsgi.input"] = tee
+    environ[_ENVIRON_TEE_KEY] = tee
+
+    import flask
+
+    @flask.after_this_request
+    def _capture_response_body(response):
+        # streamed bodies are drained after the span ends, so only buffered bodies are captured
+        if span.is_recording() and not response.is_streamed:
+            set_response_body_attributes(span, _capped_chunks(response.iter_encoded()))
+        return response
+
+
+def flask_response_hook(span: Span, status: str, response_headers):
+    if not (span and span.is_recording()):
+        return
+    import flask
+
+    if not flask.has_request_context():
+        return
+    environ = flask.request.environ
+    _set_captured_request_body(
+        span,
+        environ.get(_ENVIRON_TEE_KEY),
+        environ.get("CONTENT_TYPE", ""),
+        environ.get("CONTENT_LENGTH"),
+    )
+
+
+# Django
+# request_hook(span, request), response_hook(span, request, response)
+
+
+def django_request_hook(span: Span, request):
+    if not (span and span.is_recording()):
+        return
+    # WSGIRequest reads through a LimitedStream built from wsgi.input, so tee that instead
+    stream = getattr(request, "_stream", None)
+    if stream is None:
+        return
+    tee = TeeInput(stream)
+    request._stream = tee
+    request.META[_ENVIRON_TEE_KEY] = tee
+
+
+def django_response_hook(span: Span, request, response):
+    if not (span and span.is_recording()):
+        return
+    _set_captured_request_body(
+        span,
+        request.META.get(_ENVIRON_TEE_KEY),
+        request.META.get("CONTENT_TYPE", ""),
+        request.META.get("CONTENT_LENGTH"),
+    )
+    if not getattr(response, "streaming", False):
+        set_response_body_attributes(span, _capped_chunks(response))
+
+
+# Falcon
+# request_hook(span, req), response_hook(span, req, resp)
+
+
+def falcon_request_hook(span: Span, req):
+    if not (span and span.is_recording()):
+        return
+    tee = TeeInput(req.stream)
+    req.stream = tee
+    req.env[_ENVIRON_TEE_KEY] = tee
+
+
+def falcon_response_hook(span: Span, req, resp):
+    if not (span and span.is_recording()):
+        return
+    _set_captured_request_body(
+        span,
+        req.env.get(_ENVIRON_TEE_KEY),
+        req.content_type or "",
+        req.content_length,
+    )
+    # media is still a python object here, so bound it directly instead of serializing it
+    media = getattr(resp, "media", None)
+    if media is not None:
+        processed = process_value(media, -1)
+        if not isinstance(processed, dict):
+            processed = {"body": processed}
+        set_body_attributes(span, "http.response.body", processed)
+        return
+    body = _capped_body(getattr(resp, "data", None) or getattr(resp, "text", None))
+    if body is not None:
+        set_response_body_attributes(span, body)
+
+
+# keyed by module path since iudex's own DjangoInstrumentor shares the class name
+WSGI_INSTRUMENTOR_HOOKS = {
+    "opentelemetry.instrumentation.flask": (flask_request_hook, flask_response_hook),
+    "opentelemetry.instrumentation.django": (django_request_hook, django_response_hook),
+    "opentelemetry.instrumentation.falcon": (falcon_request_hook, falcon_response_hook),
+}
@@ -0,0 +1,19 @@
+import pytest
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+# the global provider can only be set once per process, so every test shares it
+_exporter = InMemorySpanExporter()
+tracer_provider = TracerProvider()
+tracer_provider.add_span_processor(SimpleSpanProcessor(_exporter))
+otel_trace.set_tracer_provider(tracer_provider)
+
+
+@pytest.fixture
+def spans() -> InMemorySpanExporter:
+    """Spans ended during the test, via `spans.get_finished_spans()`."""
+    _exporter.clear()
+    yield _exporter
+    _exporter.clear()
@@ -0,0 +1,37 @@
+from iudex.openai.v1 import assistant_state
+from iudex.openai.v1.assistant_state import TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache["a"] = 1
+    cache["b"] = 2
+    # reading "a" makes "b" the least recently used
+    assert cache.get("a") == 1
+    cache["c"] = 3
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(assistant_state.time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache["a"] = 1
+
+    now[0] += 4
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a", "expired") == "expired"
+    assert "a" not in cache
+
+
+def test_ttl_cache_pop():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache["a"] = 1
+
+    assert cache.pop("a") == 1
+    assert cache.pop("a", None) is None
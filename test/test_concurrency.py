@@ -0,0 +1,150 @@
+import asyncio
+import pickle
+import threading
+
+import pytest
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from iudex import concurrency, config
+from iudex.concurrency import (
+    TimedSemaphore,
+    TracedThreadPoolExecutor,
+    _worker_config_kwargs,
+    with_context,
+)
+from iudex.config import _reset_session_connections
+from iudex.trace import trace
+
+tracer = otel_trace.get_tracer(__name__)
+
+
+@trace
+def traced_double(x):
+    return x * 2
+
+
+def _current_trace_id(*args):
+    return otel_trace.get_current_span().get_span_context().trace_id
+
+
+def test_with_context_is_picklable_and_joins_the_callers_trace():
+    with tracer.start_as_current_span("parent") as parent:
+        bound = pickle.loads(pickle.dumps(with_context(_current_trace_id)))
+    assert bound() == parent.get_span_context().trace_id
+
+
+def test_traced_functions_pickle_by_reference():
+    assert pickle.loads(pickle.dumps(traced_double)) is traced_double
+
+
+def test_local_traced_functions_fail_clearly():
+    @trace
+    def local():
+        pass
+
+    with pytest.raises(pickle.PicklingError, match="defined inside a function"):
+        pickle.dumps(local)
+
+
+def test_thread_pool_tasks_run_in_the_submitting_context(spans, monkeypatch):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter(__name__)
+    monkeypatch.setattr(concurrency, "_pool_queue_wait_histogram", meter.create_histogram("queue_wait"))
+
+    with TracedThreadPoolExecutor(max_workers=2, pool_name="llm") as pool:
+        with tracer.start_as_current_span("parent") as parent:
+            results = list(pool.map(traced_double, range(3)))
+
+    assert results == [0, 2, 4]
+    children = [span for span in spans.get_finished_spans() if span.name == "traced_double"]
+    assert len(children) == 3
+    assert all(span.parent.span_id == parent.get_span_context().span_id for span in children)
+
+    (point,) = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics[0].data.data_points
+    assert point.count == 3
+    assert dict(point.attributes) == {"iudex.pool.name": "llm"}
+
+
+def test_unnamed_pools_share_the_default_name():
+    with TracedThreadPoolExecutor() as pool:
+        assert pool.pool_name == "default"
+
+
+def test_worker_config_leaves_out_unpicklable_values(monkeypatch, caplog):
+    monkeypatch.setattr(
+        config, "IUDEX_CONFIG_KWARGS", {"service_name": "svc", "redact": lambda record: None}
+    )
+    assert _worker_config_kwargs() == {"service_name": "svc"}
+    assert "'redact'" in caplog.text
+
+
+def test_worker_config_without_instrument(monkeypatch):
+    monkeypatch.setattr(config, "IUDEX_CONFIG_KWARGS", None)
+    assert _worker_config_kwargs() is None
+
+
+def test_forked_sessions_get_fresh_connection_pools():
+    import requests
+
+    session = requests.Session()
+    session.headers["x-api-key"] = "key"
+    adapter = session.get_adapter("https://api.iudex.ai")
+    _reset_session_connections(session)
+    assert session.get_adapter("https://api.iudex.ai") is not adapter
+    assert session.headers["x-api-key"] == "key"
+
+
+@pytest.fixture
+def wait_reader(monkeypatch):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter(__name__)
+    monkeypatch.setattr(concurrency, "_semaphore_wait_histogram", meter.create_histogram("wait"))
+    return reader
+
+
+def _wait_points(reader):
+    return reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics[0].data.data_points
+
+
+def test_timed_semaphore_records_the_wait(spans, wait_reader):
+    semaphore = TimedSemaphore(threading.Semaphore(1), name="llm")
+    with tracer.start_as_current_span("call") as span:
+        with semaphore:
+            assert semaphore.locked()
+
+    assert span.attributes[concurrency.SEMAPHORE_WAIT_ATTRIBUTE] >= 0
+    (point,) = _wait_points(wait_reader)
+    assert point.count == 1
+    assert dict(point.attributes) == {concurrency.SEMAPHORE_NAME_ATTRIBUTE: "llm"}
+
+
+def test_timed_semaphore_does_not_record_failed_acquires(wait_reader):
+    semaphore = TimedSemaphore(threading.Semaphore(0))
+    assert semaphore.acquire(blocking=False) is False
+    assert wait_reader.get_metrics_data() is None or not wait_reader.get_metrics_data().resource_metrics
+
+
+def test_timed_asyncio_semaphore(wait_reader):
+    semaphore = TimedSemaphore(asyncio.Semaphore(1))
+
+    async def acquire_twice():
+        async with semaphore:
+            pass
+        assert await semaphore.acquire_async() is True
+        semaphore.release()
+
+    asyncio.run(acquire_twice())
+    (point,) = _wait_points(wait_reader)
+    assert point.count == 2
+
+
+def test_timed_semaphore_rejects_the_wrong_acquire():
+    with pytest.raises(TypeError, match="acquire_async"):
+        TimedSemaphore(asyncio.Semaphore(1)).acquire()
+    with pytest.raises(TypeError, match="acquire_async"):
+        with TimedSemaphore(asyncio.Semaphore(1)):
+            pass
+    with pytest.raises(TypeError, match="acquire()"):
+        asyncio.run(TimedSemaphore(threading.Semaphore(1)).acquire_async())
@@ -0,0 +1,104 @@
+import base64
+import struct
+from types import SimpleNamespace
+
+import pytest
+from opentelemetry import trace as otel_trace
+from opentelemetry.semconv.ai import SpanAttributes
+
+from iudex.openai.shared.config import Config
+from iudex.openai.shared.embeddings_wrappers import (
+    DIMENSIONS_ATTRIBUTE,
+    INPUT_COUNT_ATTRIBUTE,
+    INPUT_DIGEST_ATTRIBUTE,
+    INPUT_TOKENS_ESTIMATED_MAX_ATTRIBUTE,
+    INPUT_TOKENS_ESTIMATED_MEAN_ATTRIBUTE,
+    INPUT_TOKENS_ESTIMATED_MIN_ATTRIBUTE,
+    INPUT_TOKENS_MEAN_ATTRIBUTE,
+    _batch_inputs,
+    _embedding_dimensions,
+    _handle_response,
+    _inputs_digest,
+    _set_input_attributes,
+    _set_prompts,
+)
+
+
+@pytest.mark.parametrize("dimensions", [1, 2, 3, 5, 1536])
+def test_embedding_dimensions_of_base64_vector(dimensions):
+    encoded = base64.b64encode(struct.pack(f"<{dimensions}f", *range(dimensions))).decode()
+
+    assert _embedding_dimensions(encoded) == dimensions
+
+
+def test_embedding_dimensions_of_float_vector():
+    assert _embedding_dimensions([0.1, 0.2, 0.3]) == 3
+
+
+@pytest.mark.parametrize("embedding", [None, [], ""])
+def test_embedding_dimensions_of_missing_vector(embedding):
+    assert _embedding_dimensions(embedding) == 0
+
+
+@pytest.mark.parametrize(
+    "prompt, expected",
+    [
+        (None, []),
+        ("hello", ["hello"]),
+        (["a", "b"], ["a", "b"]),
+        ([1, 2, 3], [[1, 2, 3]]),
+        ([[1, 2], [3]], [[1, 2], [3]]),
+    ],
+)
+def test_batch_inputs(prompt, expected):
+    assert _batch_inputs(prompt) == expected
+
+
+def test_batch_inputs_are_not_copied():
+    batch = ["a", "b"]
+    assert _batch_inputs(batch) is batch
+
+
+def _span():
+    return otel_trace.get_tracer(__name__).start_span("openai.embeddings")
+
+
+def test_estimated_input_tokens(spans):
+    span = _span()
+    _set_input_attributes(span, ["abcd", "abcdefgh", [1, 2, 3]])
+    span.end()
+
+    assert span.attributes[INPUT_COUNT_ATTRIBUTE] == 3
+    assert span.attributes[INPUT_TOKENS_ESTIMATED_MIN_ATTRIBUTE] == 1
+    assert span.attributes[INPUT_TOKENS_ESTIMATED_MAX_ATTRIBUTE] == 3
+    assert span.attributes[INPUT_TOKENS_ESTIMATED_MEAN_ATTRIBUTE] == 2
+    assert INPUT_TOKENS_MEAN_ATTRIBUTE not in span.attributes
+
+
+def test_exact_mean_from_usage_is_kept_apart_from_the_estimate(spans):
+    span = _span()
+    _set_input_attributes(span, ["abcd", "abcd"])
+    response = SimpleNamespace(
+        model="text-embedding-3-small",
+        usage=SimpleNamespace(prompt_tokens=6),
+        data=[SimpleNamespace(embedding=[0.1, 0.2]), SimpleNamespace(embedding=[0.3, 0.4])],
+    )
+    response.usage.model_dump = lambda: {"prompt_tokens": 6, "total_tokens": 6}
+    _handle_response(response, span)
+    span.end()
+
+    assert span.attributes[INPUT_TOKENS_ESTIMATED_MEAN_ATTRIBUTE] == 1
+    assert span.attributes[INPUT_TOKENS_MEAN_ATTRIBUTE] == 3
+    assert span.attributes[DIMENSIONS_ATTRIBUTE] == 2
+
+
+def test_only_the_first_prompts_are_recorded(spans, monkeypatch):
+    monkeypatch.setattr(Config, "max_embedding_prompts", 2)
+    monkeypatch.setenv("TRACELOOP_TRACE_CONTENT", "true")
+    span = _span()
+    _set_prompts(span, ["a", "b", "c"])
+    span.end()
+
+    assert span.attributes[f"{SpanAttributes.LLM_PROMPTS}.1.content"] == "b"
+    assert f"{SpanAttributes.LLM_PROMPTS}.2.content" not in span.attributes
+    assert span.attributes[INPUT_DIGEST_ATTRIBUTE] == _inputs_digest(["a", "b", "c"])
@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+
+from openai import AssistantEventHandler
+from openai.lib.streaming import AsyncAssistantEventHandler
+from opentelemetry import trace as otel_trace
+from opentelemetry.semconv.ai import SpanAttributes
+
+from iudex.openai.v1.assistant_wrappers import (
+    aruns_create_and_stream_wrapper,
+    runs_create_and_stream_wrapper,
+)
+from iudex.openai.v1.event_handler_wrapper import AsyncEventHandleWrapper, EventHandleWrapper
+
+
+class RecordingHandler(AssistantEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def on_message_delta(self, delta, snapshot):
+        self.events.append(("on_message_delta", delta, snapshot))
+
+    def on_text_done(self, text):
+        self.events.append(("on_text_done", text.value))
+
+    def on_end(self):
+        self.events.append(("on_end",))
+
+
+class AsyncRecordingHandler(AsyncAssistantEventHandler):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    async def on_message_delta(self, delta, snapshot):
+        self.events.append(("on_message_delta", delta, snapshot))
+
+    async def on_text_done(self, text):
+        self.events.append(("on_text_done", text.value))
+
+    async def on_end(self):
+        self.events.append(("on_end",))
+
+
+def _span():
+    return otel_trace.get_tracer(__name__).start_span("openai.assistant.run_stream")
+
+
+def _completions(span):
+    prefix = SpanAttributes.LLM_COMPLETIONS
+    return [
+        (span.attributes[f"{prefix}.{i}.role"], span.attributes[f"{prefix}.{i}.content"])
+        for i in range(2)
+    ]
+
+
+def test_sync_wrapper_forwards_events_and_records_texts(spans):
+    handler = RecordingHandler()
+    span = _span()
+    wrapper = EventHandleWrapper(original_handler=handler, span=span)
+
+    wrapper.on_message_delta("delta", "snapshot")
+    wrapper.on_text_done(SimpleNamespace(value="first"))
+    wrapper.on_text_done(SimpleNamespace(value="second"))
+    wrapper.on_end()
+
+    assert handler.events == [
+        ("on_message_delta", "delta", "snapshot"),
+        ("on_text_done", "first"),
+        ("on_text_done", "second"),
+        ("on_end",),
+    ]
+    assert spans.get_finished_spans()[-1].context == span.get_span_context()
+    assert _completions(span) == [("assistant", "first"), ("assistant", "second")]
+
+
+def test_async_wrapper_forwards_events_and_records_texts(spans):
+    handler = AsyncRecordingHandler()
+    span = _span()
+    wrapper = AsyncEventHandleWrapper(original_handler=handler, span=span)
+
+    async def stream():
+        await wrapper.on_message_delta("delta", "snapshot")
+        await wrapper.on_text_done(SimpleNamespace(value="first"))
+        await wrapper.on_text_done(SimpleNamespace(value="second"))
+        await wrapper.on_end()
+
+    asyncio.run(stream())
+
+    assert handler.events == [
+        ("on_message_delta", "delta", "snapshot"),
+        ("on_text_done", "first"),
+        ("on_text_done", "second"),
+        ("on_end",),
+    ]
+    assert spans.get_finished_spans()[-1].context == span.get_span_context()
+    assert _completions(span) == [("assistant", "first"), ("assistant", "second")]
+
+
+def test_create_and_stream_without_event_handler():
+    tracer = otel_trace.get_tracer(__name__)
+    handlers = []
+
+    def wrapped(*args, **kwargs):
+        handlers.append(kwargs["event_handler"])
+
+    instance = SimpleNamespace(_client=None)
+    runs_create_and_stream_wrapper(tracer)(wrapped, instance, (), {"thread_id": "t", "assistant_id": "a"})
+    aruns_create_and_stream_wrapper(tracer)(wrapped, instance, (), {"thread_id": "t", "assistant_id": "a"})
+
+    assert isinstance(handlers[0], EventHandleWrapper)
+    assert type(handlers[0]._original_handler) is AssistantEventHandler
+    assert isinstance(handlers[1], AsyncEventHandleWrapper)
+    assert type(handlers[1]._original_handler) is AsyncAssistantEventHandler
@@ -0,0 +1,37 @@
+import pytest
+
+from iudex.histogram import FixedBucketHistogram, exponential_bounds
+
+
+def test_to_attributes_of_empty_histogram():
+    assert FixedBucketHistogram().to_attributes("latency") == {"latency.count": 0}
+
+
+def test_to_attributes():
+    histogram = FixedBucketHistogram(exponential_bounds(1, 2, 10))
+    for value in range(1, 101):
+        histogram.record(value)
+
+    attributes = histogram.to_attributes("size")
+
+    assert attributes["size.count"] == 100
+    assert attributes["size.sum"] == 5050
+    assert attributes["size.min"] == 1
+    assert attributes["size.max"] == 100
+    assert attributes["size.mean"] == 50.5
+    # percentiles are interpolated within power of two buckets
+    assert attributes["size.p50"] == pytest.approx(50, rel=0.1)
+    assert attributes["size.p90"] == pytest.approx(90, rel=0.1)
+    assert attributes["size.min"] <= attributes["size.p50"] <= attributes["size.p90"]
+    assert attributes["size.p90"] <= attributes["size.p99"] <= attributes["size.max"]
+
+
+def test_values_above_the_highest_bound():
+    histogram = FixedBucketHistogram([1, 2])
+    histogram.record(10)
+    histogram.record(20)
+
+    attributes = histogram.to_attributes("x")
+
+    assert attributes["x.max"] == 20
+    assert 10 <= attributes["x.p50"] <= 20
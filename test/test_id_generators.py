@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from iudex import config
+from iudex.config import ID_GENERATORS
+
+
+@pytest.fixture(params=sorted(ID_GENERATORS))
+def id_generator(request):
+    return ID_GENERATORS[request.param]()
+
+
+def test_ids_are_valid_and_unique(id_generator):
+    span_ids = [id_generator.generate_span_id() for _ in range(2000)]
+    trace_ids = [id_generator.generate_trace_id() for _ in range(2000)]
+
+    assert all(0 < span_id < 2**64 for span_id in span_ids)
+    assert all(0 < trace_id < 2**128 for trace_id in trace_ids)
+    assert len(set(span_ids)) == len(span_ids)
+    assert len(set(trace_ids)) == len(trace_ids)
+
+
+def test_ids_are_unique_across_threads(id_generator):
+    ids = []
+
+    def generate():
+        ids.extend(id_generator.generate_span_id() for _ in range(1000))
+
+    threads = [threading.Thread(target=generate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == len(ids) == 4000
+
+
+def test_secure_is_the_default():
+    assert config.DEFAULT_ID_GENERATOR == "secure"
+
+
+def test_buffers_are_dropped_after_fork():
+    id_generator = ID_GENERATORS["buffered"]()
+    id_generator.generate_span_id()
+    id_generator.generate_trace_id()
+    inherited = id_generator._local
+
+    # what a forked child runs
+    config._reset_buffered_id_generators()
+
+    assert id_generator._local is not inherited
+    assert not hasattr(id_generator._local, "span_ids")
+    assert id_generator.generate_span_id() not in inherited.span_ids
+
+
+def test_zero_ids_are_redrawn():
+    id_generator = ID_GENERATORS["buffered"]()
+    id_generator._local.span_ids = [7, 0]
+    id_generator._local.trace_ids = [9, 0]
+    assert id_generator.generate_span_id() == 7
+    assert id_generator.generate_trace_id() == 9
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from iudex.openai.shared import chat_wrappers, completion_wrappers, in_flight
+from iudex.openai.shared.in_flight import end_request, init_in_flight_metrics, start_request
+
+
+@pytest.fixture
+def reader():
+    reader = InMemoryMetricReader()
+    init_in_flight_metrics(MeterProvider(metric_readers=[reader]).get_meter(__name__))
+    yield reader
+    init_in_flight_metrics(None)
+
+
+def _in_flight(reader):
+    data = reader.get_metrics_data()
+    points = [
+        point
+        for resource_metrics in data.resource_metrics
+        for scope_metrics in resource_metrics.scope_metrics
+        for metric in scope_metrics.metrics
+        if metric.name == in_flight.IN_FLIGHT_METRIC
+        for point in metric.data.data_points
+    ]
+    return sum(point.value for point in points)
+
+
+# a v1 completion chunk, as far as the stream accumulator reads it
+CHUNK = SimpleNamespace(model="gpt-3.5-turbo-instruct", choices=[])
+
+
+def _span():
+    return otel_trace.get_tracer(__name__).start_span("openai.chat")
+
+
+class FakeStream:
+    def __init__(self, chunks, error=None):
+        self._chunks = iter(chunks)
+        self._error = error
+        self.closed = False
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            if self._error:
+                raise self._error
+            raise
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+def test_start_and_end_request(reader):
+    attributes = start_request("chat", "gpt-4o", None)
+    assert attributes["gen_ai.operation.name"] == "chat"
+    assert _in_flight(reader) == 1
+    end_request(attributes)
+    assert _in_flight(reader) == 0
+
+
+def test_disabled_without_a_meter():
+    init_in_flight_metrics(None)
+    assert start_request("chat", "gpt-4o", None) is None
+    end_request(None)
+
+
+def test_chat_stream_is_in_flight_until_exhausted(reader, spans):
+    attributes = start_request("chat", "gpt-4o", None)
+    stream = chat_wrappers.ChatStream(
+        _span(), FakeStream([]), request_kwargs={"model": "gpt-4o"}, in_flight=attributes
+    )
+    assert _in_flight(reader) == 1
+
+    assert list(stream) == []
+    assert _in_flight(reader) == 0
+
+
+def test_chat_stream_ends_in_flight_once_on_error_and_exit(reader, spans):
+    attributes = start_request("chat", "gpt-4o", None)
+    wrapped = FakeStream([], error=ConnectionError("reset"))
+    stream = chat_wrappers.ChatStream(
+        _span(), wrapped, request_kwargs={"model": "gpt-4o"}, in_flight=attributes
+    )
+
+    with pytest.raises(ConnectionError):
+        with stream:
+            next(stream)
+
+    assert wrapped.closed
+    assert _in_flight(reader) == 0
+
+
+def test_completion_stream_closed_early_ends_in_flight(reader, spans):
+    attributes = start_request("completion", "gpt-3.5-turbo-instruct", None)
+    stream = completion_wrappers._build_from_streaming_response(
+        _span(), {"model": "gpt-3.5-turbo-instruct"}, iter([CHUNK] * 3), attributes
+    )
+
+    next(stream)
+    assert _in_flight(reader) == 1
+    stream.close()
+    assert _in_flight(reader) == 0
+
+
+def test_async_completion_stream_is_in_flight_until_exhausted(reader, spans):
+    attributes = start_request("completion", "gpt-3.5-turbo-instruct", None)
+
+    async def chunks():
+        yield CHUNK
+
+    async def consume():
+        stream = completion_wrappers._abuild_from_streaming_response(
+            _span(), {"model": "gpt-3.5-turbo-instruct"}, chunks(), attributes
+        )
+        counts = []
+        async for _ in stream:
+            counts.append(_in_flight(reader))
+        return counts
+
+    assert asyncio.run(consume()) == [1]
+    assert _in_flight(reader) == 0
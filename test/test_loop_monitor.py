@@ -0,0 +1,78 @@
+import asyncio
+import contextvars
+import time
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from iudex import loop_monitor
+from iudex.loop_monitor import _context_span, monitor_event_loop
+
+tracer = otel_trace.get_tracer(__name__)
+
+
+async def _block(seconds: float):
+    with tracer.start_as_current_span("blocker"):
+        time.sleep(seconds)
+
+
+def test_stall_is_recorded_on_the_blocking_span(spans, caplog):
+    reader = InMemoryMetricReader()
+
+    async def main():
+        monitor = monitor_event_loop(
+            interval=0.02, threshold=0.05, meter_provider=MeterProvider(metric_readers=[reader])
+        )
+        await asyncio.sleep(0.05)
+        # created after the monitor starts, so its context is known on every Python >= 3.11
+        await asyncio.create_task(_block(0.3))
+        await asyncio.sleep(0.05)
+        return monitor
+
+    monitor = asyncio.run(main())
+
+    (span,) = spans.get_finished_spans()
+    (event,) = [event for event in span.events if event.name == "asyncio.loop.blocked"]
+    assert event.attributes["asyncio.loop.blocked_ms"] >= 50
+    assert "_block" in event.attributes["code.stacktrace"]
+    assert "event loop blocked for" in caplog.text
+
+    metrics = {
+        metric.name: metric.data.data_points
+        for metric in reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    }
+    assert metrics["asyncio.loop.blocked"][0].value >= 1
+    assert metrics["asyncio.loop.lag"][0].max >= 0.25
+
+    # stops itself once asyncio.run closes the loop
+    monitor._watchdog.join(timeout=1)
+    assert not monitor._watchdog.is_alive()
+    assert id(monitor.loop) not in loop_monitor._monitors
+
+
+def test_one_monitor_per_loop():
+    async def main():
+        first = monitor_event_loop(interval=0.02)
+        second = monitor_event_loop(interval=0.02)
+        first.stop()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first is second
+
+
+def test_context_span_reads_the_otel_context_of_a_task_context():
+    span = tracer.start_span("in task")
+    token = otel_context.attach(otel_trace.set_span_in_context(span))
+    try:
+        task_context = contextvars.copy_context()
+    finally:
+        otel_context.detach(token)
+        span.end()
+    assert _context_span(task_context) is span
+
+
+def test_context_span_without_otel_context():
+    assert _context_span(contextvars.Context()) is None
@@ -0,0 +1,103 @@
+import asyncio
+
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.trace import TracerProvider
+
+from iudex.asgi import (
+    PhaseTimer,
+    PhaseTimingMiddleware,
+    _phase_timer,
+    _timed_run_endpoint_function,
+    server_timing_header,
+)
+
+
+def test_durations_split_handler_and_serialize():
+    timer = PhaseTimer(1.0)
+    timer.receive_end = 1.5
+    timer.handler_start = 2.0
+    timer.handler_end = 4.0
+    timer.response_start = 4.5
+    timer.response_end = 6.0
+    assert timer.durations() == {
+        "receive": 0.5,
+        "handler": 2.0,
+        "serialize": 0.5,
+        "send": 1.5,
+        "total": 5.0,
+    }
+
+
+def test_durations_without_endpoint_hook_fold_serialize_into_handler():
+    timer = PhaseTimer(1.0)
+    timer.receive_end = 2.0
+    timer.response_start = 5.0
+    assert timer.durations() == {"receive": 1.0, "handler": 3.0}
+
+
+def test_server_timing_header():
+    assert server_timing_header({"handler": 0.0125}) == b"handler;dur=12.500"
+
+
+def _http_scope():
+    return {"type": "http", "method": "POST", "path": "/"}
+
+
+async def _endpoint_app(scope, receive, send):
+    await receive()
+
+    async def endpoint():
+        return b"ok"
+
+    body = await _timed_run_endpoint_function(endpoint, None, (), {})
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _run(app, scope):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def test_middleware_records_phases_on_span_and_histogram():
+    reader = InMemoryMetricReader()
+    middleware = PhaseTimingMiddleware(
+        _endpoint_app, server_timing=True, meter_provider=MeterProvider(metric_readers=[reader])
+    )
+    span = TracerProvider().get_tracer(__name__).start_span("request")
+    with otel_trace.use_span(span, end_on_exit=True):
+        sent = _run(middleware, _http_scope())
+
+    headers = dict(sent[0]["headers"])
+    assert headers[b"server-timing"].startswith(b"receive;dur=")
+    assert {"receive", "handler", "serialize", "send", "total"} <= {
+        key.split(".")[3] for key in span.attributes if key.startswith("http.server.phase.")
+    }
+
+    metrics = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    phases = {point.attributes["http.server.phase"] for point in metrics[0].data.data_points}
+    assert phases == {"receive", "handler", "serialize", "send", "total"}
+    assert _phase_timer.get() is None
+
+
+def test_middleware_passes_through_non_http_scopes():
+    reader = InMemoryMetricReader()
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(_phase_timer.get())
+
+    middleware = PhaseTimingMiddleware(app, meter_provider=MeterProvider(metric_readers=[reader]))
+    _run(middleware, {"type": "lifespan"})
+    assert calls == [None]
+    assert reader.get_metrics_data() is None or not reader.get_metrics_data().resource_metrics
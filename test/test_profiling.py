@@ -0,0 +1,110 @@
+import asyncio
+import sys
+import threading
+
+from opentelemetry.sdk.trace import TracerProvider
+
+from iudex.profiling import ActiveSpanTracker, StackSampler, fold_stack
+
+
+def _tracked_tracer():
+    tracker = ActiveSpanTracker()
+    provider = TracerProvider()
+    provider.add_span_processor(tracker)
+    return tracker, provider.get_tracer(__name__)
+
+
+def _from_other_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_tracker_keeps_the_innermost_open_span_per_thread():
+    tracker, tracer = _tracked_tracer()
+    thread_id = threading.get_ident()
+    with tracer.start_as_current_span("outer"):
+        with tracer.start_as_current_span("inner"):
+            assert tracker.current_span(thread_id).name == "inner"
+            assert [span.name for _, span in tracker.open_spans()] == ["outer", "inner"]
+        assert tracker.current_span(thread_id).name == "outer"
+    assert tracker.current_span(thread_id) is None
+    assert not tracker.open_spans()
+
+
+def test_tracker_handles_out_of_order_ends():
+    tracker, tracer = _tracked_tracer()
+    outer = tracer.start_span("outer")
+    inner = tracer.start_span("inner")
+    outer.end()
+    assert tracker.current_span(threading.get_ident()).name == "inner"
+    inner.end()
+    assert not tracker.open_spans()
+
+
+def test_tracker_only_counts_the_running_task():
+    tracker, tracer = _tracked_tracer()
+    loop_thread = threading.get_ident()
+    seen = {}
+
+    async def suspended():
+        with tracer.start_as_current_span("suspended"):
+            await asyncio.sleep(0.05)
+
+    async def running():
+        await asyncio.sleep(0)
+        with tracer.start_as_current_span("running"):
+            seen["current"] = _from_other_thread(lambda: tracker.current_span(loop_thread).name)
+            seen["running"] = _from_other_thread(
+                lambda: [span.name for _, span in tracker.running_spans()]
+            )
+            seen["open"] = sorted(span.name for _, span in tracker.open_spans())
+
+    async def main():
+        await asyncio.gather(suspended(), running())
+
+    asyncio.run(main())
+    assert seen == {
+        "current": "running",
+        "running": ["running"],
+        "open": ["running", "suspended"],
+    }
+    assert not tracker.open_spans()
+
+
+def test_fold_stack_is_root_first():
+    def inner():
+        return fold_stack(sys._getframe())
+
+    folded = inner().split(";")
+    assert folded[-1].endswith(".inner")
+    assert folded[-2].endswith(".test_fold_stack_is_root_first")
+
+
+def test_sampler_aggregates_stacks_per_span_name():
+    tracker, tracer = _tracked_tracer()
+    sampler = StackSampler(tracker)
+    ready, done = threading.Event(), threading.Event()
+
+    def work():
+        with tracer.start_as_current_span("work"):
+            ready.set()
+            done.wait()
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    ready.wait()
+    try:
+        sampler.sample()
+        sampler.sample()
+    finally:
+        done.set()
+        thread.join()
+
+    (stacks,) = sampler._samples.values()
+    assert list(sampler._samples) == ["work"]
+    assert sum(stacks.values()) == 2
+    # sampled while waiting, under the frame it waits in
+    assert all(".work;threading." in stack for stack in stacks)
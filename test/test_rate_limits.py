@@ -0,0 +1,20 @@
+import pytest
+
+from iudex.openai.shared.rate_limits import _parse_header_value
+
+
+@pytest.mark.parametrize(
+    "header, value, expected",
+    [
+        ("x-ratelimit-limit-requests", "500", 500),
+        ("x-ratelimit-remaining-tokens", "29000", 29000),
+        ("x-ratelimit-remaining-requests", "n/a", None),
+        ("x-ratelimit-reset-requests", "120ms", 0.12),
+        ("x-ratelimit-reset-requests", "1.5s", 1.5),
+        ("x-ratelimit-reset-tokens", "6m0s", 360.0),
+        ("x-ratelimit-reset-tokens", "1h2m3s", 3723.0),
+        ("x-ratelimit-reset-tokens", "soon", None),
+    ],
+)
+def test_parse_header_value(header, value, expected):
+    assert _parse_header_value(header, value) == pytest.approx(expected)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+
+from iudex.profiling import ActiveSpanTracker, SlowSpanWatchdog
+
+
+def _tracked_tracer():
+    tracker = ActiveSpanTracker()
+    provider = TracerProvider()
+    provider.add_span_processor(tracker)
+    return tracker, provider.get_tracer(__name__)
+
+
+def _run_in_span(tracer, name, until: threading.Event, started: threading.Event):
+    def slow_work():
+        with tracer.start_as_current_span(name) as span:
+            started.set()
+            until.wait()
+            spans.append(span)
+
+    spans = []
+    thread = threading.Thread(target=slow_work)
+    thread.start()
+    started.wait()
+    return thread, spans
+
+
+def test_slow_spans_get_stack_snapshots():
+    tracker, tracer = _tracked_tracer()
+    watchdog = SlowSpanWatchdog(tracker, threshold=0.01, max_snapshots=2)
+    done = threading.Event()
+    thread, spans = _run_in_span(tracer, "slow", done, threading.Event())
+    time.sleep(0.02)
+    for _ in range(3):
+        watchdog.check()
+    done.set()
+    thread.join()
+
+    (span,) = spans
+    events = [event for event in span.events if event.name == "iudex.slow_span.stack"]
+    assert [event.attributes["iudex.slow_span.snapshot"] for event in events] == [1, 2]
+    assert "slow_work" in events[0].attributes["code.stacktrace"]
+    assert events[0].attributes["iudex.slow_span.elapsed_ms"] >= 10
+
+
+def test_fast_spans_are_left_alone():
+    tracker, tracer = _tracked_tracer()
+    watchdog = SlowSpanWatchdog(tracker, threshold=60)
+    done = threading.Event()
+    thread, spans = _run_in_span(tracer, "fast", done, threading.Event())
+    watchdog.check()
+    done.set()
+    thread.join()
+
+    assert not spans[0].events
+
+
+def test_snapshot_counts_are_dropped_once_spans_end():
+    tracker, tracer = _tracked_tracer()
+    watchdog = SlowSpanWatchdog(tracker, threshold=0)
+    done = threading.Event()
+    thread, _ = _run_in_span(tracer, "slow", done, threading.Event())
+    watchdog.check()
+    assert len(watchdog._snapshots) == 1
+    done.set()
+    thread.join()
+    watchdog.check()
+    assert not watchdog._snapshots
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from iudex.profiling import CpuTimeSpanProcessor
+
+
+def _tracer():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(CpuTimeSpanProcessor())
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return provider.get_tracer(__name__), exporter
+
+
+def test_compute_and_io_bound_spans():
+    tracer, exporter = _tracer()
+    with tracer.start_as_current_span("compute"):
+        deadline = time.thread_time() + 0.05
+        while time.thread_time() < deadline:
+            pass
+    with tracer.start_as_current_span("io"):
+        time.sleep(0.05)
+
+    compute, io = exporter.get_finished_spans()
+    assert compute.attributes["iudex.span.cpu_time_ms"] >= 50
+    assert compute.attributes["iudex.span.cpu_ratio"] > 0.5
+    assert io.attributes["iudex.span.cpu_ratio"] < 0.5
+
+
+def test_wrapper_is_removed_once_the_span_ends():
+    tracer, _ = _tracer()
+    span = tracer.start_span("once")
+    assert "end" in vars(span)
+    span.end()
+    assert "end" not in vars(span)
+
+
+def test_spans_ended_on_another_thread_are_skipped():
+    tracer, exporter = _tracer()
+    span = tracer.start_span("handoff")
+    thread = threading.Thread(target=span.end)
+    thread.start()
+    thread.join()
+
+    (finished,) = exporter.get_finished_spans()
+    assert "iudex.span.cpu_time_ms" not in finished.attributes
+
+
+def test_spans_with_an_explicit_end_time_are_skipped():
+    tracer, exporter = _tracer()
+    tracer.start_span("after the fact").end(end_time=time.time_ns())
+
+    (finished,) = exporter.get_finished_spans()
+    assert "iudex.span.cpu_time_ms" not in finished.attributes
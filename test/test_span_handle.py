@@ -0,0 +1,85 @@
+import importlib
+import threading
+import time
+
+import pytest
+from opentelemetry import trace as otel_trace
+
+from iudex.trace import SpanHandle, end_trace, start_trace
+
+trace_module = importlib.import_module("iudex.trace")
+
+
+def _current_name():
+    return getattr(otel_trace.get_current_span(), "name", None)
+
+
+def test_handle_ends_exactly_its_span(spans):
+    outer = start_trace("outer")
+    inner = start_trace("inner")
+    # ending the outer handle first must not end or drop the inner span
+    assert end_trace(outer) is outer.span
+    assert _current_name() == "inner"
+    assert [span.name for span in spans.get_finished_spans()] == ["outer"]
+
+    inner.end()
+    # the outer context is detached once the inner span ends too
+    assert otel_trace.get_current_span() is otel_trace.INVALID_SPAN
+    assert [span.name for span in spans.get_finished_spans()] == ["outer", "inner"]
+
+
+def test_ending_twice_is_a_no_op(spans):
+    handle = start_trace("once")
+    handle.end()
+    handle.end()
+    assert handle.ended
+    assert len(spans.get_finished_spans()) == 1
+
+
+def test_context_manager_records_errors(spans):
+    with pytest.raises(ValueError):
+        with start_trace("job", attributes={"job.id": 1}):
+            raise ValueError("bad input")
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["job.id"] == 1
+    assert span.status.status_code == otel_trace.StatusCode.ERROR
+
+
+def test_ending_from_another_thread_only_ends_the_span(spans):
+    handles = []
+    # started in its own thread, whose context keeps the span current
+    thread = threading.Thread(target=lambda: handles.append(start_trace("cross-thread")))
+    thread.start()
+    thread.join()
+    handles[0].end()
+    assert handles[0].ended
+    assert len(spans.get_finished_spans()) == 1
+
+
+def test_make_current_false(spans):
+    handle = start_trace("background", make_current=False)
+    assert otel_trace.get_current_span() is otel_trace.INVALID_SPAN
+    handle.end()
+    assert len(spans.get_finished_spans()) == 1
+
+
+def test_leak_detector_marks_open_spans(spans, monkeypatch, caplog):
+    monkeypatch.setattr(trace_module, "_leak_detector", None)
+    monkeypatch.setattr(trace_module, "_open_handles", {})
+    trace_module.enable_span_leak_detector(timeout=0.01, interval=0.01)
+
+    handle = start_trace("leaky", make_current=False)
+    deadline = time.monotonic() + 2
+    while trace_module._open_handles and time.monotonic() < deadline:
+        time.sleep(0.01)
+    handle.end()
+
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["iudex.span.leaked"] is True
+    assert "'leaky' was not ended" in caplog.text
+
+
+def test_repr():
+    handle = SpanHandle(otel_trace.INVALID_SPAN, None)
+    handle.end()
+    assert repr(handle) == "<SpanHandle None ended>"
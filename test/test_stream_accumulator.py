@@ -0,0 +1,126 @@
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
+from openai.types.completion import Completion
+from openai.types.completion_choice import CompletionChoice
+
+from iudex.openai.shared.stream_accumulator import StreamAccumulator
+
+
+def _chat_chunk(index=0, content=None, role=None, finish_reason=None, tool_call=None, usage=None):
+    delta = {}
+    if content is not None:
+        delta["content"] = content
+    if role is not None:
+        delta["role"] = role
+    if tool_call is not None:
+        delta["tool_calls"] = [{"index": 0, "function": tool_call}]
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "gpt-4o",
+        "system_fingerprint": "fp_1",
+        "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+
+
+CHAT_CHUNKS = [
+    _chat_chunk(role="assistant", content=""),
+    _chat_chunk(content="Hello"),
+    _chat_chunk(index=1, role="assistant", tool_call={"name": "get_", "arguments": '{"ci'}),
+    _chat_chunk(content=", world"),
+    _chat_chunk(index=1, tool_call={"name": "weather", "arguments": 'ty": "Oslo"}'}),
+    _chat_chunk(finish_reason="stop"),
+    _chat_chunk(index=1, finish_reason="tool_calls"),
+    {
+        "id": "chatcmpl-1",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12},
+    },
+]
+
+EXPECTED_CHAT_RESPONSE = {
+    "model": "gpt-4o",
+    "system_fingerprint": "fp_1",
+    "usage": {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12},
+    "choices": [
+        {
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "Hello, world"},
+        },
+        {
+            "index": 1,
+            "finish_reason": "tool_calls",
+            "message": {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [
+                    {"function": {"name": "get_weather", "arguments": '{"city": "Oslo"}'}}
+                ],
+            },
+        },
+    ],
+}
+
+
+def _without_usage_details(response):
+    # newer SDKs add optional token details to the usage of v1 chunks
+    usage = response.get("usage")
+    if usage:
+        response["usage"] = {k: v for k, v in usage.items() if v is not None}
+    return response
+
+
+def test_to_response_from_v1_chat_chunks():
+    accumulator = StreamAccumulator(chat=True)
+    accumulator.add = accumulator._add_model
+    for chunk in CHAT_CHUNKS:
+        accumulator.add(ChatCompletionChunk.model_validate(chunk))
+
+    assert _without_usage_details(accumulator.to_response()) == EXPECTED_CHAT_RESPONSE
+    assert accumulator.chunk_count == len(CHAT_CHUNKS)
+
+
+def test_to_response_from_v0_chat_chunks():
+    accumulator = StreamAccumulator(chat=True)
+    accumulator.add = accumulator._add_dict
+    for chunk in CHAT_CHUNKS:
+        accumulator.add(chunk)
+
+    assert accumulator.to_response() == EXPECTED_CHAT_RESPONSE
+
+
+def test_to_response_from_completion_chunks():
+    accumulator = StreamAccumulator(chat=False)
+    accumulator.add = accumulator._add_model
+    for text, finish_reason in (("Once", None), (" upon", None), (" a time", "length")):
+        # streamed chunks aren't validated by the SDK, their finish_reason is None until the last
+        choice = CompletionChoice.model_construct(
+            index=0, text=text, finish_reason=finish_reason, logprobs=None
+        )
+        accumulator.add(
+            Completion.model_construct(
+                id="cmpl-1",
+                object="text_completion",
+                created=0,
+                model="gpt-3.5-turbo-instruct",
+                choices=[choice],
+            )
+        )
+
+    assert accumulator.to_response() == {
+        "model": "gpt-3.5-turbo-instruct",
+        "choices": [{"index": 0, "finish_reason": "length", "text": "Once upon a time"}],
+    }
+
+
+def test_to_response_skips_invalid_choice_index():
+    accumulator = StreamAccumulator(chat=True)
+    accumulator.add = accumulator._add_dict
+    accumulator.add(_chat_chunk(index=10_000, content="dropped"))
+
+    assert accumulator.to_response()["choices"] == []
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from iudex.summarizers import (
+    MAX_SUMMARY_ITEMS,
+    bounded,
+    register_summarizer,
+    summarize,
+    to_attribute_value,
+)
+from iudex import summarizers
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(summarizers, "_type_summarizers", dict(summarizers._type_summarizers))
+    monkeypatch.setattr(summarizers, "_name_summarizers", dict(summarizers._name_summarizers))
+    monkeypatch.setattr(summarizers, "_resolved", {})
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+
+class Point3D(Point):
+    pass
+
+
+def test_subclasses_use_the_closest_registered_base(registry):
+    register_summarizer(Point, lambda p: f"Point({p.x}, {p.y})")
+    assert summarize(Point3D(1, 2)) == "Point(1, 2)"
+
+
+def test_summarizers_can_be_registered_by_name(registry):
+    register_summarizer(f"{__name__}.Point", lambda p: "named")
+    assert summarize(Point(1, 2)) == "named"
+
+
+def test_failing_summarizer_falls_back_to_type_name(registry):
+    register_summarizer(Point, lambda p: 1 / 0)
+    assert summarize(Point(1, 2)) == "<Point>"
+
+
+def test_small_bytes_are_kept_and_large_bytes_digested():
+    assert summarize(b"abc") == b"abc"
+    assert summarize(b"x" * 2048).startswith("bytes(len=2048, blake2b=")
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"a": 1, "b": [1, {"c": "x"}]},
+        {1: None},
+        [{"a": 1}, {"b": 2}],
+        {1, 2},
+        (1, (2, 3)),
+    ],
+)
+def test_containers_keep_the_str_format_within_limits(value):
+    assert to_attribute_value(value) == str(value)
+
+
+def test_large_containers_are_cut_off():
+    value = to_attribute_value({i: i for i in range(100_000)})
+    assert value.startswith("{0: 0, 1: 1")
+    assert value.endswith(", ...}")
+    assert value.count(":") == MAX_SUMMARY_ITEMS
+
+
+def test_scalar_sequences_are_left_for_the_attribute_cleaner():
+    assert to_attribute_value([1, 2, 3]) == [1, 2, 3]
+
+
+def test_summarizer_containers_become_bounded_json(registry):
+    register_summarizer(Point, lambda p: {"x": p.x, "y": p.y})
+    assert json.loads(to_attribute_value(Point(1, 2))) == {"x": 1, "y": 2}
+
+
+def test_bounded():
+    result = bounded({"list": list(range(MAX_SUMMARY_ITEMS + 5)), "deep": [[[["x"]]]]})
+    assert result["list"][-1] == "... 5 more"
+    assert result["deep"] == [["<list>"]]
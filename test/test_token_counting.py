@@ -0,0 +1,185 @@
+import os
+import sys
+import threading
+import types
+
+import pytest
+from opentelemetry import trace as otel_trace
+from opentelemetry.semconv.ai import SpanAttributes
+
+from iudex.openai.shared import token_counting
+from iudex.openai.shared.completion_wrappers import _set_token_usage
+from iudex.openai.shared.config import Config
+from iudex.openai.shared.token_counting import (
+    TOKENS_PER_MESSAGE,
+    TOKENS_PER_NAME,
+    TOKENS_PER_REPLY,
+    TokenCountCache,
+    TokenCountingWorker,
+    encoding_name_for_model,
+    estimate_token_count_from_string,
+    finish_with_token_count,
+    get_prompt_token_count,
+    get_token_count_cache,
+    preload_encodings,
+)
+
+
+def test_token_count_cache_keys_by_namespace_and_text():
+    key = TokenCountCache.key("cl100k_base", "hello")
+
+    assert key == TokenCountCache.key("cl100k_base", "hello")
+    assert key != TokenCountCache.key("o200k_base", "hello")
+    assert key != TokenCountCache.key("cl100k_base", "hello!")
+    # the text itself isn't retained
+    assert "hello" not in repr(key)
+
+
+def test_token_count_cache_evicts_least_recently_used():
+    cache = TokenCountCache(maxsize=2)
+    a, b, c = (TokenCountCache.key("enc", text) for text in "abc")
+    cache.put(a, 1)
+    cache.put(b, 2)
+    # reading a makes b the least recently used
+    assert cache.get(a) == 1
+    cache.put(c, 3)
+
+    assert cache.get(b) is None
+    assert cache.get(a) == 1
+    assert cache.get(c) == 3
+
+
+def test_token_count_cache_clear():
+    cache = TokenCountCache()
+    key = TokenCountCache.key("enc", "text")
+    cache.put(key, 5)
+    cache.clear()
+
+    assert cache.get(key) is None
+
+
+@pytest.fixture
+def enrich_token_usage(monkeypatch):
+    monkeypatch.setattr(Config, "enrich_token_usage", True)
+
+
+def test_worker_counts_inline_when_busy(enrich_token_usage, monkeypatch):
+    monkeypatch.setattr(Config, "token_count_max_pending", 0)
+    monkeypatch.setattr(Config, "approximate_token_count_when_busy", True)
+    worker = TokenCountingWorker()
+    calls = []
+
+    worker.submit(lambda count_tokens: calls.append((threading.get_ident(), count_tokens)))
+
+    assert calls == [(threading.get_ident(), estimate_token_count_from_string)]
+
+
+def test_worker_runs_finish_on_its_thread(enrich_token_usage):
+    worker = TokenCountingWorker()
+    done = threading.Event()
+    threads = []
+
+    def finish(count_tokens):
+        threads.append(threading.current_thread().name)
+        done.set()
+
+    worker.submit(finish)
+    assert done.wait(5)
+    assert threads[0].startswith("iudex-token-count")
+
+
+def test_finish_runs_inline_when_usage_was_reported(enrich_token_usage):
+    calls = []
+    finish_with_token_count(lambda count_tokens: calls.append(threading.get_ident()), False)
+    assert calls == [threading.get_ident()]
+
+
+def test_estimate_token_count_from_string(enrich_token_usage):
+    assert estimate_token_count_from_string("12345678", "gpt-4") == 2
+    assert estimate_token_count_from_string("123456789", "gpt-4") == 3
+
+
+def test_streamed_completion_prefers_reported_usage(enrich_token_usage, spans):
+    def count_tokens(text, model):
+        raise AssertionError("tokenized despite reported usage")
+
+    span = otel_trace.get_tracer(__name__).start_span("completion")
+    _set_token_usage(
+        span,
+        {"model": "gpt-3.5-turbo-instruct", "prompt": "Say hi"},
+        {
+            "model": "gpt-3.5-turbo-instruct",
+            "choices": [{"text": "hi"}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+        },
+        count_tokens,
+    )
+    span.end()
+
+    assert span.attributes[SpanAttributes.LLM_USAGE_PROMPT_TOKENS] == 3
+    assert span.attributes[SpanAttributes.LLM_USAGE_COMPLETION_TOKENS] == 1
+
+
+def test_cache_follows_configured_size(monkeypatch):
+    monkeypatch.setattr(Config, "token_count_cache_size", 2)
+    assert get_token_count_cache().maxsize == 2
+    monkeypatch.setattr(Config, "token_count_cache_size", 3)
+    assert get_token_count_cache().maxsize == 3
+    assert get_token_count_cache() is get_token_count_cache()
+
+
+def test_prompt_counted_per_message_with_formatting_overhead(enrich_token_usage):
+    def count_tokens(text, model):
+        return len(text.split())
+
+    messages = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "name": "ada", "content": [{"type": "text", "text": "hi there"}, {"type": "image_url"}]},
+    ]
+    system = TOKENS_PER_MESSAGE + 1 + 2
+    user = TOKENS_PER_MESSAGE + 1 + 2 + 1 + TOKENS_PER_NAME
+    assert get_prompt_token_count(messages, "gpt-4", count_tokens) == TOKENS_PER_REPLY + system + user
+
+
+def test_prompt_count_is_none_when_any_message_fails(enrich_token_usage):
+    messages = [{"role": "user", "content": "hi"}]
+    assert get_prompt_token_count(messages, "gpt-4", lambda text, model: None) is None
+
+
+def test_earlier_messages_come_from_the_cache(enrich_token_usage, monkeypatch):
+    encoded = []
+
+    def encode_count(string, encoding_name):
+        encoded.append(string)
+        return len(string)
+
+    monkeypatch.setattr(token_counting, "_encode_count", encode_count)
+    monkeypatch.setattr(token_counting, "encoding_name_for_model", lambda model: "test_base")
+    monkeypatch.setattr(Config, "token_count_cache_size", 16)
+    get_token_count_cache().clear()
+
+    history = [{"role": "user", "content": "first turn"}]
+    get_prompt_token_count(history, "gpt-4")
+    encoded.clear()
+    get_prompt_token_count(history + [{"role": "user", "content": "second turn"}], "gpt-4")
+
+    assert encoded == ["user", "second turn"]
+
+
+def test_encoding_name_without_encoding_name_for_model(monkeypatch):
+    fake_tiktoken = types.ModuleType("tiktoken")
+    fake_tiktoken.encoding_for_model = lambda model: types.SimpleNamespace(name=f"{model}_base")
+    monkeypatch.setitem(sys.modules, "tiktoken", fake_tiktoken)
+    monkeypatch.setattr(token_counting, "_model_encoding_names", {})
+
+    assert encoding_name_for_model("old-model") == "old-model_base"
+
+
+def test_preload_keeps_an_existing_tiktoken_cache_dir(monkeypatch):
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", "/already/set")
+    preload_encodings((), tiktoken_dir="/from/config").join()
+    assert os.environ["TIKTOKEN_CACHE_DIR"] == "/already/set"
+
+    monkeypatch.delenv("TIKTOKEN_CACHE_DIR")
+    preload_encodings((), tiktoken_dir="/from/config").join()
+    assert os.environ["TIKTOKEN_CACHE_DIR"] == "/from/config"
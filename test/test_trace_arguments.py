@@ -0,0 +1,62 @@
+from opentelemetry import context
+from opentelemetry import trace as otel_trace
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+from iudex.trace import MAX_TRACED_ARG_LENGTH, MAX_TRACED_ARGS, _capped, trace
+
+
+def test_capped_strings_and_bytes():
+    assert _capped("short") == "short"
+    long_string = _capped("x" * (MAX_TRACED_ARG_LENGTH + 10))
+    assert long_string == "x" * MAX_TRACED_ARG_LENGTH + "..."
+    assert _capped(b"y" * (MAX_TRACED_ARG_LENGTH + 1)).startswith(f"bytes(len={MAX_TRACED_ARG_LENGTH + 1}")
+
+
+def test_capped_sequences():
+    assert _capped(list(range(MAX_TRACED_ARGS * 2))) == list(range(MAX_TRACED_ARGS))
+
+
+def test_capped_large_dict_is_bounded():
+    value = _capped({f"key{i}": "v" * 100 for i in range(100_000)})
+    assert isinstance(value, str)
+    assert len(value) <= MAX_TRACED_ARG_LENGTH + 3
+
+
+def test_arguments_are_recorded(spans):
+    @trace
+    def add(a, b, *, label):
+        return a + b
+
+    assert add(1, 2, label="sum") == 3
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["args"] == (1, 2)
+    assert span.attributes["label"] == "sum"
+
+
+def test_mixed_arguments_are_stringified(spans):
+    @trace
+    def pair(a, b):
+        pass
+
+    pair(1, "two")
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["args"] == ("1", "two")
+
+
+def test_non_recording_spans_skip_argument_capture(spans):
+    def get_attributes(instance):
+        raise AssertionError("argument capture ran for a non-recording span")
+
+    @trace(get_attributes=get_attributes)
+    def work(payload):
+        return len(payload)
+
+    unsampled_parent = NonRecordingSpan(
+        SpanContext(trace_id=1, span_id=1, is_remote=False, trace_flags=TraceFlags(0))
+    )
+    token = context.attach(otel_trace.set_span_in_context(unsampled_parent))
+    try:
+        assert work({"rows": list(range(1000))}) == 1
+    finally:
+        context.detach(token)
+    assert not spans.get_finished_spans()
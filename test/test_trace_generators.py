@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from opentelemetry import trace as otel_trace
+
+from iudex.trace import start_trace, trace
+
+
+@trace
+async def fetch(x):
+    await asyncio.sleep(0)
+    return otel_trace.get_current_span().name, x
+
+
+@trace
+def numbers(n):
+    for i in range(n):
+        # the generator's span is current only while its body runs
+        yield otel_trace.get_current_span().name, i
+
+
+@trace
+async def async_numbers(n):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield i
+
+
+@trace
+def failing():
+    yield 1
+    raise ValueError("boom")
+
+
+def test_coroutine_is_awaited_inside_its_span(spans):
+    assert asyncio.run(fetch(1)) == ("fetch", 1)
+    (span,) = spans.get_finished_spans()
+    assert span.name == "fetch"
+    assert span.attributes["arg"] == 1
+
+
+def test_generator_span_stays_open_until_exhausted(spans):
+    gen = numbers(3)
+    assert next(gen) == ("numbers", 0)
+    # context doesn't leak to the consumer between yields
+    assert otel_trace.get_current_span() is otel_trace.INVALID_SPAN
+    assert not spans.get_finished_spans()
+
+    assert list(gen) == [("numbers", 1), ("numbers", 2)]
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["generator.yield_count"] == 3
+    assert span.attributes["generator.time_to_first_item_ms"] >= 0
+
+
+def test_closing_a_generator_ends_its_span(spans):
+    gen = numbers(10)
+    next(gen)
+    gen.close()
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["generator.yield_count"] == 1
+
+
+def test_generator_errors_are_recorded(spans):
+    with pytest.raises(ValueError):
+        list(failing())
+    (span,) = spans.get_finished_spans()
+    assert span.status.status_code == otel_trace.StatusCode.ERROR
+
+
+def test_async_generator(spans):
+    async def consume():
+        return [i async for i in async_numbers(3)]
+
+    assert asyncio.run(consume()) == [0, 1, 2]
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["generator.yield_count"] == 3
+
+
+def test_start_trace_parent_is_the_current_span(spans):
+    with start_trace("outer") as outer:
+        with start_trace("inner"):
+            pass
+    inner_span, outer_span = spans.get_finished_spans()
+    assert inner_span.parent.span_id == outer.span.get_span_context().span_id
+    assert outer_span.parent is None
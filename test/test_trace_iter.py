@@ -0,0 +1,56 @@
+import time
+
+import pytest
+from opentelemetry import trace as otel_trace
+
+from iudex.trace import trace_iter
+
+
+def test_loop_is_one_span(spans):
+    items = []
+    for item in trace_iter(range(10), name="rows", attributes={"table": "users"}):
+        # the loop span is never current in the body
+        assert otel_trace.get_current_span() is otel_trace.INVALID_SPAN
+        items.append(item)
+
+    assert items == list(range(10))
+    (span,) = spans.get_finished_spans()
+    assert span.name == "rows"
+    assert span.attributes["table"] == "users"
+    assert span.attributes["iteration.item_duration.count"] == 10
+    assert span.attributes["iteration.items_per_second"] > 0
+
+
+def test_slowest_items_become_events(spans):
+    for item in trace_iter(range(6), slowest=2):
+        if item in (1, 4):
+            time.sleep(0.01)
+
+    (span,) = spans.get_finished_spans()
+    events = [event for event in span.events if event.name == "iteration.slow_item"]
+    assert sorted(event.attributes["iteration.index"] for event in events) == [1, 4]
+    assert events[0].attributes["iteration.item_duration"] >= events[1].attributes["iteration.item_duration"]
+    assert all(span.start_time <= event.timestamp <= span.end_time for event in events)
+
+
+def test_breaking_out_ends_the_span(spans):
+    loop = trace_iter(range(100))
+    for item in loop:
+        if item == 3:
+            break
+    loop.close()
+
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["iteration.item_duration.count"] == 3
+
+
+def test_errors_from_the_iterable_are_recorded(spans):
+    def rows():
+        yield 1
+        raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError):
+        list(trace_iter(rows()))
+
+    (span,) = spans.get_finished_spans()
+    assert span.status.status_code == otel_trace.StatusCode.ERROR
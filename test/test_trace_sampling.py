@@ -0,0 +1,93 @@
+import importlib
+import time
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from iudex.trace import trace
+
+# `iudex.trace` the attribute is the decorator, not the module
+trace_module = importlib.import_module("iudex.trace")
+
+
+@pytest.fixture
+def never_sampled(monkeypatch):
+    # random.random() >= sample_rate means sampled out
+    monkeypatch.setattr(trace_module.random, "random", lambda: 0.99)
+
+
+def test_sampled_out_calls_create_no_span(spans, never_sampled):
+    @trace(sample_rate=0.5)
+    def fast():
+        return 1
+
+    assert fast() == 1
+    assert not spans.get_finished_spans()
+
+
+def test_sampled_in_spans_carry_the_sample_rate(spans, monkeypatch):
+    monkeypatch.setattr(trace_module.random, "random", lambda: 0.1)
+
+    @trace(sample_rate=0.5)
+    def fast():
+        return 1
+
+    fast()
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["iudex.sample_rate"] == 0.5
+
+
+def test_sampled_out_errors_still_get_a_span(spans, never_sampled):
+    @trace(sample_rate=0.5)
+    def broken(x):
+        raise KeyError(x)
+
+    with pytest.raises(KeyError):
+        broken("missing")
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["iudex.sampled_by"] == "error"
+    assert span.attributes["arg"] == "missing"
+    assert span.events[0].name == "exception"
+
+
+def test_sampled_out_slow_calls_still_get_a_span(spans, never_sampled):
+    @trace(sample_rate=0.5, slow_threshold=0.01)
+    def slow():
+        time.sleep(0.02)
+
+    slow()
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["iudex.sampled_by"] == "slow_threshold"
+    assert (span.end_time - span.start_time) / 1e9 >= 0.02
+
+
+def test_metrics_count_every_call(spans, never_sampled, monkeypatch):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter(__name__)
+    monkeypatch.setattr(
+        trace_module, "_function_duration_histogram", meter.create_histogram("iudex.function.duration")
+    )
+    monkeypatch.setattr(
+        trace_module, "_function_error_counter", meter.create_counter("iudex.function.errors")
+    )
+
+    @trace(sample_rate=0.5, metrics=True)
+    def maybe_fail(fail):
+        if fail:
+            raise ValueError()
+
+    maybe_fail(False)
+    with pytest.raises(ValueError):
+        maybe_fail(True)
+
+    metrics = {
+        metric.name: metric.data.data_points
+        for metric in reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    }
+    (duration,) = metrics["iudex.function.duration"]
+    assert duration.count == 2
+    assert duration.attributes["code.function"] == "maybe_fail"
+    (errors,) = metrics["iudex.function.errors"]
+    assert errors.value == 1
+    assert errors.attributes["error.type"] == "ValueError"
@@ -0,0 +1,71 @@
+import asyncio
+
+from opentelemetry import trace as otel_trace
+from opentelemetry.sdk.trace import TracerProvider
+
+from iudex.asgi import WebSocketSessionMiddleware
+
+
+def _run_session(middleware, incoming):
+    incoming = list(incoming)
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        pass
+
+    asyncio.run(middleware({"type": "websocket"}, receive, send))
+
+
+async def _echo_app(scope, receive, send):
+    await send({"type": "websocket.accept"})
+    while True:
+        message = await receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if message["type"] == "websocket.receive":
+            await send({"type": "websocket.send", "text": message["text"] * 2})
+
+
+def test_session_is_aggregated_onto_the_server_span():
+    span = TracerProvider().get_tracer(__name__).start_span("websocket")
+    with otel_trace.use_span(span, end_on_exit=True):
+        _run_session(
+            WebSocketSessionMiddleware(_echo_app, snapshot_interval=0),
+            [
+                {"type": "websocket.connect"},
+                {"type": "websocket.receive", "text": "hi"},
+                {"type": "websocket.receive", "text": "there"},
+                {"type": "websocket.disconnect", "code": 1000},
+            ],
+        )
+
+    attributes = span.attributes
+    assert attributes["websocket.messages.received"] == 2
+    assert attributes["websocket.messages.sent"] == 2
+    assert attributes["websocket.bytes.received"] == 7
+    assert attributes["websocket.bytes.sent"] == 14
+    assert attributes["websocket.message.interval.count"] == 3
+    assert not span.events
+
+
+def test_snapshots_are_added_as_events():
+    span = TracerProvider().get_tracer(__name__).start_span("websocket")
+    with otel_trace.use_span(span, end_on_exit=True):
+        _run_session(
+            WebSocketSessionMiddleware(_echo_app, snapshot_interval=1e-9),
+            [{"type": "websocket.receive", "text": "a"}, {"type": "websocket.disconnect"}],
+        )
+
+    assert [event.name for event in span.events] == ["websocket.snapshot"] * 2
+
+
+def test_http_requests_pass_through():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["type"])
+
+    asyncio.run(WebSocketSessionMiddleware(app)({"type": "http"}, None, None))
+    assert calls == ["http"]
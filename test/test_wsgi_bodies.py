@@ -0,0 +1,71 @@
+import io
+import json
+from types import SimpleNamespace
+
+from opentelemetry.sdk.trace import TracerProvider
+
+from iudex import wsgi
+from iudex.wsgi import TeeInput, _capped_chunks, falcon_request_hook, falcon_response_hook
+
+
+def _span():
+    return TracerProvider().get_tracer(__name__).start_span("request")
+
+
+def test_tee_input_keeps_what_the_app_reads():
+    tee = TeeInput(io.BytesIO(b"line one\nline two\nrest"))
+    assert tee.readline() == b"line one\n"
+    assert tee.read(4) == b"line"
+    assert list(tee) == [b" two\n", b"rest"]
+    assert tee.captured == b"line one\nline two\nrest"
+
+
+def test_tee_input_caps_the_copy_not_the_read():
+    tee = TeeInput(io.BytesIO(b"x" * 100), max_bytes=10)
+    assert tee.read() == b"x" * 100
+    assert tee.captured == b"x" * 10
+
+
+def test_tee_input_proxies_other_attributes():
+    stream = io.BytesIO(b"abc")
+    tee = TeeInput(stream)
+    assert tee.seekable() is True
+
+
+def test_capped_chunks_stops_at_the_cap(monkeypatch):
+    monkeypatch.setattr(wsgi, "DEFAULT_MAX_BODY_BYTES", 5)
+
+    def chunks():
+        yield b"abc"
+        yield "def"
+        raise AssertionError("read past the cap")
+
+    assert _capped_chunks(chunks()) == b"abcde"
+
+
+def test_falcon_hooks_record_bodies():
+    span = _span()
+    req = SimpleNamespace(
+        stream=io.BytesIO(b'{"question": "hi"}'),
+        env={},
+        content_type="application/json",
+        content_length=18,
+    )
+    falcon_request_hook(span, req)
+    assert json.loads(req.stream.read()) == {"question": "hi"}
+
+    falcon_response_hook(span, req, SimpleNamespace(media={"answer": "hello"}))
+    span.end()
+
+    assert span.attributes["http.request.body.question"] == "hi"
+    assert span.attributes["http.response.body.answer"] == "hello"
+
+
+def test_falcon_hooks_skip_unread_request_body():
+    span = _span()
+    req = SimpleNamespace(stream=io.BytesIO(b"unread"), env={}, content_type="text/plain", content_length=6)
+    falcon_request_hook(span, req)
+    falcon_response_hook(span, req, SimpleNamespace(media=None, data=b"ok", text=None))
+    span.end()
+
+    assert "unread" not in json.dumps(dict(span.attributes))